@@ -0,0 +1,236 @@
+"""
+Batch transcription benchmark for Vecna's Whisper path
+Runs a directory of recorded commands (WAV) through WhisperRuntime.transcribe_pcm,
+the same in-memory path SpeechRecognizer.recognize uses, with one loaded model per
+worker process. Reports transcripts, per-file latency and, given a reference CSV
+with `file,text` columns, the word error rate - for every model size and compute
+type in one run:
+
+    python benchmark_asr.py recordings/ --models tiny,base,small --compute-types int8,float32 \\
+        --reference recordings/reference.csv --output asr.json --transcripts asr.csv
+
+--vocabulary app gives Whisper the same command-vocabulary prompt as the live
+assistant (this imports vecna, so it needs the desktop dependencies); --vocabulary
+none,app measures with and without it. The default, none, runs headless.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import wave
+import datetime
+import platform
+import argparse
+import multiprocessing
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from vecna_asr import WhisperRuntime, CommandVocabulary, word_errors, WHISPER_AVAILABLE
+from vecna_audio import pcm_to_float32, resample_float32, NUMPY_AVAILABLE
+from vecna_speech import latency_summary
+from vecna_storage import read_custom_commands
+
+# Set in each worker by load_worker(); one model per process
+_runtime = None
+
+
+def load_worker(config):
+    global _runtime
+    _runtime = WhisperRuntime(
+        config["model"],
+        compute_type=config["compute_type"],
+        cpu_threads=config["cpu_threads"],
+        beam_size=config["beam_size"],
+        best_of=config["best_of"],
+        language=config["language"]
+    )
+    _runtime.decode_options = dict(config["decode_options"])
+    _runtime.load()
+
+
+def app_decode_options():
+    """The initial prompt/hotwords the assistant binds to Whisper, per config.json.
+
+    Needs the assistant's command tables, so vecna is imported; the memory store
+    is only read (no Memory, so no locks, threads or migration).
+    """
+    from vecna import Config, CommandProcessor
+    if not Config.VOCAB_PROMPT:
+        return {}
+    custom = read_custom_commands(Config.MEMORY_BACKEND, Config.MEMORY_FILE, Config.MEMORY_DB_FILE)
+    phrases, prefixes = CommandProcessor(None, None, None, None)._collect_vocabulary()
+    vocabulary = CommandVocabulary(lambda: (phrases | set(custom), prefixes), hotwords=Config.VOCAB_HOTWORDS)
+    return vocabulary.decode_options()
+
+
+def read_wav(path):
+    """(pcm, sample_rate, sample_width, channels) of a WAV file"""
+    with wave.open(path, 'rb') as wav:
+        return wav.readframes(wav.getnframes()), wav.getframerate(), wav.getsampwidth(), wav.getnchannels()
+
+
+def transcribe_file(path):
+    """Transcribe one file in a worker; latency covers conversion, resampling and decoding"""
+    result = {"file": os.path.basename(path)}
+    if not _runtime.available:
+        result["error"] = f"model not loaded: {_runtime.error}"
+        return result
+    try:
+        pcm, rate, width, channels = read_wav(path)
+        start = time.perf_counter()
+        if channels == 1:
+            text, confidence = _runtime.transcribe_pcm_detailed(pcm, rate, width)
+        else:
+            # Recordings from other tools are often stereo; the live path is mono
+            samples = pcm_to_float32(pcm, width).reshape(-1, channels).mean(axis=1)
+            text, confidence = _runtime.transcribe_detailed(resample_float32(samples, rate))
+        result["latency_s"] = time.perf_counter() - start
+        result["audio_s"] = len(pcm) / float(rate * width * channels)
+        result["text"] = text.strip()
+        result["confidence"] = round(confidence, 3)
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def load_reference(path):
+    """file name -> reference text from a CSV with `file` and `text` columns"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return {os.path.basename(row["file"]): row["text"] for row in csv.DictReader(f)}
+
+
+def run_config(config, files, workers, reference):
+    """Transcribe every file with one (model, compute type) and summarize"""
+    label = f"{config['model']}/{config['compute_type']} (vocabulary: {config['vocabulary']})"
+    print(f"Transcribing {len(files)} files with {label} on {workers} workers...", file=sys.stderr)
+    context = multiprocessing.get_context("spawn")
+    start = time.perf_counter()
+    with context.Pool(workers, initializer=load_worker, initargs=(config,)) as pool:
+        files_out = pool.map(transcribe_file, files, chunksize=1)
+    wall = time.perf_counter() - start
+
+    done = [r for r in files_out if "error" not in r]
+    summary = dict(config, files=len(files), errors=len(files) - len(done), wall_s=round(wall, 2),
+                   latency=latency_summary([r["latency_s"] for r in done]))
+    audio = sum(r["audio_s"] for r in done)
+    if audio:
+        summary["real_time_factor"] = round(sum(r["latency_s"] for r in done) / audio, 4)
+    if reference:
+        edits = words = exact = scored = 0
+        for r in done:
+            if r["file"] not in reference:
+                continue
+            r["errors"], r["words"] = word_errors(reference[r["file"]], r["text"])
+            edits, words = edits + r["errors"], words + r["words"]
+            exact += r["errors"] == 0
+            scored += 1
+        if words:
+            summary["wer"] = round(edits / words, 4)
+            summary["exact_match"] = round(exact / scored, 4)
+    for r in files_out:
+        if "latency_s" in r:
+            r["latency_ms"] = round(r.pop("latency_s") * 1000, 1)
+            r["audio_s"] = round(r["audio_s"], 2)
+    return {"summary": summary, "files": files_out}
+
+
+def write_transcripts(path, results):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["model", "compute_type", "vocabulary", "file", "text", "confidence", "latency_ms",
+                         "errors", "words"])
+        for result in results:
+            summary = result["summary"]
+            for r in result["files"]:
+                writer.writerow([summary["model"], summary["compute_type"], summary["vocabulary"], r["file"],
+                                 r.get("text", ""), r.get("confidence", ""), r.get("latency_ms", ""),
+                                 r.get("errors", ""), r.get("words", "")])
+
+
+def print_table(results):
+    print(f"\n{'model':8s} {'compute':14s} {'vocab':5s} {'files':>5s} {'p50 ms':>9s} {'p99 ms':>9s} "
+          f"{'RTF':>7s} {'WER':>7s}", file=sys.stderr)
+    for result in results:
+        s = result["summary"]
+        wer = f"{s['wer']:.3f}" if "wer" in s else "-"
+        rtf = f"{s['real_time_factor']:.3f}" if "real_time_factor" in s else "-"
+        print(f"{s['model']:8s} {s['compute_type']:14s} {s['vocabulary']:5s} {s['files'] - s['errors']:5d} "
+              f"{s['latency']['p50_ms']:9.1f} {s['latency']['p99_ms']:9.1f} {rtf:>7s} {wer:>7s}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch-transcribe WAV files with Whisper')
+    parser.add_argument('directory', help='Directory of .wav files (searched recursively)')
+    parser.add_argument('--models', default='base', help='Comma-separated model sizes, e.g. tiny,base,small')
+    parser.add_argument('--compute-types', default='int8', help='Comma-separated compute types, e.g. int8,float32')
+    parser.add_argument('--reference', help='CSV with file,text columns for word error rate')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='Worker processes, each with its own model')
+    parser.add_argument('--cpu-threads', type=int, default=0,
+                        help='Threads per model (0 = CPU count divided by workers)')
+    parser.add_argument('--beam-size', type=int, default=5)
+    parser.add_argument('--best-of', type=int, default=5)
+    parser.add_argument('--language', default='en')
+    parser.add_argument('--vocabulary', default='none',
+                        help="Comma-separated decode modes: 'app' prompts Whisper with the assistant's "
+                             "command vocabulary as configured, 'none' (default) decodes without it")
+    parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+    parser.add_argument('--transcripts', help='Also write every transcript to this CSV')
+    args = parser.parse_args()
+
+    if not WHISPER_AVAILABLE or not NUMPY_AVAILABLE:
+        parser.error("faster-whisper and numpy are required (pip install faster-whisper)")
+    files = sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(args.directory)
+        for name in names if name.lower().endswith('.wav')
+    )
+    if not files:
+        parser.error(f"no .wav files in {args.directory}")
+    reference = load_reference(args.reference) if args.reference else {}
+    vocabularies = args.vocabulary.split(',')
+    if set(vocabularies) - {"app", "none"}:
+        parser.error("--vocabulary takes app, none or both")
+    decode_options = {"none": {}}
+    if "app" in vocabularies:
+        try:
+            decode_options["app"] = app_decode_options()
+        except Exception as e:
+            print(f"Warning: could not build the assistant's command vocabulary ({e}); measuring without it",
+                  file=sys.stderr)
+            vocabularies = list(dict.fromkeys("none" if v == "app" else v for v in vocabularies))
+    # Workers share the cores instead of each model grabbing all of them
+    cpu_threads = args.cpu_threads or max(1, (os.cpu_count() or 1) // args.workers)
+
+    results = []
+    for model in args.models.split(','):
+        for compute_type in args.compute_types.split(','):
+            for vocabulary in vocabularies:
+                config = {"model": model, "compute_type": compute_type, "cpu_threads": cpu_threads,
+                          "beam_size": args.beam_size, "best_of": args.best_of, "language": args.language,
+                          "vocabulary": vocabulary, "decode_options": decode_options[vocabulary]}
+                results.append(run_config(config, files, args.workers, reference))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args)
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.transcripts:
+        write_transcripts(args.transcripts, results)
+    print_table(results)
+
+
+if __name__ == "__main__":
+    main()
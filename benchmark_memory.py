@@ -0,0 +1,293 @@
+"""
+Benchmark suite for the Vecna memory subsystem
+Generates synthetic histories and times load, add_conversation, get_pending_reminders,
+history slicing and save. Results are printed (or written) as JSON so storage changes
+can be compared run over run:
+
+    python benchmark_memory.py --sizes 1000,10000,100000 --output before.json
+    python benchmark_memory.py --sizes 1000,10000,100000 --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import datetime
+import tempfile
+import argparse
+import multiprocessing
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from vecna_storage import create_memory_backend
+
+# vecna.Memory needs the full desktop stack (pyautogui, pyttsx3...); without it the
+# backends are driven directly through the same calls Memory makes
+try:
+    from vecna import Memory
+    MEMORY_AVAILABLE = True
+except Exception:
+    MEMORY_AVAILABLE = False
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+WORDS = (
+    "open close chrome volume search weather music play pause reminder tomorrow email "
+    "document folder screenshot brightness window notepad calculator news timer youtube"
+).split()
+
+
+class BackendTarget:
+    """Memory-shaped wrapper so a bare backend runs the same workload"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def add_conversation(self, user_input, assistant_response):
+        return self.backend.add_conversation({
+            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "user_input": user_input,
+            "assistant_response": assistant_response
+        })
+
+    def get_recent_conversations(self, limit=10):
+        return self.backend.recent_conversations(limit)
+
+    def add_reminder(self, text, time_str):
+        return self.backend.add_reminder({"text": text, "time": time_str, "completed": False})
+
+    def get_pending_reminders(self):
+        return self.backend.pop_due_reminders(time.time())
+
+    def add_preference(self, key, value):
+        self.backend.set_preference(key, value)
+
+    def search(self, query="", limit=20):
+        return self.backend.search(query, limit=limit)
+
+    def save_memory(self):
+        self.backend.flush()
+
+    def close(self):
+        self.backend.close()
+
+
+def open_memory(backend_kind, memory_file, max_conversations):
+    backend = create_memory_backend(backend_kind, memory_file, max_conversations=max_conversations)
+    if MEMORY_AVAILABLE:
+        return Memory(memory_file, backend=backend)
+    return BackendTarget(backend)
+
+
+def percentiles(samples):
+    """p50/p99/max/mean in milliseconds for a list of durations in seconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p * len(ordered))) - 1))] * 1000
+
+    return {
+        "count": len(ordered),
+        "p50_ms": round(rank(0.50), 4),
+        "p99_ms": round(rank(0.99), 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 4)
+    }
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bytes_written():
+    """Bytes this process has passed to write() so far (Linux), else None"""
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def peak_rss_mb():
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 2)
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 2)
+    except Exception:
+        return None
+
+
+def synthetic_turn(rng, i):
+    user = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 8)))
+    return f"{user} {i}", f"Done: {user}"
+
+
+def populate(memory, turns, reminders, rng):
+    for i in range(turns):
+        memory.add_conversation(*synthetic_turn(rng, i))
+    now = datetime.datetime.now()
+    for i in range(reminders):
+        # Spread over the next month so get_pending_reminders mostly finds nothing due
+        due = now + datetime.timedelta(seconds=rng.randint(3600, 30 * 86400))
+        memory.add_reminder(f"synthetic reminder {i}", due.isoformat())
+    memory.save_memory()
+
+
+def run_case(case):
+    """Benchmark one (backend, history size) case; runs in its own process for a clean peak RSS"""
+    kind, size = case["backend"], case["size"]
+    rng = random.Random(case["seed"])
+    workdir = tempfile.mkdtemp(prefix="vecna_bench_")
+    memory_file = os.path.join(workdir, "vecna_memory.json")
+    result = {"backend": kind, "turns": size, "reminders": case["reminders"],
+              "target": "Memory" if MEMORY_AVAILABLE else "backend"}
+    try:
+        start = time.perf_counter()
+        memory = open_memory(kind, memory_file, case["max_conversations"])
+        populate(memory, size, case["reminders"], rng)
+        memory.close()
+        result["populate_s"] = round(time.perf_counter() - start, 3)
+        result["disk_bytes"] = directory_size(workdir)
+
+        def load():
+            open_memory(kind, memory_file, case["max_conversations"]).close()
+        result["load"] = percentiles(timed(load, case["repeat"]))
+
+        memory = open_memory(kind, memory_file, case["max_conversations"])
+        result["get_recent_conversations_10"] = percentiles(
+            timed(lambda: memory.get_recent_conversations(10), case["ops"]))
+        result["get_recent_conversations_100"] = percentiles(
+            timed(lambda: memory.get_recent_conversations(100), case["ops"]))
+        result["get_pending_reminders"] = percentiles(
+            timed(memory.get_pending_reminders, case["ops"]))
+
+        turns = [synthetic_turn(rng, size + i) for i in range(case["ops"])]
+        before_io, before_disk = bytes_written(), directory_size(workdir)
+        samples = []
+        for user_input, response in turns:
+            start = time.perf_counter()
+            memory.add_conversation(user_input, response)
+            samples.append(time.perf_counter() - start)
+        memory.save_memory()
+        result["add_conversation"] = percentiles(samples)
+        after_io = bytes_written()
+        if before_io is not None and after_io is not None:
+            result["bytes_written_per_turn"] = round((after_io - before_io) / len(turns), 1)
+        else:
+            result["bytes_written_per_turn"] = round(
+                (directory_size(workdir) - before_disk) / len(turns), 1)
+
+        counter = iter(range(10 ** 9))
+
+        def save():
+            memory.add_preference("benchmark", next(counter))
+            memory.save_memory()
+        result["save"] = percentiles(timed(save, case["repeat"]))
+        result["search"] = percentiles(timed(lambda: memory.search("chrome volume", limit=20), case["repeat"]))
+        memory.close()
+        result["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def compare(current, baseline):
+    """Print p50/p99 ratios (current / baseline) for cases present in both runs"""
+    previous = {(r["backend"], r["turns"]): r for r in baseline.get("results", [])}
+    for result in current["results"]:
+        old = previous.get((result["backend"], result["turns"]))
+        if old is None:
+            continue
+        print(f"\n{result['backend']} @ {result['turns']} turns (current / baseline)")
+        for name, stats in result.items():
+            if isinstance(stats, dict) and isinstance(old.get(name), dict):
+                for key in ("p50_ms", "p99_ms"):
+                    if old[name].get(key):
+                        print(f"  {name:30s} {key}: {stats[key] / old[name][key]:6.2f}x")
+        for key in ("bytes_written_per_turn", "peak_rss_mb"):
+            if old.get(key) and result.get(key) is not None:
+                print(f"  {key:30s}       {result[key] / old[key]:6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Vecna memory subsystem')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='Comma-separated history sizes in turns (up to 1000000)')
+    parser.add_argument('--backends', default='json,sqlite', help='Comma-separated storage backends')
+    parser.add_argument('--reminders', type=int, default=2000, help='Pending reminders to generate')
+    parser.add_argument('--max-conversations', type=int, default=1000, help='Hot window size')
+    parser.add_argument('--ops', type=int, default=1000, help='Calls per timed operation')
+    parser.add_argument('--repeat', type=int, default=20, help='Repetitions for load/save/search')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+    parser.add_argument('--compare', help='Baseline JSON from an earlier run to compare against')
+    args = parser.parse_args()
+
+    cases = [
+        {"backend": kind, "size": int(size), "reminders": args.reminders,
+         "max_conversations": args.max_conversations, "ops": args.ops,
+         "repeat": args.repeat, "seed": args.seed}
+        for kind in args.backends.split(',')
+        for size in args.sizes.split(',')
+    ]
+    results = []
+    # One short-lived worker per case keeps peak RSS figures independent
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        print(f"Benchmarking {case['backend']} with {case['size']} turns...", file=sys.stderr)
+        with context.Pool(1) as pool:
+            results.append(pool.apply(run_case, (case,)))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args)
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""
+Test script for the Vecna Whisper runtime
+Runs without faster-whisper - a fake model stands in for WhisperModel
+"""
+
+import os
+import sys
+import time
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from array import array
+from vecna_asr import WhisperRuntime, StreamingTranscriber, RecognizerOrchestrator, RecognitionEngine, RecognitionError, CircuitBreaker, CommandVocabulary, Endpointer, word_errors, WAKE_WORD_DECODE
+from vecna_audio import AudioCapture, NUMPY_AVAILABLE
+
+
+class Segment:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeWhisperModel:
+    """Records constructor and transcribe arguments; answers with a fixed text"""
+
+    def __init__(self, model_name, load_time=0.0, **kwargs):
+        time.sleep(load_time)
+        self.model_name = model_name
+        self.kwargs = kwargs
+        self.calls = []
+
+    def transcribe(self, audio, **options):
+        self.calls.append((audio, options))
+        return iter([Segment(" open"), Segment(" chrome")]), None
+
+
+def test_background_load_and_warmup():
+    """The model loads off-thread with the configured runtime options, then warms up once"""
+    if not NUMPY_AVAILABLE:
+        print("- Background load skipped (numpy not installed)")
+        return
+    gate = threading.Event()
+
+    def factory(name, **kwargs):
+        gate.wait(2)
+        return FakeWhisperModel(name, **kwargs)
+
+    runtime = WhisperRuntime("small", compute_type="int8_float16", cpu_threads=4, num_workers=2,
+                             beam_size=2, best_of=3, model_factory=factory).start()
+    assert not runtime.ready.is_set() and not runtime.available
+    gate.set()
+    assert runtime.wait(2)
+    model = runtime.model
+    assert model.model_name == "small"
+    assert model.kwargs == {"device": "cpu", "compute_type": "int8_float16", "cpu_threads": 4, "num_workers": 2}
+    # Warm-up ran on one second of silence
+    audio, options = model.calls[0]
+    assert len(audio) == 16000 and not audio.any() and options["beam_size"] == 1
+    assert runtime.stats()["warmup_s"] is not None
+    print("✓ Background load and warm-up")
+
+
+def test_transcribe_pcm():
+    """PCM is transcribed in memory with the configured decoding options and timed"""
+    if not NUMPY_AVAILABLE:
+        print("- Transcribe PCM skipped (numpy not installed)")
+        return
+    runtime = WhisperRuntime("base", beam_size=3, best_of=2, warmup=False, model_factory=FakeWhisperModel)
+    assert runtime.load()
+    pcm = array('h', [1000, -1000] * 24000).tobytes()  # one second at 48 kHz
+    assert runtime.transcribe_pcm(pcm, 48000, 2) == " open  chrome"
+    audio, options = runtime.model.calls[-1]
+    assert len(audio) == 16000 and str(audio.dtype) == "float32"
+    assert options == {"beam_size": 3, "best_of": 2, "language": "en"}
+    timings = runtime.last_timings
+    assert timings["audio_ms"] == 1000.0
+    assert set(timings) == {"audio_ms", "convert_ms", "resample_ms", "transcribe_ms", "total_ms"}
+    print("✓ Transcribe PCM")
+
+
+def test_failed_load():
+    """A model that cannot load still releases waiters and reports unavailable"""
+    def broken(name, **kwargs):
+        raise RuntimeError("no model files")
+
+    runtime = WhisperRuntime("base", model_factory=broken).start()
+    assert not runtime.wait(2) and runtime.ready.is_set()
+    assert "no model files" in str(runtime.error)
+    print("✓ Failed load")
+
+
+class GrowingModel(FakeWhisperModel):
+    """Hears "open" for under 0.9 s of speech and "open chrome" after that"""
+
+    def transcribe(self, audio, **options):
+        self.calls.append((len(audio), options))
+        voiced = (abs(audio) > 0.05).sum() / 16000.0
+        return iter([Segment("Open chrome." if voiced >= 0.9 else "Open")]), None
+
+
+def speak_into(capture, voiced_frames, silent_frames, *more):
+    """Write speech then silence (more pairs of voiced/silent frame counts may follow)"""
+    def run():
+        time.sleep(0.05)
+        frame = lambda level: array('h', [level, -level] * 240).tobytes()
+        levels = [10] * 3
+        runs = (voiced_frames, silent_frames) + more
+        for voiced, silent in zip(runs[::2], runs[1::2]):
+            levels += [3000] * voiced + [10] * silent
+        for level in levels:
+            capture.write(frame(level))
+    writer = threading.Thread(target=run)
+    writer.start()
+    return writer
+
+
+def test_streaming_partials():
+    """Partials are emitted while speaking; a stable complete command ends the utterance early"""
+    if not NUMPY_AVAILABLE:
+        print("- Streaming partials skipped (numpy not installed)")
+        return
+    runtime = WhisperRuntime("base", warmup=False, model_factory=GrowingModel)
+    runtime.load()
+    capture = AudioCapture(calibration_ms=60, min_threshold=100).start()
+    streamer = StreamingTranscriber(runtime, capture, partial_interval_ms=600, min_confidence=0.5)
+
+    partials = []
+    writer = speak_into(capture, voiced_frames=40, silent_frames=40)
+    result = streamer.transcribe_stream(timeout=2, on_partial=partials.append,
+                                        accept=lambda text: text.lower().startswith("open chrome"))
+    writer.join()
+    assert [p.text for p in partials] == ["Open", "Open chrome.", "Open chrome."]
+    assert not partials[1].stable and partials[2].stable
+    assert result.final and result.early and result.text == "Open chrome."
+    # Ended at the short pause instead of the full pause_ms
+    assert result.audio_ms < 40 * 30 + streamer.pause_ms
+    assert all(options["beam_size"] == 1 for _, options in runtime.model.calls)
+
+    # Not a complete command: wait for the end and decode once more with the full beam
+    writer = speak_into(capture, voiced_frames=40, silent_frames=40)
+    result = streamer.transcribe_stream(timeout=2, accept=lambda text: False)
+    writer.join()
+    assert result.final and not result.early and result.text == "Open chrome."
+    assert runtime.model.calls[-1][1]["beam_size"] == 5
+    assert streamer.stats()["early_finals"] == 1 and streamer.stats()["utterances"] == 2
+    capture.stop()
+    print("✓ Streaming partials")
+
+
+class FakeEngine(RecognitionEngine):
+    """Answers after `delay` seconds, or raises RecognitionError while `down`"""
+
+    def __init__(self, name, text, confidence=0.9, delay=0.0, down=False):
+        self.name = name
+        self.text = text
+        self.confidence = confidence
+        self.delay = delay
+        self.down = down
+        self.calls = 0
+        self.cancelled = False
+        self.decode = None
+
+    def recognize(self, audio, cancel=None, decode=None):
+        self.calls += 1
+        self.decode = decode
+        if self.down:
+            raise RecognitionError("offline")
+        if cancel is not None and cancel.wait(self.delay):
+            self.cancelled = True
+        return self.text, self.confidence
+
+
+def test_orchestrator_fallback_and_breaker():
+    """Sequential mode falls back past a failing engine, which is then skipped until it recovers"""
+    google = FakeEngine("google", "open chrome", down=True)
+    whisper = FakeEngine("whisper", "open chrome")
+    orchestrator = RecognizerOrchestrator([google, whisper], failure_threshold=2, cooldown=0.05)
+    for _ in range(4):
+        assert orchestrator.recognize(b"audio") == ("open chrome", "whisper")
+    assert google.calls == 2  # skipped once the breaker opened
+    stats = orchestrator.stats()["engines"]["google"]
+    assert stats["breaker"] == "open" and stats["skipped"] == 2 and stats["trips"] == 1
+
+    # No probe: a single trial after the cool-down; success closes the breaker
+    google.down = False
+    time.sleep(0.06)
+    assert orchestrator.recognize(b"audio") == ("open chrome", "google")
+    assert orchestrator.breakers["google"].state == CircuitBreaker.CLOSED
+    assert orchestrator.recognize(b"audio", decode=WAKE_WORD_DECODE) == ("open chrome", "google")
+    assert google.decode == WAKE_WORD_DECODE
+
+    # A probe closes the breaker in the background without spending an utterance
+    healthy = threading.Event()
+    breaker = CircuitBreaker("google", failure_threshold=1, cooldown=0.02, probe=healthy.is_set)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.05)
+    assert not breaker.allow()
+    healthy.set()
+    deadline = time.time() + 1
+    while not breaker.allow() and time.time() < deadline:
+        time.sleep(0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+    print("✓ Orchestrator fallback and breaker")
+
+
+def test_orchestrator_race():
+    """Race mode takes the first confident result and cancels the slower engine"""
+    fast = FakeEngine("google", "volume up", confidence=0.9, delay=0.0)
+    slow = FakeEngine("whisper", "volume up", confidence=0.95, delay=2.0)
+    orchestrator = RecognizerOrchestrator([slow, fast], mode="race", min_confidence=0.5)
+    start = time.perf_counter()
+    assert orchestrator.recognize(b"audio") == ("volume up", "google")
+    assert time.perf_counter() - start < 1.0
+    deadline = time.time() + 1
+    while not slow.cancelled and time.time() < deadline:
+        time.sleep(0.01)
+    assert slow.cancelled
+
+    # Nobody confident enough: the most confident answer still wins
+    unsure = FakeEngine("google", "open crow", confidence=0.2)
+    surer = FakeEngine("whisper", "open chrome", confidence=0.4, delay=0.05)
+    orchestrator = RecognizerOrchestrator([unsure, surer], mode="race", min_confidence=0.5)
+    assert orchestrator.recognize(b"audio") == ("open chrome", "whisper")
+    assert orchestrator.stats()["engines"]["whisper"]["wins"] == 1
+    print("✓ Orchestrator race")
+
+
+def test_word_errors():
+    """Word error counts ignore case and punctuation"""
+    assert word_errors("Open Chrome.", "open chrome") == (0, 2)
+    assert word_errors("search for cats", "search cats now") == (2, 3)
+    assert word_errors("volume up", "") == (2, 2)
+    assert word_errors("", "hello") == (1, 0)
+    print("✓ Word errors")
+
+
+def test_command_vocabulary():
+    """Known commands prompt Whisper and near misses snap onto them; dictation is left alone"""
+    custom = ["good night"]
+    vocabulary = CommandVocabulary(lambda: (["take screenshot", "open chrome", "open word", "paste", "lock computer",
+                                             "what day is it"] + custom,
+                                            ["search for", "type", "open", "what day"]))
+    assert vocabulary.snap("open crome") == "open chrome"
+    assert vocabulary.snap("take screenshots") == "take screenshot"
+    assert vocabulary.snap("log computer") == "lock computer"
+    assert vocabulary.snap("serch for cats") == "search for cats"
+    assert vocabulary.snap("type pasta") == "type pasta"
+    assert vocabulary.snap("what is the capital of France?") == "what is the capital of France?"
+    # Ordinary speech that only resembles a command keeps every word it had
+    assert vocabulary.snap("what a time") == "what a time"
+    assert vocabulary.snap("open word pad") == "open word pad"
+    assert vocabulary.snap("what day is today") == "what day is today"
+    assert vocabulary.snap("take a screen shot") == "take a screen shot"
+    assert vocabulary.snap("good morning") == "good morning"
+    assert vocabulary.snap("open chrome", record=True) == "open chrome"
+    assert vocabulary.stats()["snapped"] == 4
+
+    runtime = WhisperRuntime(model_factory=FakeWhisperModel, warmup=False)
+    runtime.load()
+    vocabulary.bind(runtime)
+    assert "good night" in runtime.decode_options["initial_prompt"]
+    custom.append("movie time")
+    vocabulary.refresh()
+    assert vocabulary.snap("movie tame") == "movie time"
+    runtime.transcribe([0.0] * 16000)
+    assert "movie time" in runtime.model.calls[-1][1]["initial_prompt"]
+    # Wake-word listening decodes greedily and without the command prompt
+    runtime.transcribe([0.0] * 16000, **WAKE_WORD_DECODE)
+    options = runtime.model.calls[-1][1]
+    assert options["beam_size"] == 1 and "initial_prompt" not in options
+    runtime.transcribe([0.0] * 16000, initial_prompt="hey vecna", **WAKE_WORD_DECODE)
+    assert runtime.model.calls[-1][1]["initial_prompt"] == "hey vecna"
+    print("✓ Command vocabulary")
+
+
+def test_adaptive_endpointing():
+    """Dictation survives a pause that ends a command; complete commands end on a short pause"""
+    endpointer = Endpointer(pause_ms=600, short_pause_ms=300, long_pause_ms=1500, min_utterances=3)
+    saved = []
+    endpointer.on_update = saved.append
+    capture = AudioCapture(calibration_ms=60, min_threshold=100).start()
+
+    session = endpointer.begin()
+    session.update("type hello")  # as a streaming partial would
+    writer = speak_into(capture, 10, 30, 10, 60)  # 900 ms gap inside the dictation
+    pcm = capture.listen(timeout=2, phrase_time_limit=None, endpoint=session)
+    writer.join()
+    assert session.ending == "dictation" and session.gaps == [900]
+    assert len(pcm) // capture.frame_bytes >= 50  # both runs of speech
+    session.asr_started(at=session.speech_end + 0.1)
+    session.finish("type hello world")
+
+    session = endpointer.begin(is_complete=lambda text: text == "open chrome")
+    session.update("open chrome")
+    writer = speak_into(capture, 10, 40)
+    started = time.perf_counter()
+    capture.listen(timeout=2, phrase_time_limit=None, endpoint=session)
+    writer.join()
+    assert session.ending == "complete" and time.perf_counter() - started < 1.0
+    session.finish("open chrome")
+
+    # Once enough inner pauses are known they set the ordinary pause
+    assert endpointer.base_pause_ms() == 600
+    for gaps in ([1000], [1100, 900]):
+        session = endpointer.begin()
+        session.gaps = gaps
+        session.finish("")
+    assert endpointer.base_pause_ms() == 1430
+    stats = endpointer.stats()
+    assert stats["endings"] == {"complete": 1, "dictation": 1, "default": 2, "limit": 0}
+    assert stats["users"]["default"]["words_per_second"] > 0
+    assert stats["speech_end_to_asr"]["count"] == 1 and 99 <= stats["speech_end_to_asr"]["avg_ms"] <= 101
+
+    # Profiles are handed over on a slow timer and at shutdown, not after every utterance
+    assert saved == []
+    endpointer.save()
+    endpointer.save()
+    assert saved == [endpointer.export_profiles()]
+
+    restored = Endpointer(min_utterances=3)
+    restored.load_profiles(saved[0])
+    assert restored.base_pause_ms() == 1430
+    capture.stop()
+    print("✓ Adaptive endpointing")
+
+
+def speak_frames(session, *runs, frame_ms=30):
+    """Feed alternating voiced/unvoiced runs of ms, checking the endpoint each frame as a listen does"""
+    for i, ms in enumerate(runs):
+        for _ in range(ms // frame_ms):
+            session.feed(i % 2 == 0, frame_ms)
+            session.pause_ms()
+            session.limit_ms()
+
+
+def test_learned_pause():
+    """Dips between words never shorten the pause; real mid-sentence pauses lengthen it"""
+    endpointer = Endpointer(pause_ms=800)
+    # "what is the weather like today": words with 60-120 ms dips between them
+    for _ in range(10):
+        session = endpointer.begin()
+        speak_frames(session, 240, 60, 300, 90, 180, 120, 360, 60, 270, 120, 330)
+        assert session.gaps == []
+        session.finish("what is the weather like today")
+    assert endpointer.base_pause_ms() == 800
+
+    # Dictation without streaming partials: the transcript is unknown, so the configured pause holds
+    session = endpointer.begin()
+    assert session.pause_ms() == 800 and session.state == "default"
+
+    # A slow speaker thinking mid-sentence: 600-900 ms pauses between the dips
+    slow = Endpointer(pause_ms=800, min_utterances=5)
+    for i in range(5):
+        assert slow.base_pause_ms() == 800
+        session = slow.begin("slow")
+        speak_frames(session, 300, 90, 240, 600 + i * 60, 330, 120, 270, 900, 240)
+        assert session.gaps == [600 + i * 60, 900]
+        session.finish("")
+    assert slow.base_pause_ms("slow") == 1170
+
+    # The transcript is classified once per partial, not once per frame
+    checks = []
+    session = endpointer.begin(is_complete=lambda text: checks.append(text) or text == "open chrome")
+    session.update("open")
+    speak_frames(session, 300, 150)
+    session.update("open chrome")
+    speak_frames(session, 300, 300)
+    assert checks == ["open", "open chrome"]
+    assert session.state == "complete" and session.ending == "complete"
+    print("✓ Learned pause")
+
+
+if __name__ == "__main__":
+    test_background_load_and_warmup()
+    test_transcribe_pcm()
+    test_failed_load()
+    test_streaming_partials()
+    test_orchestrator_fallback_and_breaker()
+    test_orchestrator_race()
+    test_word_errors()
+    test_command_vocabulary()
+    test_adaptive_endpointing()
+    test_learned_pause()
+    print("All ASR tests passed")
@@ -0,0 +1,146 @@
+"""
+Test script for the Vecna audio capture
+Runs without a microphone - frames are written into the capture directly
+"""
+
+import os
+import sys
+import time
+import wave
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from array import array
+from vecna_audio import RingBuffer, AudioCapture, ReplayCapture, resample_pcm16, pcm_to_float32, resample_float32, NUMPY_AVAILABLE
+
+
+def tone(level, samples=480):
+    return array('h', [level, -level] * (samples // 2)).tobytes()
+
+
+def test_ring_buffer():
+    """Readers keep their own positions; an overrun reader skips to the oldest data"""
+    ring = RingBuffer(8)
+    ring.write(b"abcd")
+    data, pos = ring.read(0, 3)
+    assert data == b"abc" and pos == 3
+    ring.write(b"efghij")  # wraps around, "ab" is overwritten
+    data, pos = ring.read(pos, 100)
+    assert data == b"defghij" and pos == 10
+    data, pos = ring.read(0, 4)
+    assert data == b"cdef" and pos == 6
+    assert ring.read(10, 4) == (b"", 10)
+
+    # A write in progress has overwritten "cd" but not yet published it; a lagging
+    # reader must skip the half-written bytes rather than return them
+    ring.reserved = ring.written + 2
+    ring._buffer[2:4] = b"XY"
+    data, pos = ring.read(2, 100)
+    assert data == b"efghij" and pos == 10
+    print("✓ Ring buffer")
+
+
+def test_calibration_and_tracking():
+    """The floor is calibrated once from the first frames, then follows the room"""
+    capture = AudioCapture(calibration_ms=300, min_threshold=50, margin=3.0, adapt=0.5)
+    for level in (100, 100, 100, 100, 5000, 100, 100, 100, 100, 100):
+        capture.write(tone(level))
+    assert capture.calibrated.is_set() and capture.noise_floor == 100
+    for _ in range(20):
+        capture.write(tone(40))  # the room got quieter
+    assert capture.noise_floor < 45 and capture.energy_threshold < 135
+    for _ in range(5):
+        capture.write(tone(8000))  # speech does not drag the floor up
+    assert capture.noise_floor < 45
+    print("✓ Calibration and tracking")
+
+
+def test_listen_from_buffer():
+    """An utterance is cut out of the ring with pre-roll, ending on the pause"""
+    capture = AudioCapture(calibration_ms=90, min_threshold=100).start()
+    for _ in range(3):
+        capture.write(tone(20))
+
+    def speak():
+        time.sleep(0.05)
+        for level in [20] * 5 + [3000] * 20 + [20] * 40:
+            capture.write(tone(level))
+            time.sleep(0.002)
+
+    writer = threading.Thread(target=speak)
+    writer.start()
+    pcm = capture.listen(timeout=2, pause_ms=300, pre_roll_ms=90, min_speech_ms=60, keep_silence_ms=60)
+    writer.join()
+    frames = [pcm[i:i + capture.frame_bytes] for i in range(0, len(pcm), capture.frame_bytes)]
+    voiced = [capture.is_speech(f) for f in frames]
+    assert voiced.count(True) == 20
+    assert voiced[:3] == [False] * 3 and voiced[-2:] == [False] * 2  # pre-roll and kept silence
+    assert capture.listen(timeout=0.1) is None
+    capture.stop()
+    print("✓ Listen from buffer")
+
+
+def test_resample():
+    """48 kHz audio resampled to 16 kHz keeps its duration"""
+    pcm = tone(1000, samples=4800)
+    out = resample_pcm16(pcm, 48000, 16000)
+    assert len(out) == 1600 * 2
+    print("✓ Resample")
+
+
+def test_whisper_input():
+    """PCM of any common width becomes 16 kHz float32 without touching disk"""
+    if not NUMPY_AVAILABLE:
+        print("- Whisper input skipped (numpy not installed)")
+        return
+    import numpy as np
+    pcm16 = array('h', [16384, -16384, 0, 32767]).tobytes()
+    assert pcm_to_float32(pcm16, 2).tolist() == [0.5, -0.5, 0.0, 32767 / 32768]
+    pcm24 = bytes([0x00, 0x00, 0x40, 0x00, 0x00, 0xC0])  # +0.5, -0.5
+    assert pcm_to_float32(pcm24, 3).tolist() == [0.5, -0.5]
+    assert pcm_to_float32(bytes([128, 192]), 1).tolist() == [0.0, 0.5]
+
+    # One second of a 440 Hz tone at 44.1 kHz keeps its length and pitch at 16 kHz
+    t = np.arange(44100) / 44100.0
+    samples = resample_float32(np.sin(2 * np.pi * 440 * t).astype(np.float32), 44100, 16000)
+    assert samples.dtype == np.float32 and len(samples) == 16000
+    spectrum = np.abs(np.fft.rfft(samples))
+    assert abs(int(np.argmax(spectrum)) - 440) <= 1
+    print("✓ Whisper input")
+
+
+def test_replay_source():
+    """Recordings are replayed through the ring and answered responses are timed"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "open_chrome.wav")
+        with wave.open(path, 'wb') as wav:
+            wav.setnchannels(2)
+            wav.setsampwidth(2)
+            wav.setframerate(8000)
+            wav.writeframes(array('h', [3000, 3000, -3000, -3000] * 4000).tobytes())  # 1 s of speech
+        with open(os.path.join(tmp, "playlist.txt"), 'w') as f:
+            f.write("# one command\nopen_chrome.wav\n")
+
+        capture = ReplayCapture(os.path.join(tmp, "playlist.txt"), speed=10.0, lead_ms=300, gap_ms=900,
+                                calibration_ms=90, min_threshold=100).start()
+        pcm = capture.listen(timeout=2, phrase_time_limit=None, pause_ms=300)
+        assert pcm is not None and 1.0 <= len(pcm) / 32000 <= 1.7  # speech plus pre-roll and kept silence
+        assert capture.finished.wait(2)
+        capture.record_response()
+        capture.record_response()  # a second answer to the same recording is not counted
+        stats = capture.stats()["replay"]
+        capture.stop()
+    assert stats["played"] == 1 and stats["answered"] == 1 and stats["errors"] == 0
+    assert stats["response_latency"]["count"] == 1
+    print("✓ Replay source")
+
+
+if __name__ == "__main__":
+    test_ring_buffer()
+    test_calibration_and_tracking()
+    test_listen_from_buffer()
+    test_resample()
+    test_whisper_input()
+    test_replay_source()
+    print("All audio tests passed")
@@ -42,6 +42,11 @@ def test_commands():
         except Exception as e:
             print(f"✗ '{command}' -> ERROR: {e}")
     
+    # Speech that already matches a command is never snapped onto another one
+    for heard in ["what a time", "open word pad", "what day is today"]:
+        snapped = processor.snap_command(heard)
+        print(f"{'✓' if snapped == heard else '✗'} '{heard}' -> '{snapped}'")
+    
     print("\n" + "=" * 50)
     print("Test complete!")
 
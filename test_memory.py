@@ -0,0 +1,490 @@
+"""
+Test script for the Vecna memory storage backends
+Runs without a microphone or speakers - only the standard library is required
+"""
+
+import os
+import sys
+import time
+import datetime
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from vecna_storage import (
+    ConversationArchive, ConversationJournal, JsonMemoryBackend, SQLiteMemoryBackend, WriteBehindFlusher, create_memory_backend,
+    read_custom_commands
+)
+
+
+def _turn(i):
+    return {
+        "timestamp": f"2025-01-01 10:00:{i % 60:02d}",
+        "user_input": f"command {i}",
+        "assistant_response": f"response {i}"
+    }
+
+
+def test_conversation_journal():
+    """Appends replay in order; a torn last line is truncated away and appends resume after it"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "memory.json")
+        journal = ConversationJournal(path, fsync=False)
+        for i in range(5):
+            assert journal.append("conversation", _turn(i)) == i + 1
+        journal.close()
+
+        # Crash mid-append: the last record is cut in half
+        size = os.path.getsize(journal.journal_file)
+        with open(journal.journal_file, "r+b") as f:
+            f.truncate(size - 10)
+
+        journal = ConversationJournal(path, fsync=False)
+        records = journal.recover()
+        assert [r["seq"] for r in records] == [1, 2, 3, 4]
+        assert records[-1]["data"]["user_input"] == "command 3"
+        assert journal.seq == 4 and journal.pending == 4
+        # The torn bytes are gone, so the next append starts on a clean line
+        assert journal.append("conversation", _turn(9)) == 5
+        journal.close()
+
+        journal = ConversationJournal(path, fsync=False)
+        assert [r["seq"] for r in journal.recover()] == [1, 2, 3, 4, 5]
+        # Records the snapshot already holds are skipped
+        assert [r["data"]["user_input"] for r in journal.recover(snapshot_seq=3)] == ["command 3", "command 9"]
+        journal.close()
+        print("✓ Conversation journal")
+
+
+def test_journal_recovery():
+    """Turns survive a reload and a torn trailing record is discarded"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "memory.json")
+        backend = JsonMemoryBackend(path, max_conversations=50)
+        for i in range(20):
+            backend.add_conversation(_turn(i))
+        backend.journal.close()
+
+        with open(f"{path}.journal", "a", encoding="utf-8") as f:
+            f.write('{"seq": 999, "op": "conversa')
+
+        reloaded = JsonMemoryBackend(path, max_conversations=50)
+        assert reloaded.conversation_count() == 20
+        assert reloaded.recent_conversations(1)[0]["user_input"] == "command 19"
+        reloaded.close()
+        print("✓ Journal recovery")
+
+
+def test_lazy_startup():
+    """Startup reads only the header; recent turns are paged from the file tail"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "memory.json")
+        backend = JsonMemoryBackend(path, max_conversations=500)
+        for i in range(300):
+            backend.add_conversation(_turn(i))
+        backend.set_preference("voice", "female")
+        backend.close()
+
+        backend = JsonMemoryBackend(path, max_conversations=500)
+        assert backend._conversations is None
+        assert backend.get_preferences()["voice"] == "female"
+        assert backend.conversation_count() == 300
+        assert [c["user_input"] for c in backend.recent_conversations(2)] == ["command 298", "command 299"]
+        assert backend._conversations is None
+        assert backend.search("command 7")[0]["user_input"] == "command 7"
+        assert backend._conversations is not None
+        backend.close()
+        print("✓ Lazy startup")
+
+
+def test_backends():
+    """Both backends expose the same behaviour"""
+    past = (datetime.datetime.now() - datetime.timedelta(minutes=1)).isoformat()
+    future = (datetime.datetime.now() + datetime.timedelta(hours=1)).isoformat()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in ("json", "sqlite"):
+            path = os.path.join(tmp, f"{kind}.json")
+            backend = create_memory_backend(kind, path, max_conversations=10)
+            for i in range(15):
+                backend.add_conversation(_turn(i))
+            backend.add_reminder({"text": "due", "time": past, "completed": False})
+            backend.add_reminder({"text": "later", "time": future, "completed": False})
+            backend.set_custom_command("lights", "print('on')")
+            backend.set_preference("voice", "female")
+            backend.close()
+
+            backend = create_memory_backend(kind, path, max_conversations=10)
+            assert backend.conversation_count() == 10
+            assert [c["user_input"] for c in backend.recent_conversations(2)] == ["command 13", "command 14"]
+            due = backend.pop_due_reminders(datetime.datetime.now().timestamp())
+            assert [r["text"] for r in due] == ["due"]
+            assert backend.pop_due_reminders(datetime.datetime.now().timestamp()) == []
+            assert backend.get_custom_commands() == {"lights": "print('on')"}
+            assert backend.get_preferences()["voice"] == "female"
+            backend.close()
+            assert read_custom_commands(kind, path) == {"lights": "print('on')"}
+            print(f"✓ {kind} backend")
+
+
+def test_sqlite_import():
+    """The SQLite backend migrates an existing JSON memory file once"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "memory.json")
+        legacy = JsonMemoryBackend(path)
+        legacy.add_conversation(_turn(1))
+        legacy.set_custom_command("hello", "print('hi')")
+        legacy.close()
+
+        backend = SQLiteMemoryBackend(os.path.join(tmp, "memory.db"), legacy_json=path)
+        assert backend.conversation_count() == 1
+        assert backend.get_custom_commands() == {"hello": "print('hi')"}
+        backend.close()
+
+        # Turns beyond the SQLite hot window go to the archive instead of being dropped
+        path = os.path.join(tmp, "big.json")
+        legacy = JsonMemoryBackend(path, max_conversations=50)
+        for i in range(30):
+            legacy.add_conversation(_turn(i))
+        legacy.close()
+        backend = SQLiteMemoryBackend(os.path.join(tmp, "big.db"), max_conversations=10, legacy_json=path,
+                                      archive_dir=os.path.join(tmp, "archive"))
+        assert backend.conversation_count() == 10
+        assert backend.recent_conversations(1)[0]["user_input"] == "command 29"
+        assert backend.archive.count == 20
+        assert backend.search("command 3")[0]["user_input"] == "command 3"
+        backend.close()
+        print("✓ JSON to SQLite import")
+
+
+def test_search():
+    """Full-text search returns newest matches first and honours the time window"""
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in ("json", "sqlite"):
+            backend = create_memory_backend(kind, os.path.join(tmp, f"{kind}.json"), auto_save=False)
+            backend.add_conversation({"timestamp": "2025-01-01 09:00:00",
+                                      "user_input": "search for cats", "assistant_response": "Searching"})
+            backend.add_conversation({"timestamp": "2025-01-02 09:00:00",
+                                      "user_input": "open chrome", "assistant_response": "Opening chrome"})
+            backend.add_conversation({"timestamp": "2025-01-02 10:00:00",
+                                      "user_input": "search for dogs", "assistant_response": "Searching"})
+
+            assert [r["user_input"] for r in backend.search("search for")] == ["search for dogs", "search for cats"]
+            assert [r["user_input"] for r in backend.search("chrome")] == ["open chrome"]
+            assert [r["user_input"] for r in backend.search("search", until="2025-01-01 23:59:59")] == ["search for cats"]
+            assert len(backend.search("", since=datetime.datetime(2025, 1, 2))) == 2
+            assert backend.search("elephants") == []
+            backend.close()
+            print(f"✓ {kind} history search")
+
+
+def test_archive_tiers():
+    """Turns evicted from the hot window land in compressed, searchable segments exactly once"""
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in ("json", "sqlite"):
+            path = os.path.join(tmp, f"{kind}.json")
+            options = dict(max_conversations=10, archive_segment_size=20, auto_save=False)
+            backend = create_memory_backend(kind, path, **options)
+            for i in range(55):
+                backend.add_conversation(_turn(i))
+            assert backend.conversation_count() == 10
+            assert backend.archive.count == 45
+            assert len(backend.archive.segments) == 2
+            assert [r["user_input"] for r in backend.search("command 3")] == ["command 3"]
+            assert len(backend.search("command", limit=100)) == 55
+            backend.close()
+
+            backend = create_memory_backend(kind, path, **options)
+            assert backend.archive.count == 45
+            backend.add_conversation(_turn(55))
+            assert backend.archive.count == 46
+            assert [r["user_input"] for r in backend.recent_conversations(1)] == ["command 55"]
+            backend.close()
+            print(f"✓ {kind} archive tiers")
+
+
+def test_archive_torn_pending():
+    """A torn pending record is cut off, so turns archived after it survive the next restart"""
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = ConversationArchive(tmp)
+        for i in range(1, 4):
+            archive.append(dict(_turn(i), id=i))
+        archive.close()
+        with open(archive.pending_file, "a", encoding="utf-8") as f:
+            f.write('{"id": 4, "user_in')
+
+        archive = ConversationArchive(tmp)
+        assert archive.count == 3
+        for i in range(5, 8):
+            archive.append(dict(_turn(i), id=i))
+        archive.close()
+
+        archive = ConversationArchive(tmp)
+        assert archive.count == 6
+        assert [e["id"] for e in archive.search("command", None, None, 10)] == [7, 6, 5, 3, 2, 1]
+        archive.close()
+        print("✓ Archive torn pending record")
+
+
+def test_write_behind():
+    """Many mutations coalesce into one write; nothing is lost at shutdown"""
+    writes = []
+    flusher = WriteBehindFlusher(lambda keys: writes.append(keys), interval=60, max_pending=1000)
+    for i in range(100):
+        flusher.mark_dirty("preferences" if i % 2 else "reminders")
+    assert writes == []
+    assert flusher.stats()["queue_depth"] == 100
+    flusher.stop()
+    assert writes == [{"preferences", "reminders"}]
+    assert flusher.stats()["writes_avoided"] == 99
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "memory.json")
+        backend = JsonMemoryBackend(path, flush_interval=60)
+        for i in range(10):
+            backend.set_preference(f"key{i}", i)
+        assert not os.path.exists(path)
+        backend.close()
+        assert JsonMemoryBackend(path, auto_save=False).get_preferences()["key9"] == 9
+
+        # Header changes leave the conversation file alone until the journal is due for compaction
+        backend = JsonMemoryBackend(path, flush_interval=60, compact_every=20)
+        for i in range(5):
+            backend.add_conversation(_turn(i))
+        backend.search("command")  # pages the window in
+        backend.set_preference("voice", "male")
+        backend.flush()
+        assert not os.path.exists(backend.conversations_file)
+        for i in range(5, 25):
+            backend.add_conversation(_turn(i))
+        backend.flush()
+        assert os.path.exists(backend.conversations_file)
+        backend.close()
+        reloaded = JsonMemoryBackend(path, auto_save=False)
+        assert reloaded.get_preferences()["voice"] == "male"
+        assert reloaded.conversation_count() == 25
+        reloaded.close()
+        print("✓ Write-behind flusher")
+
+
+def test_external_writers():
+    """Two writers on one JSON store keep each other's changes instead of clobbering them"""
+    future = (datetime.datetime.now() + datetime.timedelta(hours=1)).isoformat()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "memory.json")
+        first = JsonMemoryBackend(path, auto_save=False)
+        second = JsonMemoryBackend(path, auto_save=False)
+        changes = []
+        first.on_external_change = changes.append
+        commands = first.get_custom_commands()
+
+        first.set_preference("voice", "female")
+        first.flush()
+        second.set_preference("rate", 200)
+        second.set_custom_command("lights", "print('on')")
+        second.add_reminder({"text": "stretch", "time": future, "completed": False})
+        second.flush()
+        first.set_preference("voice", "male")
+        first.flush()
+
+        assert changes == [{"preferences", "custom_commands", "reminders"}]
+        # The merge swaps in new dicts, so one being iterated elsewhere never changes size
+        assert commands == {} and first.get_custom_commands() == {"lights": "print('on')"}
+        assert [r["text"] for r in first.upcoming_reminders()] == ["stretch"]
+        merged = JsonMemoryBackend(path, auto_save=False)
+        assert merged.get_preferences() == {"voice": "male", "rate": 200}
+        assert merged.get_custom_commands() == {"lights": "print('on')"}
+        for backend in (first, second, merged):
+            backend.close()
+        print("✓ External writers")
+
+
+def test_shared_conversations():
+    """Two writers journaling into one JSON store keep every turn, once, through compactions"""
+    with tempfile.TemporaryDirectory() as tmp:
+        for max_conversations in (500, 30):
+            path = os.path.join(tmp, f"memory{max_conversations}.json")
+            options = dict(max_conversations=max_conversations, compact_every=20, flush_interval=60,
+                           archive_dir=os.path.join(tmp, f"archive{max_conversations}"))
+            first = JsonMemoryBackend(path, **options)
+            second = JsonMemoryBackend(path, **options)
+            for i in range(60):
+                first.add_conversation(dict(_turn(i), user_input=f"first {i}"))
+                second.add_conversation(dict(_turn(i), user_input=f"second {i}"))
+                if i % 7 == 0:
+                    first.flush()  # compacts whenever the shared journal is due
+                if i % 11 == 0:
+                    second.flush()
+            # Each sees the other's turns too
+            assert "conversations" in first.refresh()
+            assert [t["user_input"] for t in first.recent_conversations(2)] == ["first 59", "second 59"]
+            first.close()
+            second.close()
+
+            merged = JsonMemoryBackend(path, **options)
+            turns = merged.search("", limit=1000)
+            assert len({t["id"] for t in turns}) == len(turns) == 120
+            assert {t["user_input"] for t in turns} == (
+                {f"first {i}" for i in range(60)} | {f"second {i}" for i in range(60)})
+            merged.close()
+        print("✓ Shared conversations")
+
+
+def test_refresh_polling():
+    """A second instance on the same store sees the first's writes and is notified"""
+    future = (datetime.datetime.now() + datetime.timedelta(hours=1)).isoformat()
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in ("json", "sqlite"):
+            path = os.path.join(tmp, f"{kind}.json")
+            writer = create_memory_backend(kind, path)
+            reader = create_memory_backend(kind, path, refresh_interval=0.1)
+            changes = []
+            reader.on_external_change = changes.append
+
+            writer.set_preference("voice", "female")
+            writer.add_reminder({"text": "stretch", "time": future, "completed": False})
+            writer.flush()
+            assert _wait_for(lambda: changes)
+            assert {"preferences", "reminders"} <= changes[0]
+            assert reader.get_preferences()["voice"] == "female"
+            assert [r["text"] for r in reader.upcoming_reminders()] == ["stretch"]
+            writer.close()
+            reader.close()
+            print(f"✓ {kind} refresh polling")
+
+
+class _ReminderMemory:
+    """The slice of vecna.Memory the scheduler uses, over a real backend"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.listeners = []
+        backend.on_external_change = lambda keys: self._notify("external_change", keys)
+
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+
+    def _notify(self, event, payload):
+        for callback in self.listeners:
+            callback(event, payload)
+
+    def add_reminder(self, text, when):
+        reminder = self.backend.add_reminder({"text": text, "time": when.isoformat(), "completed": False})
+        self._notify("reminder_added", reminder)
+        return reminder
+
+    def get_pending_reminders(self):
+        return self.backend.pop_due_reminders(time.time())
+
+    def get_upcoming_reminders(self):
+        return self.backend.upcoming_reminders()
+
+
+def _in(seconds):
+    return datetime.datetime.now() + datetime.timedelta(seconds=seconds)
+
+
+def _wait_for(condition, timeout=3.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_reminder_scheduler():
+    """Reminders fire at their deadline, once, and earlier ones re-arm the sleeping thread"""
+    from vecna_scheduler import ReminderScheduler
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "memory.json")
+        memory = _ReminderMemory(JsonMemoryBackend(path, auto_save=False))
+        fired = []
+        scheduler = ReminderScheduler(memory)
+        scheduler.add_listener(lambda due: fired.extend((r["text"], time.time()) for r in due))
+
+        # Fires at its deadline, not on a polling tick
+        memory.add_reminder("later", _in(60))
+        started = time.time()
+        memory.add_reminder("soon", _in(0.3))
+        scheduler.start()
+        assert _wait_for(lambda: fired)
+        assert fired[0][0] == "soon"
+        assert 0.25 <= fired[0][1] - started < 1.0
+
+        # The thread is asleep until "later"; an earlier reminder wakes it
+        assert abs(scheduler.next_due() - _in(60).timestamp()) < 1.0
+        added = time.time()
+        memory.add_reminder("sooner", _in(0.2))
+        assert _wait_for(lambda: len(fired) == 2)
+        assert fired[1][0] == "sooner" and fired[1][1] - added < 1.0
+
+        # An overdue reminder that was never announced fires once after a restart
+        memory.add_reminder("missed", _in(0.2))
+        started = time.time()
+        scheduler.stop()
+        assert not scheduler._thread.is_alive()
+        assert time.time() - started < 1.0
+        memory.backend.close()
+        time.sleep(0.3)
+
+        memory = _ReminderMemory(JsonMemoryBackend(path, auto_save=False))
+        scheduler = ReminderScheduler(memory)
+        scheduler.add_listener(lambda due: fired.extend((r["text"], time.time()) for r in due))
+        scheduler.start()
+        assert _wait_for(lambda: len(fired) == 3)
+        time.sleep(0.3)
+        assert [text for text, _ in fired] == ["soon", "sooner", "missed"]
+        assert [r["text"] for r in memory.get_upcoming_reminders()] == ["later"]
+        scheduler.stop()
+        memory.backend.close()
+        print("✓ Reminder scheduler")
+
+
+def test_context_retrieval():
+    """Relevant turns are picked over merely recent ones, within the token budget"""
+    from vecna_retrieval import ContextRetriever
+
+    class FakeMemory:
+        def __init__(self):
+            self.turns = []
+            self.listeners = []
+
+        def subscribe(self, callback):
+            self.listeners.append(callback)
+
+        def get_recent_conversations(self, limit=10):
+            return self.turns[-limit:]
+
+        def add(self, user_input, response):
+            turn = {"id": len(self.turns) + 1, "user_input": user_input, "assistant_response": response}
+            self.turns.append(turn)
+            for callback in self.listeners:
+                callback("conversation_added", turn)
+
+    memory = FakeMemory()
+    memory.add("how tall is the eiffel tower", "330 metres")
+    retriever = ContextRetriever(memory)
+    for i in range(20):
+        memory.add(f"set volume to {i}", "Volume set")
+
+    chosen = [t["user_input"] for t in retriever.select("tell me about the eiffel tower", k=2)]
+    assert chosen == ["how tall is the eiffel tower", "set volume to 19"]
+    assert retriever.select("eiffel tower", k=5, token_budget=1) == []
+    print("✓ Context retrieval")
+
+
+if __name__ == "__main__":
+    test_conversation_journal()
+    test_journal_recovery()
+    test_lazy_startup()
+    test_backends()
+    test_sqlite_import()
+    test_search()
+    test_archive_tiers()
+    test_archive_torn_pending()
+    test_write_behind()
+    test_external_writers()
+    test_shared_conversations()
+    test_refresh_polling()
+    test_reminder_scheduler()
+    test_context_retrieval()
+    print("All memory tests passed")
@@ -0,0 +1,305 @@
+"""
+Test script for the Vecna speech output pipeline
+Runs without speakers - a fake engine stands in for pyttsx3
+"""
+
+import os
+import sys
+import time
+import wave
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from array import array
+from vecna_speech import TTSWorker, OutputArbiter, Pyttsx3Backend, NullBackend, WavFileBackend, PhraseCache, SentenceChunker, BargeInDetector, PRIORITY_URGENT, PRIORITY_NORMAL, PRIORITY_CHATTER
+
+
+class FakeEngine:
+    """Speaks one word every `word_time` seconds and honours stop() like pyttsx3"""
+
+    def __init__(self, word_time=0.005):
+        self.word_time = word_time
+        self.spoken = []
+        self.properties = {}
+        self._callbacks = {}
+        self._pending = []
+        self._stop = False
+
+    def connect(self, topic, callback):
+        self._callbacks.setdefault(topic, []).append(callback)
+
+    def setProperty(self, name, value):
+        self.properties[name] = value
+
+    def getProperty(self, name):
+        return self.properties.get(name)
+
+    def save_to_file(self, text, path):
+        self.rendered = getattr(self, "rendered", []) + [text]
+        with wave.open(path, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(16000)
+            wav.writeframes(b"\x00\x01" * 160)
+
+    def say(self, text):
+        self._pending.append(text)
+
+    def stop(self):
+        self._stop = True
+
+    def runAndWait(self):
+        self._stop = False
+        for text in self._pending:
+            words, offset = [], 0
+            for word in text.split(" "):
+                for callback in self._callbacks.get('started-word', []):
+                    callback(None, offset, len(word))
+                if self._stop:
+                    break
+                time.sleep(self.word_time)
+                words.append(word)
+                offset += len(word) + 1
+            self.spoken.append(" ".join(words))
+            if self._stop:
+                break
+        self._pending = []
+
+
+class FakePlayer:
+    available = True
+
+    def __init__(self):
+        self.played = []
+
+    def play(self, path, should_stop, on_start=None):
+        if on_start:
+            on_start()
+        self.played.append(path)
+        return True
+
+
+def test_priority_order():
+    """Urgent speech is spoken before queued chatter"""
+    engine = FakeEngine(word_time=0)
+    worker = TTSWorker(Pyttsx3Backend(lambda: engine))
+    last = worker.speak("hello there", PRIORITY_CHATTER)
+    worker.speak("command done", PRIORITY_NORMAL)
+    worker.speak("reminder stretch", PRIORITY_URGENT)
+    worker.start()
+    assert last.wait(2)
+    worker.stop()
+    assert engine.spoken == ["reminder stretch", "command done", "hello there"]
+    stats = worker.stats()
+    assert stats["spoken"] == 3 and stats["max_queue_depth"] == 3
+    assert stats["wait"]["count"] == 3
+    print("✓ Priority order")
+
+
+def test_preemption():
+    """An urgent utterance cuts into long chatter, which then resumes from the cut word"""
+    engine = FakeEngine()
+    worker = TTSWorker(Pyttsx3Backend(lambda: engine))
+    worker.start()
+    long_text = " ".join(f"word{i}" for i in range(100))
+    chatter = worker.speak(long_text, PRIORITY_CHATTER)
+    time.sleep(0.05)
+    urgent = worker.speak("reminder now", PRIORITY_URGENT)
+    assert urgent.wait(2) and chatter.wait(5)
+    worker.stop()
+
+    assert engine.spoken[1] == "reminder now"
+    assert chatter.preemptions == 1 and worker.stats()["preempted"] == 1
+    # Nothing lost, nothing repeated
+    assert (engine.spoken[0] + " " + engine.spoken[2]).split() == long_text.split()
+    print("✓ Preemption")
+
+
+def test_configure():
+    """Voice settings are applied on the worker thread between utterances"""
+    engine = FakeEngine(word_time=0)
+    worker = TTSWorker(Pyttsx3Backend(lambda: engine))
+    worker.start()
+    worker.configure(rate=150, volume=None)
+    worker.speak("ok").wait(2)
+    worker.stop()
+    assert engine.properties == {"rate": 150}
+    print("✓ Configure")
+
+
+def test_cancel_and_flush():
+    """cancel() cuts the current utterance; flush() drops the queue but can keep urgent speech"""
+    engine = FakeEngine()
+    worker = TTSWorker(Pyttsx3Backend(lambda: engine))
+    worker.start()
+    current = worker.speak(" ".join(["blah"] * 200))
+    stale = worker.speak("stale chatter", PRIORITY_CHATTER)
+    time.sleep(0.05)
+    reminder = worker.speak("reminder", PRIORITY_URGENT)
+    assert worker.flush(keep_urgent=True) == 1 and stale.cancelled
+    assert worker.cancel()
+    assert current.wait(1) and current.cancelled
+    assert reminder.wait(1) and not reminder.cancelled
+    worker.stop()
+    assert engine.spoken[-1] == "reminder"
+    assert worker.stats()["stop_latency"]["count"] == 1
+    print("✓ Cancel and flush")
+
+
+def test_barge_in_detector():
+    """Speech well above the playback floor fires once; echo-level audio does not"""
+    fired = []
+    detector = BargeInDetector(lambda: fired.append(True), min_threshold=100, min_voiced_ms=90)
+    frame = lambda level: array('h', [level, -level] * 240).tobytes()
+    for _ in range(20):
+        detector.feed(frame(400), 30)  # Vecna's own voice leaking into the mic
+    assert not fired
+    for _ in range(10):
+        detector.feed(frame(3000), 30)
+    assert fired == [True] and detector.triggered == 1
+    print("✓ Barge-in detector")
+
+
+def test_phrase_cache():
+    """Pre-warmed and repeated phrases play from disk; the cache is a bounded LRU"""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, player = FakeEngine(word_time=0), FakePlayer()
+        cache = PhraseCache(tmp, max_entries=2)
+        worker = TTSWorker(Pyttsx3Backend(lambda: engine, player=player), cache=cache)
+        worker.prewarm(["Volume increased"])
+        worker.start()
+        time.sleep(0.1)
+        worker.speak("Volume increased").wait(2)
+        for _ in range(2):
+            worker.speak("Audio muted").wait(2)
+        time.sleep(0.1)
+        worker.speak("Audio muted").wait(2)
+        worker.stop()
+
+        assert engine.spoken == ["Audio muted", "Audio muted"]
+        assert len(player.played) == 2
+        assert engine.rendered == ["Volume increased", "Audio muted"]
+        assert worker.stats()["first_audio_cached"]["count"] == 2
+
+        # Keys include the voice settings; a third phrase evicts the least recently used
+        key = PhraseCache.make_key("Pasted text", None, 150, 1.0)
+        assert key != PhraseCache.make_key("Pasted text", None, 200, 1.0)
+        rendered = os.path.join(tmp, "new.wav")
+        engine.save_to_file("Pasted text", rendered)
+        cache.put(key, rendered, "Pasted text")
+        reopened = PhraseCache(tmp, max_entries=2)
+        assert len(reopened) == 2 and reopened.get(key) is not None
+        print("✓ Phrase cache")
+
+
+def test_headless_backends():
+    """The null backend keeps speaking time and honours preemption; the wav backend writes files"""
+    backend = NullBackend(rate=6000)  # 10 ms per word
+    worker = TTSWorker(backend)
+    worker.start()
+    long_text = " ".join(f"word{i}" for i in range(50))
+    chatter = worker.speak(long_text, PRIORITY_CHATTER)
+    time.sleep(0.05)
+    urgent = worker.speak("reminder now", PRIORITY_URGENT)
+    assert urgent.wait(2) and chatter.wait(5)
+    worker.stop()
+    spoken = [text for text, _ in backend.spoken]
+    assert spoken[1] == "reminder now" and chatter.preemptions == 1
+    assert backend.spoken[0][1] >= 0.04
+    assert worker.voices() == [{"id": "null", "name": "Null (silent)"}]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        worker = TTSWorker(WavFileBackend(tmp))
+        worker.start()
+        worker.speak("Volume increased").wait(2)
+        worker.speak("Audio muted").wait(2)
+        worker.stop()
+        assert sorted(os.listdir(tmp)) == ["utterance-000001.wav", "utterance-000002.wav", "utterances.jsonl"]
+        with wave.open(os.path.join(tmp, "utterance-000002.wav"), 'rb') as wav:
+            assert wav.getnframes() > 0
+    print("✓ Headless backends")
+
+
+def test_output_arbiter():
+    """Bursts are collapsed, superseded and rate limited before reaching the worker"""
+    engine = FakeEngine(word_time=0.01)
+    worker = TTSWorker(Pyttsx3Backend(lambda: engine))
+    arbiter = OutputArbiter(worker.speak, worker.queue_depth, max_queue=4,
+                            rate_limits={"gui": (2, 60.0)}, poll_interval=0.01)
+    arbiter.submit("Command executed")
+    assert not arbiter.submit("command  executed")
+    arbiter.submit("Hello! I'm Vecna.", source="status", status=True)
+    arbiter.submit("Goodbye! Going offline now.", source="status", status=True)
+    for i in range(3):
+        arbiter.submit(f"gui message {i}", source="gui")
+    arbiter.submit("overflow")  # queue full: the waiting status goes first
+    assert arbiter.queue_depth() == 4
+
+    worker.start()
+    arbiter.start()
+    deadline = time.time() + 5
+    while (arbiter.queue_depth() or worker.queue_depth() or worker.is_speaking()) and time.time() < deadline:
+        time.sleep(0.02)
+    arbiter.stop()
+    worker.stop()
+
+    assert engine.spoken == ["Command executed", "gui message 0", "gui message 1", "overflow"]
+    assert arbiter.stats()["dropped"] == {"duplicate": 1, "superseded": 1, "rate_limited": 1, "overflow": 1}
+    # Handed over one at a time, so the worker never holds a backlog
+    assert worker.stats()["max_queue_depth"] <= 1
+    print("✓ Output arbiter")
+
+
+def test_sentence_chunker():
+    """Sentences are cut at boundaries but not at abbreviations or decimals"""
+    chunker = SentenceChunker()
+    text = "Sure. The tower is 330 m tall, e.g. 3.5 times Big Ben. Dr. Smith agrees! Anything else"
+    sentences = []
+    for i in range(0, len(text), 5):
+        sentences += chunker.feed(text[i:i + 5])
+    sentences += chunker.flush()
+    assert sentences == [
+        "Sure. The tower is 330 m tall, e.g. 3.5 times Big Ben.",
+        "Dr. Smith agrees!",
+        "Anything else"
+    ]
+    print("✓ Sentence chunker")
+
+
+def test_streamed_speech():
+    """The first sentence is spoken while the rest of the answer is still being generated"""
+    engine = FakeEngine(word_time=0)
+    worker = TTSWorker(Pyttsx3Backend(lambda: engine))
+    worker.start()
+
+    def slow_answer():
+        yield "The first sentence is here. "
+        time.sleep(0.3)
+        yield "The second one arrives "
+        time.sleep(0.3)
+        yield "much later."
+
+    stream = worker.speak_stream(slow_answer())
+    time.sleep(0.15)
+    assert engine.spoken == ["The first sentence is here."]
+    assert stream.result(2) == "The first sentence is here. The second one arrives much later."
+    assert stream.wait(2)
+    worker.stop()
+    assert engine.spoken[1] == "The second one arrives much later."
+    assert stream.time_to_first_audio < 0.15
+    assert worker.stats()["first_audio_stream"]["count"] == 1
+    print("✓ Streamed speech")
+
+
+if __name__ == "__main__":
+    test_priority_order()
+    test_preemption()
+    test_configure()
+    test_cancel_and_flush()
+    test_barge_in_detector()
+    test_phrase_cache()
+    test_headless_backends()
+    test_output_arbiter()
+    test_sentence_chunker()
+    test_streamed_speech()
+    print("All speech tests passed")
@@ -1,6 +1,8 @@
 import os
+import re
 import time
 import json
+import atexit
 import random
 import datetime
 import webbrowser
@@ -19,12 +21,6 @@ import screen_brightness_control as sbc
 import sys
 
 # Optional imports - will be installed if needed
-try:
-    from faster_whisper import WhisperModel
-    WHISPER_AVAILABLE = True
-except ImportError:
-    WHISPER_AVAILABLE = False
-
 try:
     import openai
     OPENAI_AVAILABLE = True
@@ -44,19 +40,77 @@ except ImportError:
     AUTOMATION_AVAILABLE = False
     print("Advanced automation not available - install selenium, beautifulsoup4, opencv-python for full features")
 
+from vecna_storage import create_memory_backend
+from vecna_scheduler import ReminderScheduler
+from vecna_retrieval import ContextRetriever, create_embedder
+from vecna_audio import ReplayCapture, create_audio_source, create_vad, PYAUDIO_AVAILABLE, SAMPLE_WIDTH
+from vecna_asr import WhisperRuntime, StreamingTranscriber, RecognizerOrchestrator, WhisperEngine, GoogleEngine, CommandVocabulary, Endpointer, normalize_text, WAKE_WORD_DECODE, WHISPER_AVAILABLE
+from vecna_speech import TTSWorker, OutputArbiter, PhraseCache, create_tts_backend, BargeInDetector, PRIORITY_URGENT, PRIORITY_NORMAL, PRIORITY_CHATTER
+
 # ====== Configuration ======
 class Config:
     ASSISTANT_NAME = "vecna"
     WAKE_WORDS = ["hey vecna", "okay vecna", "hi vecna", "vecna"]
     VOICE_RATE = 180
     VOICE_VOLUME = 1.0
+    TTS_BACKEND = "pyttsx3"     # pyttsx3, wav (write utterances to files), null (silent timing only)
+    TTS_OUTPUT_DIR = "tts_output"   # Where the wav backend writes utterances
+    OUTPUT_QUEUE_SIZE = 8       # Bridge/GUI messages waiting to be spoken
+    OUTPUT_DEDUPE_WINDOW = 3.0  # Seconds in which a repeated message is collapsed
+    OUTPUT_RATE_LIMITS = {"status": (3, 10.0)}  # source -> (messages, seconds)
+    BARGE_IN = True             # Talking over Vecna cuts its speech short
+    BARGE_IN_THRESHOLD = 300    # Minimum mic RMS counted as the user talking
+    PHRASE_CACHE = True         # Play frequent responses from pre-rendered audio
+    PHRASE_CACHE_DIR = "tts_cache"
+    PHRASE_CACHE_SIZE = 200     # Max cached phrases (least recently used are evicted)
     MEMORY_FILE = "vecna_memory.json"
+    MEMORY_BACKEND = "json"  # json, sqlite
+    MEMORY_DB_FILE = "vecna_memory.db"
+    MEMORY_MAX_CONVERSATIONS = 1000     # Hot window size; older turns move to the archive
+    MEMORY_ARCHIVE_SEGMENT_SIZE = 1000  # Turns per compressed archive segment
+    MEMORY_ARCHIVE_CODEC = "gzip"       # gzip, zstd (needs the zstandard package)
+    MEMORY_AUTO_SAVE = True       # Background write-behind; False saves only on explicit save/shutdown
+    MEMORY_FLUSH_INTERVAL = 2.0   # Seconds between background flushes
+    MEMORY_FLUSH_THRESHOLD = 50   # Pending mutations that force an early flush
+    MEMORY_REFRESH_INTERVAL = 5.0 # Seconds between checks for other processes' writes (0 = off)
     OFFLINE_MODE = False
     USE_WHISPER = WHISPER_AVAILABLE
     WHISPER_MODEL = "base"  # Changed from tiny to base for better accuracy - options: tiny, base, small, medium, large
+    WHISPER_COMPUTE_TYPE = "int8"   # int8, int8_float16, float32
+    WHISPER_CPU_THREADS = 0         # 0 = let CTranslate2 decide
+    WHISPER_NUM_WORKERS = 1         # Parallel transcriptions the model can run
+    WHISPER_BEAM_SIZE = 5
+    WHISPER_BEST_OF = 5
+    STREAMING_ASR = False           # Decode while the user speaks; act on a confident partial
+    VAD = "energy"                  # energy, webrtc (needs the webrtcvad package)
+    PARTIAL_INTERVAL_MS = 600       # How often partial hypotheses are decoded
+    PARTIAL_MIN_CONFIDENCE = 0.6    # Partial confidence needed to run a command early
+    RECOGNIZER_MODE = "sequential"  # sequential (Whisper, then Google), race (both at once, first confident wins)
+    RECOGNIZER_MIN_CONFIDENCE = 0.5 # Confidence a race result needs to win outright
+    RECOGNIZER_FAILURE_THRESHOLD = 3    # Consecutive errors before an engine is skipped
+    RECOGNIZER_COOLDOWN = 30.0      # Seconds an engine is skipped before it is probed again
+    GOOGLE_TIMEOUT = 8              # Seconds before a Google request counts as failed
+    VOCAB_PROMPT = True             # Prompt Whisper with the known command phrases
+    VOCAB_HOTWORDS = False          # Also pass them as hotwords (faster-whisper >= 1.0)
+    SNAP_COMMANDS = True            # Map near-miss transcripts onto known commands
+    SNAP_THRESHOLD = 0.8            # Similarity (0..1) needed to snap
+    ADAPTIVE_ENDPOINTING = True     # End commands on a pause that fits what was said and how you talk
+    ENDPOINT_SHORT_PAUSE_MS = 300   # Pause that ends a complete command (streaming mode)
+    ENDPOINT_LONG_PAUSE_MS = 1600   # Minimum pause that ends dictation ("type ...", "search for ...")
+    MAX_COMMAND_SECONDS = 15        # Longest command
+    MAX_DICTATION_SECONDS = 45      # Longest dictation
     LANGUAGE = "en-US"       # Explicitly set language to US English
+    PERSISTENT_MIC = True    # Keep the microphone open and buffer audio between listens
+    MIC_DEVICE_INDEX = None  # Input device for the persistent capture (None = default)
+    AUDIO_SOURCE = "microphone"  # microphone, replay (play recordings instead of listening)
+    REPLAY_PLAYLIST = []     # WAV/PCM files, directories or .txt/.m3u playlists to replay
+    REPLAY_SPEED = 1.0       # 1.0 = real time, 2.0 = twice as fast
     USE_LLM = True
     LLM_TYPE = "openai"  # openai, gemini, ollama
+    CONTEXT_TURNS = 5             # Max past turns sent to the LLM
+    CONTEXT_TOKEN_BUDGET = 400    # Approx. token budget for those turns
+    CONTEXT_EMBEDDER = "hashing"  # hashing (offline), sentence-transformers
+    STREAM_RESPONSES = True       # Speak LLM answers sentence by sentence while they generate
     
     # API Keys
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")  # Your OpenAI API key
@@ -113,142 +167,378 @@ class Config:
             # Keys from config if present
             GEMINI_API_KEY = ai_cfg.get("gemini_api_key", GEMINI_API_KEY)
             OPENAI_API_KEY = ai_cfg.get("openai_api_key", OPENAI_API_KEY)
+            CONTEXT_TURNS = ai_cfg.get("context_turns", CONTEXT_TURNS)
+            CONTEXT_TOKEN_BUDGET = ai_cfg.get("context_token_budget", CONTEXT_TOKEN_BUDGET)
+            CONTEXT_EMBEDDER = ai_cfg.get("context_embedder", CONTEXT_EMBEDDER)
+            STREAM_RESPONSES = ai_cfg.get("stream_responses", STREAM_RESPONSES)
             # Speech settings
             tts_cfg = _cfg.get("text_to_speech", {})
             VOICE_RATE = tts_cfg.get("rate", VOICE_RATE)
             VOICE_VOLUME = tts_cfg.get("volume", VOICE_VOLUME)
+            TTS_BACKEND = tts_cfg.get("backend", TTS_BACKEND)
+            TTS_OUTPUT_DIR = tts_cfg.get("output_dir", TTS_OUTPUT_DIR)
+            OUTPUT_QUEUE_SIZE = tts_cfg.get("output_queue_size", OUTPUT_QUEUE_SIZE)
+            OUTPUT_DEDUPE_WINDOW = tts_cfg.get("dedupe_window", OUTPUT_DEDUPE_WINDOW)
+            OUTPUT_RATE_LIMITS = tts_cfg.get("rate_limits", OUTPUT_RATE_LIMITS)
+            BARGE_IN = tts_cfg.get("barge_in", BARGE_IN)
+            BARGE_IN_THRESHOLD = tts_cfg.get("barge_in_threshold", BARGE_IN_THRESHOLD)
+            PHRASE_CACHE = tts_cfg.get("phrase_cache", PHRASE_CACHE)
+            PHRASE_CACHE_DIR = tts_cfg.get("phrase_cache_dir", PHRASE_CACHE_DIR)
+            PHRASE_CACHE_SIZE = tts_cfg.get("phrase_cache_size", PHRASE_CACHE_SIZE)
             # Recognition settings
             sr_cfg = _cfg.get("speech_recognition", {})
             LANGUAGE = sr_cfg.get("language", LANGUAGE)
             WHISPER_MODEL = sr_cfg.get("whisper_model", WHISPER_MODEL)
+            WHISPER_COMPUTE_TYPE = sr_cfg.get("compute_type", WHISPER_COMPUTE_TYPE)
+            WHISPER_CPU_THREADS = sr_cfg.get("cpu_threads", WHISPER_CPU_THREADS)
+            WHISPER_NUM_WORKERS = sr_cfg.get("num_workers", WHISPER_NUM_WORKERS)
+            WHISPER_BEAM_SIZE = sr_cfg.get("beam_size", WHISPER_BEAM_SIZE)
+            WHISPER_BEST_OF = sr_cfg.get("best_of", WHISPER_BEST_OF)
+            STREAMING_ASR = sr_cfg.get("streaming", STREAMING_ASR)
+            VAD = sr_cfg.get("vad", VAD)
+            PARTIAL_INTERVAL_MS = sr_cfg.get("partial_interval_ms", PARTIAL_INTERVAL_MS)
+            PARTIAL_MIN_CONFIDENCE = sr_cfg.get("partial_min_confidence", PARTIAL_MIN_CONFIDENCE)
+            RECOGNIZER_MODE = sr_cfg.get("mode", RECOGNIZER_MODE)
+            RECOGNIZER_MIN_CONFIDENCE = sr_cfg.get("min_confidence", RECOGNIZER_MIN_CONFIDENCE)
+            RECOGNIZER_FAILURE_THRESHOLD = sr_cfg.get("failure_threshold", RECOGNIZER_FAILURE_THRESHOLD)
+            RECOGNIZER_COOLDOWN = sr_cfg.get("cooldown", RECOGNIZER_COOLDOWN)
+            GOOGLE_TIMEOUT = sr_cfg.get("google_timeout", GOOGLE_TIMEOUT)
+            VOCAB_PROMPT = sr_cfg.get("vocabulary_prompt", VOCAB_PROMPT)
+            VOCAB_HOTWORDS = sr_cfg.get("vocabulary_hotwords", VOCAB_HOTWORDS)
+            SNAP_COMMANDS = sr_cfg.get("snap_commands", SNAP_COMMANDS)
+            SNAP_THRESHOLD = sr_cfg.get("snap_threshold", SNAP_THRESHOLD)
+            ADAPTIVE_ENDPOINTING = sr_cfg.get("adaptive_endpointing", ADAPTIVE_ENDPOINTING)
+            ENDPOINT_SHORT_PAUSE_MS = sr_cfg.get("short_pause_ms", ENDPOINT_SHORT_PAUSE_MS)
+            ENDPOINT_LONG_PAUSE_MS = sr_cfg.get("long_pause_ms", ENDPOINT_LONG_PAUSE_MS)
+            MAX_COMMAND_SECONDS = sr_cfg.get("max_command_seconds", MAX_COMMAND_SECONDS)
+            MAX_DICTATION_SECONDS = sr_cfg.get("max_dictation_seconds", MAX_DICTATION_SECONDS)
+            PERSISTENT_MIC = sr_cfg.get("persistent_mic", PERSISTENT_MIC)
+            MIC_DEVICE_INDEX = sr_cfg.get("device_index", MIC_DEVICE_INDEX)
+            AUDIO_SOURCE = sr_cfg.get("audio_source", AUDIO_SOURCE)
+            REPLAY_PLAYLIST = sr_cfg.get("replay_playlist", REPLAY_PLAYLIST)
+            REPLAY_SPEED = sr_cfg.get("replay_speed", REPLAY_SPEED)
+            # Memory storage
+            mem_cfg = _cfg.get("memory", {})
+            MEMORY_FILE = mem_cfg.get("save_location", MEMORY_FILE)
+            MEMORY_BACKEND = mem_cfg.get("backend", MEMORY_BACKEND)
+            MEMORY_DB_FILE = mem_cfg.get("sqlite_file", MEMORY_DB_FILE)
+            MEMORY_MAX_CONVERSATIONS = mem_cfg.get("max_conversations", MEMORY_MAX_CONVERSATIONS)
+            MEMORY_ARCHIVE_SEGMENT_SIZE = mem_cfg.get("archive_segment_size", MEMORY_ARCHIVE_SEGMENT_SIZE)
+            MEMORY_ARCHIVE_CODEC = mem_cfg.get("archive_codec", MEMORY_ARCHIVE_CODEC)
+            MEMORY_AUTO_SAVE = mem_cfg.get("auto_save", MEMORY_AUTO_SAVE)
+            MEMORY_FLUSH_INTERVAL = mem_cfg.get("flush_interval", MEMORY_FLUSH_INTERVAL)
+            MEMORY_FLUSH_THRESHOLD = mem_cfg.get("flush_threshold", MEMORY_FLUSH_THRESHOLD)
+            MEMORY_REFRESH_INTERVAL = mem_cfg.get("refresh_interval", MEMORY_REFRESH_INTERVAL)
     except Exception as _e:
         print(f"Config load warning: {_e}")
 
 # ====== Memory System ======
 class Memory:
-    def __init__(self, memory_file=Config.MEMORY_FILE):
+    """Owner of the memory store. Use Memory.shared() so every component in the
+    process (assistant, bridge, control panel) reads and writes one instance
+    instead of each holding its own stale copy of the file."""
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, memory_file=None):
+        """Return the process-wide Memory for memory_file, creating it on first use"""
+        memory_file = memory_file or Config.MEMORY_FILE
+        key = os.path.abspath(memory_file)
+        with cls._instances_lock:
+            instance = cls._instances.get(key)
+            if instance is None or instance._closed:
+                instance = cls(memory_file)
+                cls._instances[key] = instance
+            return instance
+
+    def __init__(self, memory_file=Config.MEMORY_FILE, backend=None):
         self.memory_file = memory_file
-        self.memories = self._load_memory()
-        
-    def _load_memory(self):
-        try:
-            if os.path.exists(self.memory_file):
-                with open(self.memory_file, 'r') as f:
-                    return json.load(f)
-            else:
-                return {
-                    "conversations": [],
-                    "preferences": {},
-                    "reminders": [],
-                    "custom_commands": {}
-                }
-        except Exception as e:
-            print(f"Error loading memory: {e}")
-            return {
-                "conversations": [],
-                "preferences": {},
-                "reminders": [],
-                "custom_commands": {}
-            }
+        self.backend = backend or create_memory_backend(
+            Config.MEMORY_BACKEND,
+            memory_file,
+            db_file=Config.MEMORY_DB_FILE,
+            max_conversations=Config.MEMORY_MAX_CONVERSATIONS,
+            archive_segment_size=Config.MEMORY_ARCHIVE_SEGMENT_SIZE,
+            archive_codec=Config.MEMORY_ARCHIVE_CODEC,
+            auto_save=Config.MEMORY_AUTO_SAVE,
+            flush_interval=Config.MEMORY_FLUSH_INTERVAL,
+            flush_threshold=Config.MEMORY_FLUSH_THRESHOLD,
+            refresh_interval=Config.MEMORY_REFRESH_INTERVAL
+        )
+        self._listeners = []
+        self._closed = False
+        self.backend.on_external_change = lambda keys: self._notify("external_change", keys)
+        # Whatever the write-behind flusher still holds is written on interpreter exit
+        atexit.register(self.close)
+
+    def subscribe(self, callback):
+        """Register callback(event, payload) for memory changes: conversation_added,
+        reminder_added, reminders_completed, preference_changed, custom_command_added,
+        and external_change (set of keys another process changed)"""
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, event, payload):
+        for callback in list(self._listeners):
+            try:
+                callback(event, payload)
+            except Exception as e:
+                print(f"Memory listener error: {e}")
     
     def save_memory(self):
-        try:
-            with open(self.memory_file, 'w') as f:
-                json.dump(self.memories, f, indent=4)
-        except Exception as e:
-            print(f"Error saving memory: {e}")
+        self.backend.flush()
+
+    def refresh(self):
+        """Pick up changes other processes wrote to the store"""
+        return self.backend.refresh()
+
+    def get_storage_stats(self):
+        """Write-behind counters: writes avoided, flush latency, queue depth"""
+        return self.backend.stats()
     
     def add_conversation(self, user_input, assistant_response):
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.memories["conversations"].append({
+        entry = self.backend.add_conversation({
             "timestamp": timestamp,
             "user_input": user_input,
-            "assistant_response": assistant_response
+            "assistant_response": str(assistant_response)
         })
-        if len(self.memories["conversations"]) > 100:  # Keep only last 100 conversations
-            self.memories["conversations"] = self.memories["conversations"][-100:]
-        self.save_memory()
+        self._notify("conversation_added", entry)
+        return entry
+
+    def get_recent_conversations(self, limit=10):
+        return self.backend.recent_conversations(limit)
+
+    def search(self, query="", since=None, until=None, limit=20):
+        """Full-text search over past turns, newest first.
+
+        since/until accept datetimes, epoch seconds or 'YYYY-MM-DD HH:MM:SS' strings.
+        """
+        return self.backend.search(query, since=since, until=until, limit=limit)
+
+    def conversation_count(self):
+        return self.backend.conversation_count()
     
     def add_preference(self, key, value):
-        self.memories["preferences"][key] = value
-        self.save_memory()
+        self.backend.set_preference(key, value)
+        self._notify("preference_changed", {"key": key, "value": value})
     
     def get_preference(self, key, default=None):
-        return self.memories["preferences"].get(key, default)
+        return self.backend.get_preferences().get(key, default)
     
     def add_reminder(self, text, time):
-        self.memories["reminders"].append({
+        reminder = self.backend.add_reminder({
             "text": text,
             "time": time,
             "completed": False
         })
-        self.save_memory()
+        self._notify("reminder_added", reminder)
+        return reminder
     
     def get_pending_reminders(self):
-        now = datetime.datetime.now()
-        pending = []
-        for reminder in self.memories["reminders"]:
-            if not reminder["completed"]:
-                reminder_time = datetime.datetime.fromisoformat(reminder["time"])
-                if reminder_time <= now:
-                    pending.append(reminder)
-                    reminder["completed"] = True
-        self.save_memory()
-        return pending
+        due = self.backend.pop_due_reminders(time.time())
+        if due:
+            self._notify("reminders_completed", due)
+        return due
+
+    def get_upcoming_reminders(self):
+        return self.backend.upcoming_reminders()
 
     def add_custom_command(self, command_name, action):
-        self.memories["custom_commands"][command_name] = action
-        self.save_memory()
+        self.backend.set_custom_command(command_name, action)
+        self._notify("custom_command_added", {"name": command_name, "action": action})
 
     def get_custom_command(self, command_name):
-        return self.memories["custom_commands"].get(command_name)
+        return self.backend.get_custom_commands().get(command_name)
+
+    def get_custom_commands(self):
+        return self.backend.get_custom_commands()
+
+    def close(self):
+        self._closed = True
+        self.backend.close()
 
 # ====== Speech Engine ======
+# Fixed responses spoken often enough to pre-render into the phrase cache at startup
+STATIC_RESPONSES = [
+    "Vecna initialized. At your command.",
+    "Vecna is now listening continuously. No wake word needed.",
+    "Volume increased",
+    "Volume decreased",
+    "Audio muted",
+    "Audio unmuted",
+    "Closed the current window",
+    "Closed the current tab",
+    "Switched to the next window",
+    "Switched to the next tab",
+    "Pasted text",
+    "Selected all text",
+    "Undoing last action",
+    "Toggled media playback",
+    "Skipped to next track",
+    "Went back to previous track",
+    "Locking your computer",
+    "Putting computer to sleep",
+    "Opening YouTube",
+    "What should I search for?",
+    "What would you like me to search for?",
+    "What should I type?",
+]
+
+class SpokenResponse(str):
+    """Response text that was already streamed to the speech engine while it was generated,
+    so the usual speak(response) after process_command doesn't say it twice"""
+
+    def __new__(cls, text, stream):
+        value = super().__new__(cls, text)
+        value.stream = stream
+        return value
+
 class SpeechEngine:
+    """Front end for the TTS worker: speak() only queues, so callers never block on synthesis"""
+
     def __init__(self):
-        self.engine = pyttsx3.init()
-        self.engine.setProperty('rate', Config.VOICE_RATE)
-        self.engine.setProperty('volume', Config.VOICE_VOLUME)
-        self._lock = threading.Lock()
-        self._queue = []
-        self._speaking = False
+        cache = None
+        if Config.PHRASE_CACHE:
+            try:
+                cache = PhraseCache(Config.PHRASE_CACHE_DIR, max_entries=Config.PHRASE_CACHE_SIZE)
+            except OSError as e:
+                print(f"Phrase cache disabled: {e}")
+        # wav and null run headless (no sound card); null also skips synthesis entirely
+        self.backend = create_tts_backend(Config.TTS_BACKEND, self._create_engine, output_dir=Config.TTS_OUTPUT_DIR)
+        self.worker = TTSWorker(self.backend, cache=cache)
+        self.worker.start()
+        self.arbiter = OutputArbiter(
+            self.speak, self.worker.queue_depth,
+            max_queue=Config.OUTPUT_QUEUE_SIZE,
+            dedupe_window=Config.OUTPUT_DEDUPE_WINDOW,
+            rate_limits=Config.OUTPUT_RATE_LIMITS
+        )
+        self.arbiter.start()
+
+    @staticmethod
+    def _create_engine():
+        # Runs on the worker thread, which owns the engine for its whole life
+        engine = pyttsx3.init()
+        engine.setProperty('rate', Config.VOICE_RATE)
+        engine.setProperty('volume', Config.VOICE_VOLUME)
         
         # Get available voices and set a more natural one if available
-        voices = self.engine.getProperty('voices')
+        voices = engine.getProperty('voices')
         for voice in voices:
             if "english" in voice.name.lower() and "female" in voice.name.lower():
-                self.engine.setProperty('voice', voice.id)
+                engine.setProperty('voice', voice.id)
                 break
+        return engine
     
-    def speak(self, text):
+    def speak(self, text, priority=PRIORITY_NORMAL):
+        """Queue text; reminders and alerts (PRIORITY_URGENT) interrupt chatter.
+
+        text may also be an iterator of text pieces (e.g. a streaming LLM answer):
+        it is spoken sentence by sentence as it arrives and a SpeechStream is returned.
+        """
+        if isinstance(text, SpokenResponse):
+            return text.stream
+        if not isinstance(text, str):
+            return self.worker.speak_stream(
+                text, priority, on_sentence=lambda sentence: print(f"Vecna: {sentence}")
+            )
         print(f"Vecna: {text}")
-        # Ensure thread-safe TTS: queue text and process sequentially
-        with self._lock:
-            self._queue.append(text)
-            if not self._speaking:
-                self._speaking = True
-                threading.Thread(target=self._drain_queue, daemon=True).start()
-
-    def _drain_queue(self):
-        while True:
-            with self._lock:
-                if not self._queue:
-                    self._speaking = False
-                    return
-                next_text = self._queue.pop(0)
-            try:
-                self.engine.say(next_text)
-                self.engine.runAndWait()
-            except Exception as e:
-                print(f"TTS error: {e}")
+        return self.worker.speak(text, priority)
+    
+    def announce(self, text, source="response", priority=PRIORITY_NORMAL, status=False):
+        """Speak through the output arbiter: repeats are collapsed, a newer status
+        replaces a waiting one from the same source and noisy sources are rate limited"""
+        return self.arbiter.submit(text, source, priority, status)
+
+    def prewarm(self, phrases=STATIC_RESPONSES):
+        """Render phrases into the cache in the background"""
+        self.worker.prewarm(phrases)
+
+    def stop(self):
+        """Silence Vecna now: cut the current utterance and drop everything queued"""
+        self.arbiter.clear()
+        self.worker.flush()
+        return self.worker.cancel()
+
+    def flush(self):
+        """Drop queued utterances but let the current one finish"""
+        return self.worker.flush()
+
+    def barge_in(self):
+        """The user started talking: stop speaking and drop stale chatter, keep reminders"""
+        if self.worker.cancel():
+            dropped = self.worker.flush(keep_urgent=True)
+            print(f"🛑 Barge-in: stopped speaking, dropped {dropped} queued")
+
+    def is_speaking(self):
+        return self.worker.is_speaking()
     
     def configure_voice(self, rate=None, volume=None, voice_id=None):
-        if rate is not None:
-            self.engine.setProperty('rate', rate)
-        if volume is not None:
-            self.engine.setProperty('volume', volume)
-        if voice_id is not None:
-            self.engine.setProperty('voice', voice_id)
+        self.worker.configure(rate=rate, volume=volume, voice=voice_id)
+
+    def voices(self):
+        return self.worker.voices()
+
+    def get_metrics(self):
+        """Queue depth, wait time, synthesis time and stop latency of the TTS worker,
+        plus what the output arbiter forwarded and dropped"""
+        metrics = self.worker.stats()
+        metrics["output"] = self.arbiter.stats()
+        return metrics
+
+
+class BargeInMonitor:
+    """Listens to the microphone while Vecna speaks and cancels playback when the
+    user talks over it, so the next command is heard straight away."""
+
+    RATE = 16000
+    CHUNK = 480  # 30 ms frames
+
+    def __init__(self, speech_engine, capture=None):
+        self.speech_engine = speech_engine
+        self.capture = capture
+        self.detector = BargeInDetector(speech_engine.barge_in, min_threshold=Config.BARGE_IN_THRESHOLD)
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="barge-in", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def _run(self):
+        frame_ms = self.CHUNK * 1000 // self.RATE
+        while self._running:
+            if not self.speech_engine.is_speaking():
+                time.sleep(0.05)
+                continue
+            try:
+                self.detector.reset()
+                if self.capture is not None and self.capture.running:
+                    # Share the always-open capture rather than opening the device again
+                    reader = self.capture.reader()
+                    while self._running and self.speech_engine.is_speaking():
+                        frame = reader.read_frame(timeout=0.1)
+                        if frame is not None:
+                            self.detector.feed(frame, self.capture.frame_ms)
+                    continue
+                with sr.Microphone(sample_rate=self.RATE, chunk_size=self.CHUNK) as source:
+                    while self._running and self.speech_engine.is_speaking():
+                        self.detector.feed(source.stream.read(self.CHUNK), frame_ms)
+            except Exception as e:
+                print(f"Barge-in monitor error: {e}")
+                time.sleep(1)
 
 # ====== Speech Recognition ======
 class SpeechRecognizer:
@@ -261,80 +551,188 @@ class SpeechRecognizer:
         self.recognizer.pause_threshold = 0.8
         # Add a small amount of ambient noise adjustment
         self.recognizer.dynamic_energy_adjustment_damping = 0.15
-        # Increase the timeout duration
+        # Without a timeout an offline request hangs for the OS connect timeout
+        self.recognizer.operation_timeout = Config.GOOGLE_TIMEOUT
+        # Increase the timeout duration (command length limit when adaptive endpointing is off)
         self.phrase_timeout = 3
+        self._calibrated = False
+        self.last_timings = {}  # Per-stage Whisper timings of the last recognize()
         
-        # Initialize Whisper if available (much better for accented English)
-        self.whisper_model = None
-        if Config.USE_WHISPER and WHISPER_AVAILABLE:
+        # One always-open capture thread replaces a device open + calibration per listen.
+        # The replay source feeds recordings through the same buffer instead
+        self.capture = None
+        if Config.AUDIO_SOURCE == "replay" or (Config.PERSISTENT_MIC and PYAUDIO_AVAILABLE):
             try:
-                # Prefer 'base' or 'small' model for better English recognition
-                preferred_model = "base" if Config.WHISPER_MODEL == "tiny" else Config.WHISPER_MODEL
-                # Initialize whisper model (language will be inferred)
-                self.whisper_model = WhisperModel(preferred_model, device="cpu")
-                print(f"Initialized Whisper with {preferred_model} model specifically for English")
+                self.capture = create_audio_source(
+                    Config.AUDIO_SOURCE,
+                    device_index=Config.MIC_DEVICE_INDEX,
+                    playlist=Config.REPLAY_PLAYLIST,
+                    speed=Config.REPLAY_SPEED
+                ).start()
             except Exception as e:
-                print(f"Error initializing Whisper: {e}")
-    
-    def listen(self):
-        with sr.Microphone() as source:
-            print("🎤 Listening...")
-            # Longer adjustment for better calibration
-            self.recognizer.adjust_for_ambient_noise(source, duration=1)
+                print(f"Audio source unavailable: {e}")
+        
+        # Decides when a command is over from the partial transcript and the user's pace
+        self.endpointer = None
+        if Config.ADAPTIVE_ENDPOINTING:
+            self.endpointer = Endpointer(
+                pause_ms=int(self.recognizer.pause_threshold * 1000),
+                short_pause_ms=Config.ENDPOINT_SHORT_PAUSE_MS,
+                long_pause_ms=Config.ENDPOINT_LONG_PAUSE_MS,
+                max_ms=int(Config.MAX_COMMAND_SECONDS * 1000),
+                dictation_max_ms=int(Config.MAX_DICTATION_SECONDS * 1000)
+            )
+        
+        # Initialize Whisper if available (much better for accented English).
+        # It loads and warms up in the background; Google covers the first seconds
+        self.whisper = None
+        if Config.USE_WHISPER and WHISPER_AVAILABLE:
+            # Prefer 'base' or 'small' model for better English recognition
+            preferred_model = "base" if Config.WHISPER_MODEL == "tiny" else Config.WHISPER_MODEL
+            self.whisper = WhisperRuntime(
+                preferred_model,
+                compute_type=Config.WHISPER_COMPUTE_TYPE,
+                cpu_threads=Config.WHISPER_CPU_THREADS,
+                num_workers=Config.WHISPER_NUM_WORKERS,
+                beam_size=Config.WHISPER_BEAM_SIZE,
+                best_of=Config.WHISPER_BEST_OF
+            ).start()
+        
+        # Streaming mode decodes from the capture while the user is still talking
+        self.streamer = None
+        if Config.STREAMING_ASR and self.whisper is not None and self.capture is not None:
+            self.streamer = StreamingTranscriber(
+                self.whisper, self.capture,
+                vad=create_vad(Config.VAD, self.capture),
+                partial_interval_ms=Config.PARTIAL_INTERVAL_MS,
+                min_confidence=Config.PARTIAL_MIN_CONFIDENCE,
+                pause_ms=int(self.recognizer.pause_threshold * 1000)
+            )
+        
+        # Whisper first (best for accents), then Google; a failing engine is skipped for a while
+        engines = [WhisperEngine(self.whisper)] if self.whisper is not None else []
+        engines.append(GoogleEngine(self.recognizer, language=Config.LANGUAGE))
+        self.orchestrator = RecognizerOrchestrator(
+            engines,
+            mode=Config.RECOGNIZER_MODE,
+            min_confidence=Config.RECOGNIZER_MIN_CONFIDENCE,
+            failure_threshold=Config.RECOGNIZER_FAILURE_THRESHOLD,
+            cooldown=Config.RECOGNIZER_COOLDOWN
+        )
+    
+    def set_device(self, device_index):
+        """Switch the microphone used by the persistent capture and the fallback path"""
+        Config.MIC_DEVICE_INDEX = device_index
+        self._calibrated = False
+        if self.capture is not None:
+            self.capture.set_device(device_index)
+
+    def capture_audio(self, timeout=5, phrase_time_limit=None):
+        """Next utterance as AudioData, or None if nobody spoke within timeout.
+
+        Reads from the always-open capture; without PyAudio it falls back to opening
+        the microphone, calibrating only on the first listen. Without a
+        phrase_time_limit the endpointer decides when the utterance is over; its
+        session rides along as audio.endpoint for recognize() to report on.
+        """
+        if self.capture is not None and self.capture.running:
+            endpoint = None
+            if phrase_time_limit is None and self.endpointer is not None:
+                endpoint = self.endpointer.begin()
+            pcm = self.capture.listen(timeout=timeout, phrase_time_limit=phrase_time_limit,
+                                      pause_ms=int(self.recognizer.pause_threshold * 1000), endpoint=endpoint)
+            if not pcm:
+                return None
+            audio = sr.AudioData(pcm, self.capture.rate, SAMPLE_WIDTH)
+            audio.endpoint = endpoint
+            return audio
+        if phrase_time_limit is None and self.endpointer is not None:
+            phrase_time_limit = self.endpointer.max_ms / 1000.0
+        mic_kwargs = {}
+        if Config.MIC_DEVICE_INDEX is not None:
+            mic_kwargs['device_index'] = Config.MIC_DEVICE_INDEX
+        with sr.Microphone(**mic_kwargs) as source:
+            if not self._calibrated:
+                # dynamic_energy_threshold keeps tracking the noise from here on
+                self.recognizer.adjust_for_ambient_noise(source, duration=1)
+                self._calibrated = True
             try:
-                print("Speak now...")
-                # Increase timeout for those who speak more slowly
-                audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=self.phrase_timeout)
-                print("Processing speech...")
-                return audio
+                return self.recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
             except sr.WaitTimeoutError:
-                print("No speech detected")
                 return None
-    
-    def recognize(self, audio):
+
+    def listen(self, timeout=5, phrase_time_limit=None):
+        print("🎤 Listening...")
+        print("Speak now...")
+        if phrase_time_limit is None and self.endpointer is None:
+            phrase_time_limit = self.phrase_timeout
+        audio = self.capture_audio(timeout=timeout, phrase_time_limit=phrase_time_limit)
         if audio is None:
-            return ""
-            
-        # Try multiple recognition methods in order of accuracy
-        text = ""
-        
-        # First try Whisper if available (best for accents)
-        if not Config.OFFLINE_MODE and WHISPER_AVAILABLE and self.whisper_model:
+            print("No speech detected")
+            return None
+        print("Processing speech...")
+        return audio
+    
+    def listen_and_recognize(self, timeout=5, phrase_time_limit=None, accept=None, on_partial=None):
+        """Listen for one command and return its text ("" if nothing was understood).
+
+        In streaming mode partial hypotheses go to on_partial and a confident partial
+        that accept(text) calls complete ends the command early; otherwise this is
+        listen() followed by recognize().
+        """
+        if self.streamer is not None and self.whisper.available and not Config.OFFLINE_MODE:
+            endpoint = None
+            if phrase_time_limit is None and self.endpointer is not None:
+                endpoint = self.endpointer.begin(is_complete=accept)
+            elif phrase_time_limit is None:
+                phrase_time_limit = self.phrase_timeout
             try:
-                temp_file = "temp_audio.wav"
-                with open(temp_file, "wb") as f:
-                    f.write(audio.get_wav_data())
-                
-                # Use more aggressive beam search for better accuracy
-                segments, _ = self.whisper_model.transcribe(temp_file, beam_size=5, language="en")
-                text = " ".join([segment.text for segment in segments])
-                
-                # Clean up
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-                
-                if text.strip():
-                    print(f"Whisper recognized: '{text}'")
-                    return text
+                hypothesis = self.streamer.transcribe_stream(timeout, phrase_time_limit, on_partial, accept,
+                                                             endpoint=endpoint)
+                if hypothesis is None:
+                    return ""
+                if hypothesis.text:
+                    how = "early" if hypothesis.early else "final"
+                    print(f"Whisper recognized ({how}): '{hypothesis.text}'")
+                return hypothesis.text
             except Exception as e:
-                print(f"Error with Whisper recognition: {e}")
-                # Fall through to next method
-        
-        # Then try Google (with language explicitly set to English)
-        if not text:
-            try:
-                # Explicitly set to English for better recognition
-                text = self.recognizer.recognize_google(audio, language='en-US')
-                print(f"Google recognized: '{text}'")
-                return text
-            except sr.UnknownValueError:
-                print("Google couldn't understand audio")
-            except sr.RequestError:
-                print("Network error with Google recognition")
-                # Note: network error, continue without changing global config
-        
-        # If all methods failed
-        return text or ""
+                print(f"Error with streaming recognition: {e}")
+                return ""
+        return self.recognize(self.listen(timeout, phrase_time_limit))
+    
+    def recognize(self, audio, decode=None):
+        """Text of the audio from the first engine that understood it ("" if none did).
+
+        decode overrides Whisper's decoding for this utterance only.
+        """
+        if audio is None:
+            return ""
+        if self.whisper is not None and not self.whisper.ready.is_set():
+            print("Whisper still loading, using Google")
+        skip = ("whisper",) if Config.OFFLINE_MODE else ()
+        endpoint = getattr(audio, "endpoint", None)
+        if endpoint is not None:
+            endpoint.asr_started()
+        try:
+            text, engine = self.orchestrator.recognize(audio, skip=skip, decode=decode)
+        except Exception as e:
+            print(f"Error in speech recognition: {e}")
+            return ""
+        if endpoint is not None:
+            endpoint.finish(text)
+        if not engine:
+            print("Couldn't understand audio")
+            return ""
+        if engine == "whisper":
+            self.last_timings = t = self.whisper.last_timings
+            print(f"Whisper timings: {t['audio_ms']:.0f} ms audio, convert {t['convert_ms']:.1f} ms, "
+                  f"resample {t['resample_ms']:.1f} ms, transcribe {t['transcribe_ms']:.0f} ms")
+        print(f"{engine.capitalize()} recognized: '{text}'")
+        return text
+    
+    def recognize_wake_word(self, audio):
+        """recognize() with a cheap greedy decode prompted only with the wake words"""
+        return self.recognize(audio, decode=dict(WAKE_WORD_DECODE, initial_prompt=", ".join(Config.WAKE_WORDS)))
 
 # ====== System Controller ======
 class SystemController:
@@ -592,6 +990,7 @@ class Intelligence:
         self.memory = memory
         self.openai_client = None
         self.gemini_model = None
+        self.retriever = None
         
         # Initialize AI services
         if Config.USE_LLM:
@@ -601,29 +1000,53 @@ class Intelligence:
             elif Config.LLM_TYPE == "gemini" and GEMINI_AVAILABLE and Config.GEMINI_API_KEY:
                 genai.configure(api_key=Config.GEMINI_API_KEY)
                 self.gemini_model = genai.GenerativeModel('gemini-pro')
-    
-    def generate_response(self, query, system_context=""):
-        # Simple responses without LLM
-        if not Config.USE_LLM or (not self.openai_client and not self.gemini_model):
-            return None
         
-        # Get recent conversation history
-        conversation_history = self.memory.memories["conversations"][-5:]
+        # Relevance-ranked history is only worth indexing when there is an LLM to feed
+        if self.openai_client or self.gemini_model:
+            try:
+                self.retriever = ContextRetriever(memory, create_embedder(Config.CONTEXT_EMBEDDER))
+            except Exception as e:
+                print(f"Context retrieval unavailable, using recent turns: {e}")
+    
+    def available(self):
+        return Config.USE_LLM and bool(self.openai_client or self.gemini_model)
+    
+    def _select_history(self, query):
+        # Pick the past turns most relevant to this query, within the token budget
+        if self.retriever:
+            return self.retriever.select(
+                query, k=Config.CONTEXT_TURNS, token_budget=Config.CONTEXT_TOKEN_BUDGET
+            )
+        return self.memory.get_recent_conversations(Config.CONTEXT_TURNS)
+    
+    def _build_context(self, query, system_context):
+        conversation_history = self._select_history(query)
         conversation_context = ""
         for conv in conversation_history:
             conversation_context += f"User: {conv['user_input']}\nAssistant: {conv['assistant_response']}\n"
         
         # Create a complete prompt with system context and conversation history
-        full_context = f"{system_context}\n\nConversation History:\n{conversation_context}\n\nUser: {query}\nAssistant:"
+        return f"{system_context}\n\nConversation History:\n{conversation_context}\n\nUser: {query}\nAssistant:"
+    
+    def _build_messages(self, query, system_context):
+        # The same selected turns as chat messages, oldest first, ahead of the query
+        messages = [{"role": "system", "content": system_context}]
+        for conv in self._select_history(query):
+            messages.append({"role": "user", "content": conv['user_input']})
+            messages.append({"role": "assistant", "content": conv['assistant_response']})
+        messages.append({"role": "user", "content": query})
+        return messages
+    
+    def generate_response(self, query, system_context=""):
+        # Simple responses without LLM
+        if not self.available():
+            return None
         
         try:
             if Config.LLM_TYPE == "openai" and self.openai_client:
                 response = self.openai_client.chat.completions.create(
                     model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": system_context},
-                        {"role": "user", "content": query}
-                    ],
+                    messages=self._build_messages(query, system_context),
                     max_tokens=150,
                     temperature=0.7
                 )
@@ -631,7 +1054,7 @@ class Intelligence:
                 return content.strip() if isinstance(content, str) else str(content)
             
             elif Config.LLM_TYPE == "gemini" and self.gemini_model:
-                response = self.gemini_model.generate_content(full_context)
+                response = self.gemini_model.generate_content(self._build_context(query, system_context))
                 return response.text.strip()
             
             else:
@@ -639,6 +1062,32 @@ class Intelligence:
         except Exception as e:
             print(f"Error generating AI response: {e}")
             return None
+    
+    def stream_response(self, query, system_context=""):
+        """Yield the AI response in pieces as the model produces them"""
+        if not self.available():
+            return
+        
+        try:
+            if Config.LLM_TYPE == "openai" and self.openai_client:
+                response = self.openai_client.chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=self._build_messages(query, system_context),
+                    max_tokens=150,
+                    temperature=0.7,
+                    stream=True
+                )
+                for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            
+            elif Config.LLM_TYPE == "gemini" and self.gemini_model:
+                for chunk in self.gemini_model.generate_content(self._build_context(query, system_context),
+                                                                stream=True):
+                    if chunk.text:
+                        yield chunk.text
+        except Exception as e:
+            print(f"Error generating AI response: {e}")
 
 # ====== Command Processor ======
 class CommandProcessor:
@@ -648,6 +1097,9 @@ class CommandProcessor:
         self.memory = memory
         self.intelligence = intelligence
         self.commands = {
+            # History lookups first so "what did I open/search for..." isn't routed to open/search
+            "search history": self._handle_history_search,
+            "what did i": self._handle_history_search,
             "open": self._handle_open,
             "open youtube": self._handle_open_youtube,
             "search youtube": self._handle_search_youtube,
@@ -692,7 +1144,105 @@ class CommandProcessor:
             "window": self._handle_window_management,
             "file": self._handle_file_operation
         }
+        
+        # Known command phrases bias Whisper and catch near misses before they reach the LLM
+        self.plugin_manager = None
+        self.vocabulary = CommandVocabulary(self._collect_vocabulary, threshold=Config.SNAP_THRESHOLD,
+                                            hotwords=Config.VOCAB_HOTWORDS)
+        if self.memory is not None:
+            self.memory.subscribe(self._on_memory_change)
+    
+    def _collect_vocabulary(self):
+        """(whole command phrases, command prefixes that take an argument)"""
+        phrases = set(self.COMPLETE_COMMANDS)
+        phrases.update(f"open {name}" for name in Config.APP_PATHS)
+        phrases.update(f"open {name}" for name in Config.FOLDER_PATHS)
+        if self.memory is not None:
+            phrases.update(self.memory.get_custom_commands())
+        prefixes = set(self.commands)
+        if self.plugin_manager is not None:
+            for commands in self.plugin_manager.get_all_commands().values():
+                prefixes.update(commands)
+        return phrases, prefixes
+    
+    def _on_memory_change(self, event, payload):
+        if event in ("custom_command_added", "external_change"):
+            self.vocabulary.refresh()
+    
+    def set_plugin_manager(self, plugin_manager):
+        """Include plugin commands in the vocabulary and follow plugin changes"""
+        self.plugin_manager = plugin_manager
+        plugin_manager.add_listener(self.vocabulary.refresh)
+        self.vocabulary.refresh()
+    
+    # Other ways of saying a command, matched anywhere in the transcript
+    COMMAND_ALIASES = {
+        "screenshot": "take screenshot",
+        "screen shot": "take screenshot", 
+        "screen capture": "take screenshot",
+        "volume up": "set volume up",
+        "volume down": "set volume down",
+        "mute": "set volume mute",
+        "unmute": "set volume unmute",
+        "shutdown": "shutdown computer",
+        "restart": "restart computer", 
+        "sleep": "sleep computer",
+        "time": "what time",
+        "date": "what date",
+        "day": "what day",
+        "tell me a joke": "joke",
+        "joke": "tell joke",
+        "weather": "get weather",
+        "system": "system info",
+        "info": "system info"
+    }
     
+    def matches_as_heard(self, command):
+        """True when process_command() would route command to a command without snapping it"""
+        command_lower = command.lower().strip()
+        return (any(name.lower() in command_lower for name in self.memory.get_custom_commands())
+                or any(key.lower() in command_lower for key in self.commands)
+                or any(alias in command_lower for alias in self.COMMAND_ALIASES))
+    
+    def snap_command(self, command):
+        """command, or the known command it was most likely meant to be.
+        
+        Only a transcript that no command matches as heard is snapped, so speech
+        that already routes somewhere ("what a time", "open word pad") is kept.
+        """
+        if not Config.SNAP_COMMANDS or self.matches_as_heard(command):
+            return command
+        snapped = self.vocabulary.snap(command)
+        if snapped != command:
+            print(f"Heard '{command}', using '{snapped}'")
+        return snapped
+    
+    # Commands that take no argument: complete as soon as they are heard
+    COMPLETE_COMMANDS = {
+        "copy", "paste", "select all", "undo", "take screenshot", "screenshot", "system info",
+        "play", "pause", "next track", "previous track", "lock computer", "what time is it",
+        "what's the time", "what date is it", "what day is it", "switch window", "switch tab",
+        "close tab", "close window", "close", "mute", "unmute", "volume up", "volume down"
+    }
+
+    def is_complete_command(self, text):
+        """True when text is a whole command that can run before the user stops talking.
+
+        Only exact phrases count (a known argument-free command, "open <known app or
+        folder>", or a custom command name), so dictation like "type ..." or
+        "search for ..." always waits for the end of the utterance.
+        """
+        if Config.SNAP_COMMANDS and not self.matches_as_heard(text):
+            text = self.vocabulary.snap(text, record=False)
+        text = normalize_text(text)
+        if text in self.COMPLETE_COMMANDS:
+            return True
+        if text.startswith("open "):
+            target = text[len("open "):].replace(" folder", "").strip()
+            if target in Config.APP_PATHS or target in Config.FOLDER_PATHS:
+                return True
+        return any(normalize_text(name) == text for name in self.memory.get_custom_commands())
+
     def _handle_open(self, command):
         if "folder" in command:
             folder_name = command.replace("open", "").replace("folder", "").strip()
@@ -741,6 +1291,30 @@ class CommandProcessor:
         else:
             return "What would you like me to search for?"
     
+    def _handle_history_search(self, command):
+        # e.g., "what did I search for yesterday", "search history for weather"
+        today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+        since, until = None, None
+        if "yesterday" in command:
+            since, until = today - datetime.timedelta(days=1), today
+        elif "today" in command:
+            since = today
+        elif "last week" in command or "this week" in command:
+            since = today - datetime.timedelta(days=7)
+        
+        query = re.sub(r"\b(search history( for)?|what did i|yesterday|today|last week|this week)\b", " ", command)
+        query = query.strip(" ?.")
+        if query in ("say", "ask", "tell you", "do"):
+            query = ""
+        
+        results = self.memory.search(query, since=since, until=until, limit=3)
+        if not results:
+            return "I couldn't find anything like that in your history."
+        said = "; ".join(
+            f"at {r['timestamp'][11:16]} you said '{r['user_input'].strip()}'" for r in results
+        )
+        return f"I found {len(results)} matching {'entry' if len(results) == 1 else 'entries'}: {said}"
+    
     def _handle_volume(self, command):
         if "up" in command:
             keyboard.press_and_release('volume up')
@@ -787,10 +1361,11 @@ class CommandProcessor:
             return "Please specify a brightness level between 0 and 100"
     
     def process_command(self, command):
+        command = self.snap_command(command)
         command_lower = command.lower().strip()
         
         # Check for custom commands
-        custom_commands = self.memory.memories["custom_commands"]
+        custom_commands = self.memory.get_custom_commands()
         for cmd_name, action in custom_commands.items():
             if cmd_name.lower() in command_lower:
                 return f"Executing custom command: {cmd_name}", action
@@ -805,30 +1380,8 @@ class CommandProcessor:
                 except Exception as e:
                     return f"Error executing command: {e}", None
         
-        # Additional command variations and aliases
-        command_aliases = {
-            "screenshot": "take screenshot",
-            "screen shot": "take screenshot", 
-            "screen capture": "take screenshot",
-            "volume up": "set volume up",
-            "volume down": "set volume down",
-            "mute": "set volume mute",
-            "unmute": "set volume unmute",
-            "shutdown": "shutdown computer",
-            "restart": "restart computer", 
-            "sleep": "sleep computer",
-            "time": "what time",
-            "date": "what date",
-            "day": "what day",
-            "tell me a joke": "joke",
-            "joke": "tell joke",
-            "weather": "get weather",
-            "system": "system info",
-            "info": "system info"
-        }
-        
         # Check aliases
-        for alias, actual_command in command_aliases.items():
+        for alias, actual_command in self.COMMAND_ALIASES.items():
             if alias in command_lower:
                 if actual_command in self.commands:
                     try:
@@ -857,7 +1410,15 @@ class CommandProcessor:
         Be concise, helpful, and a bit mysterious. Keep responses under 50 words when possible.
         """
         
-        ai_response = self.intelligence.generate_response(command, system_context)
+        if Config.STREAM_RESPONSES and self.speech_engine is not None and self.intelligence.available():
+            # Speak the first sentence while the rest is still generating
+            stream = self.speech_engine.speak(self.intelligence.stream_response(command, system_context))
+            text = stream.result().strip()
+            if text:
+                return SpokenResponse(text, stream), None
+            ai_response = None
+        else:
+            ai_response = self.intelligence.generate_response(command, system_context)
         if ai_response:
             return ai_response, None
         else:
@@ -1158,28 +1719,21 @@ class WakeWordDetector:
     def listen_for_wake_word(self):
         while True:
             try:
-                with sr.Microphone() as source:
-                    print("Listening for wake word...")
-                    self.recognizer.recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                    audio = self.recognizer.recognizer.listen(source, phrase_time_limit=3)
+                print("Listening for wake word...")
+                audio = self.recognizer.capture_audio(timeout=None, phrase_time_limit=3)
+                if audio is None:
+                    continue
                 
-                try:
-                    # Use Google Speech Recognition for wake word detection
-                    text = self.recognizer.recognizer.recognize_google(audio).lower()
-                    print(f"Potential wake word: {text}")
-                    
-                    for wake_word in self.wake_words:
-                        if wake_word in text:
-                            print(f"Wake word detected: {wake_word}")
-                            return True
+                # The orchestrator skips Google while it is unreachable
+                text = self.recognizer.recognize_wake_word(audio).lower()
+                if not text:
+                    continue
+                print(f"Potential wake word: {text}")
                 
-                except sr.UnknownValueError:
-                    # Speech not understood, continue listening
-                    pass
-                except sr.RequestError:
-                    print("Could not request results from Google Speech Recognition service")
-                    # Switch to offline mode if network error
-                    # Note: network error, continuing without changing Config
+                for wake_word in self.wake_words:
+                    if wake_word in text:
+                        print(f"Wake word detected: {wake_word}")
+                        return True
                     
             except Exception as e:
                 print(f"Error in wake word detection: {e}")
@@ -1189,22 +1743,44 @@ class WakeWordDetector:
 class VecnaAssistant:
     def __init__(self):
         # Initialize components
-        self.memory = Memory()
+        self.memory = Memory.shared()
         self.speech_engine = SpeechEngine()
+        self.speech_engine.prewarm()
         self.recognizer = SpeechRecognizer()
         self.system = SystemController()
         self.intelligence = Intelligence(self.memory)
         self.command_processor = CommandProcessor(self.speech_engine, self.system, self.memory, self.intelligence)
         
-        # Check for pending reminders
-        self._check_reminders()
+        # Reminders fire at their due time, including ones added mid-session;
+        # anything already overdue is announced as soon as the scheduler starts
+        self.reminder_scheduler = ReminderScheduler(self.memory)
+        self.reminder_scheduler.add_listener(self._announce_reminders)
+        self.reminder_scheduler.start()
+        
+        # Speaking-rate profiles carry over between sessions. They are saved every few
+        # minutes and at exit (registered after Memory's, so it runs before memory closes)
+        if self.recognizer.endpointer is not None:
+            self.recognizer.endpointer.load_profiles(self.memory.get_preference("speaking_profiles", {}))
+            self.recognizer.endpointer.on_update = lambda profiles: self.memory.add_preference("speaking_profiles", profiles)
+            atexit.register(self.recognizer.endpointer.save)
+        
+        if Config.VOCAB_PROMPT and self.recognizer.whisper is not None:
+            self.command_processor.vocabulary.bind(self.recognizer.whisper)
+        
+        # With recorded input, time each response from the end of the recording that asked for it
+        if isinstance(self.recognizer.capture, ReplayCapture):
+            self.speech_engine.worker.on_first_audio = self.recognizer.capture.record_response
+        
+        self.barge_in_monitor = None
+        if Config.BARGE_IN and self.speech_engine.backend.audible:
+            self.barge_in_monitor = BargeInMonitor(self.speech_engine, self.recognizer.capture)
+            self.barge_in_monitor.start()
     
-    def _check_reminders(self):
-        pending = self.memory.get_pending_reminders()
-        if pending:
-            self.speech_engine.speak(f"You have {len(pending)} pending reminders.")
-            for reminder in pending:
-                self.speech_engine.speak(reminder["text"])
+    def _announce_reminders(self, pending):
+        if len(pending) > 1:
+            self.speech_engine.speak(f"You have {len(pending)} pending reminders.", PRIORITY_URGENT)
+        for reminder in pending:
+            self.speech_engine.speak(f"Reminder: {reminder['text']}", PRIORITY_URGENT)
     
     def _show_pyaudio_install_options(self):
         """Display multiple options for installing PyAudio"""
@@ -1227,9 +1803,10 @@ class VecnaAssistant:
         # Check if required packages are installed
         missing_packages = []
         
-        # Check for PyAudio which is required by SpeechRecognition
+        # Check for PyAudio which is required by SpeechRecognition (not when replaying recordings)
         try:
-            import pyaudio
+            if Config.AUDIO_SOURCE == "microphone":
+                import pyaudio
         except ImportError:
             print("\n============== IMPORTANT NOTICE ==============")
             print("PyAudio is required for microphone access but is not installed.")
@@ -1291,18 +1868,20 @@ class VecnaAssistant:
                     print(f"Failed to install {package}")
         
         # Startup message
-        self.speech_engine.speak(f"Vecna initialized. At your command.")
+        self.speech_engine.speak(f"Vecna initialized. At your command.", PRIORITY_CHATTER)
     
     def run(self):
         self.startup()
-        self.speech_engine.speak("Vecna is now listening continuously. No wake word needed.")
+        self.speech_engine.speak("Vecna is now listening continuously. No wake word needed.", PRIORITY_CHATTER)
         
         while True:
             # Listen for command directly - no wake word needed
             print("🎤 Listening for command...")
             try:
-                audio = self.recognizer.listen()
-                command = self.recognizer.recognize(audio)
+                command = self.recognizer.listen_and_recognize(
+                    accept=self.command_processor.is_complete_command,
+                    on_partial=lambda partial: print(f"  … {partial.text}")
+                )
                 
                 if command:
                     print(f"You said: {command}")
@@ -0,0 +1,941 @@
+"""
+Vecna ASR - faster-whisper runtime
+Loads the Whisper model on a background thread with the configured compute type
+and thread counts, runs one warm-up inference so the first real command is not
+the slow one, and transcribes audio in memory with per-stage timings. The
+streaming transcriber re-decodes the utterance while it is being spoken and
+emits partial hypotheses, so a command can run before the user stops talking.
+The orchestrator runs several engines (Whisper, Google) in sequence or as a
+race, behind per-engine circuit breakers so an unreachable service is skipped
+instead of costing a network timeout on every utterance. The command
+vocabulary biases Whisper towards known command phrases and snaps near-miss
+transcripts onto them. The endpointer decides when an utterance is over from
+what has been said so far and how the user usually speaks.
+"""
+
+import re
+import math
+import time
+import socket
+import difflib
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from vecna_audio import pcm_to_float32, resample_float32, SAMPLE_RATE, SAMPLE_WIDTH, NUMPY_AVAILABLE
+from vecna_speech import latency_summary
+
+# Optional imports - Whisper is skipped (Google is used) when missing
+try:
+    from faster_whisper import WhisperModel
+    WHISPER_AVAILABLE = True
+except ImportError:
+    WHISPER_AVAILABLE = False
+
+try:
+    import speech_recognition as sr
+    SPEECH_RECOGNITION_AVAILABLE = True
+except ImportError:
+    SPEECH_RECOGNITION_AVAILABLE = False
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+
+COMPUTE_TYPES = ("int8", "int8_float16", "int8_float32", "float16", "float32", "default")
+
+
+class WhisperRuntime:
+    """One faster-whisper model plus the decoding options used with it.
+
+    start() loads in the background and sets `ready` when done (also on failure,
+    check `available`); load() does the same synchronously. model_factory
+    defaults to faster_whisper.WhisperModel.
+    """
+
+    def __init__(self, model_name="base", device="cpu", compute_type="int8", cpu_threads=0,
+                 num_workers=1, beam_size=5, best_of=5, language="en", warmup=True, model_factory=None):
+        if compute_type not in COMPUTE_TYPES:
+            print(f"Unknown Whisper compute_type '{compute_type}', using int8")
+            compute_type = "int8"
+        self.model_name = model_name
+        self.device = device
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.num_workers = num_workers
+        self.beam_size = beam_size
+        self.best_of = best_of
+        self.language = language
+        self.warmup = warmup
+        self._model_factory = model_factory
+        self.model = None
+        self.error = None
+        self.ready = threading.Event()
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.last_timings = {}
+        self.decode_options = {}  # extra decoding options, e.g. the vocabulary's initial_prompt
+        self._thread = None
+
+    @property
+    def available(self):
+        return self.ready.is_set() and self.model is not None
+
+    def start(self):
+        """Load the model on a background thread; returns immediately"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.load, name="whisper-load", daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """Block until loading finished; True if the model is usable"""
+        self.ready.wait(timeout)
+        return self.available
+
+    def load(self):
+        try:
+            start = time.perf_counter()
+            factory = self._model_factory or WhisperModel
+            self.model = factory(self.model_name, device=self.device, compute_type=self.compute_type,
+                                 cpu_threads=self.cpu_threads, num_workers=self.num_workers)
+            self.load_seconds = time.perf_counter() - start
+            if self.warmup:
+                self._warm_up()
+            print(f"Initialized Whisper with {self.model_name} model ({self.compute_type}, "
+                  f"load {self.load_seconds:.1f} s, warm-up {self.warmup_seconds or 0:.1f} s)")
+        except Exception as e:
+            self.error = e
+            self.model = None
+            print(f"Error initializing Whisper: {e}")
+        finally:
+            self.ready.set()
+        return self.available
+
+    def _warm_up(self):
+        # One second of silence runs the encoder and a decoder step, so kernels,
+        # thread pools and caches are set up before the first real command
+        start = time.perf_counter()
+        segments, _ = self.model.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32), beam_size=1,
+                                            language=self.language)
+        for _ in segments:
+            pass
+        self.warmup_seconds = time.perf_counter() - start
+
+    def transcribe(self, samples, **options):
+        """Transcribe 16 kHz float32 samples; options override the configured decoding"""
+        return self.transcribe_detailed(samples, **options)[0]
+
+    def transcribe_detailed(self, samples, cancel=None, vocabulary=True, **options):
+        """Like transcribe(), also returning a 0..1 confidence from the segments' log-probabilities.
+
+        Setting the cancel event stops decoding at the next segment boundary.
+        vocabulary=False leaves out decode_options (the command prompt and hotwords).
+        """
+        kwargs = {"beam_size": self.beam_size, "best_of": self.best_of, "language": self.language}
+        if vocabulary:
+            kwargs.update(self.decode_options)
+        kwargs.update(options)
+        segments, _ = self.model.transcribe(samples, **kwargs)
+        # segments is lazy: decoding happens while it is iterated
+        decoded = []
+        for segment in segments:
+            decoded.append(segment)
+            if cancel is not None and cancel.is_set():
+                break
+        segments = decoded
+        if not segments:
+            return "", 0.0
+        confidence = sum(
+            math.exp(getattr(s, "avg_logprob", 0.0)) * (1.0 - getattr(s, "no_speech_prob", 0.0))
+            for s in segments
+        ) / len(segments)
+        return " ".join([segment.text for segment in segments]), confidence
+
+    def transcribe_pcm(self, pcm, sample_rate, sample_width, **options):
+        """Transcribe raw PCM in memory: PCM -> float32 -> 16 kHz -> model, no temp file"""
+        return self.transcribe_pcm_detailed(pcm, sample_rate, sample_width, **options)[0]
+
+    def transcribe_pcm_detailed(self, pcm, sample_rate, sample_width, cancel=None, **options):
+        """transcribe_pcm() returning (text, confidence)"""
+        start = time.perf_counter()
+        samples = pcm_to_float32(pcm, sample_width)
+        converted = time.perf_counter()
+        samples = resample_float32(samples, sample_rate, SAMPLE_RATE)
+        resampled = time.perf_counter()
+        text, confidence = self.transcribe_detailed(samples, cancel=cancel, **options)
+        done = time.perf_counter()
+        self.last_timings = {
+            "audio_ms": round(len(samples) * 1000 / SAMPLE_RATE, 1),
+            "convert_ms": round((converted - start) * 1000, 2),
+            "resample_ms": round((resampled - converted) * 1000, 2),
+            "transcribe_ms": round((done - resampled) * 1000, 1),
+            "total_ms": round((done - start) * 1000, 1)
+        }
+        return text, confidence
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "compute_type": self.compute_type,
+            "ready": self.ready.is_set(),
+            "available": self.available,
+            "load_s": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            "warmup_s": round(self.warmup_seconds, 2) if self.warmup_seconds is not None else None,
+            "last": dict(self.last_timings)
+        }
+
+
+def normalize_text(text):
+    """Lowercase words without punctuation, for comparing hypotheses"""
+    return " ".join(re.findall(r"[a-z0-9']+", text.lower()))
+
+
+def word_errors(reference, hypothesis):
+    """(substitutions + deletions + insertions, reference words) after normalize_text"""
+    ref, hyp = normalize_text(reference).split(), normalize_text(hypothesis).split()
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1], len(ref)
+
+
+class Hypothesis:
+    """A transcription of (part of) an utterance"""
+
+    def __init__(self, text, final=False, confidence=0.0, audio_ms=0, stable=False, early=False):
+        self.text = text
+        self.final = final
+        self.confidence = confidence
+        self.audio_ms = audio_ms
+        self.stable = stable   # same words as the previous partial
+        self.early = early     # final taken from a partial before the user stopped talking
+
+    def __repr__(self):
+        kind = "final" if self.final else "partial"
+        return f"Hypothesis({kind}, {self.text!r}, confidence={self.confidence:.2f})"
+
+
+class StreamingTranscriber:
+    """VAD-segmented, incrementally decoded transcription from an AudioCapture.
+
+    While an utterance is being spoken the audio so far is decoded every
+    partial_interval_ms with a cheap greedy pass, and once more as soon as the
+    speaker pauses for early_pause_ms, producing partial hypotheses. A partial
+    is stable when it was taken at such a pause or is unchanged since the
+    previous one. A stable partial of at least min_confidence that accept(text)
+    calls a complete command is returned at once as an early final, instead of
+    waiting out the full pause_ms. Otherwise the utterance is decoded once more
+    with the full beam when the VAD reports its end.
+    """
+
+    def __init__(self, runtime, capture, vad=None, partial_interval_ms=600, min_confidence=0.6,
+                 pause_ms=800, early_pause_ms=240, pre_roll_ms=300, min_speech_ms=90):
+        self.runtime = runtime
+        self.capture = capture
+        self.vad = vad
+        self.partial_interval_ms = partial_interval_ms
+        self.min_confidence = min_confidence
+        self.pause_ms = pause_ms
+        self.early_pause_ms = early_pause_ms
+        self.pre_roll_ms = pre_roll_ms
+        self.min_speech_ms = min_speech_ms
+        self.utterances = 0
+        self.partials = 0
+        self.early_finals = 0
+        self.last = {}
+
+    def _samples(self, frames):
+        return resample_float32(pcm_to_float32(b"".join(frames), SAMPLE_WIDTH), self.capture.rate, SAMPLE_RATE)
+
+    def transcribe_stream(self, timeout=5.0, phrase_time_limit=10.0, on_partial=None, accept=None, endpoint=None):
+        """Transcribe the next utterance; returns the final Hypothesis or None if nobody spoke.
+
+        on_partial(hypothesis) is called for every partial; accept(text) -> bool
+        decides whether a confident partial may end the utterance early. An
+        EndpointSession sees every partial and sets the pause that ends the utterance.
+        """
+        frame_ms = self.capture.frame_ms
+        frames, previous, next_partial_ms, trailing = [], None, self.partial_interval_ms, 0
+        fresh = False  # speech arrived since the last decode
+        started = time.perf_counter()
+        for frame, voiced in self.capture.utterance(timeout, phrase_time_limit, self.pause_ms,
+                                                    self.pre_roll_ms, self.min_speech_ms, self.vad, endpoint):
+            frames.append(frame)
+            trailing = 0 if voiced else trailing + frame_ms
+            fresh = fresh or voiced
+            audio_ms = len(frames) * frame_ms
+            paused = trailing >= self.early_pause_ms
+            # Re-decoding the same audio plus more silence adds nothing, so only new speech counts
+            if not fresh or not (paused or (not trailing and audio_ms >= next_partial_ms)):
+                continue
+            fresh = False
+            next_partial_ms = audio_ms + self.partial_interval_ms
+            decode_started = time.perf_counter()
+            text, confidence = self.runtime.transcribe_detailed(self._samples(frames), beam_size=1, best_of=1)
+            text = text.strip()
+            if not text:
+                continue
+            if endpoint is not None:
+                endpoint.update(text)
+            stable = paused or (previous is not None and normalize_text(text) == normalize_text(previous))
+            previous = text
+            partial = Hypothesis(text, confidence=confidence, audio_ms=audio_ms, stable=stable)
+            self.partials += 1
+            if on_partial is not None:
+                on_partial(partial)
+            if stable and confidence >= self.min_confidence and accept is not None and accept(text):
+                partial.final = partial.early = True
+                self.early_finals += 1
+                return self._finish(partial, started, endpoint, decode_started)
+
+        if not frames:
+            return None
+        # Drop the silence that ended the utterance before the final decode
+        keep = len(frames) - max(0, trailing - 200) // frame_ms
+        decode_started = time.perf_counter()
+        text, confidence = self.runtime.transcribe_detailed(self._samples(frames[:keep]))
+        return self._finish(Hypothesis(text.strip(), True, confidence, keep * frame_ms), started,
+                            endpoint, decode_started)
+
+    def _finish(self, hypothesis, started, endpoint=None, decode_started=None):
+        if endpoint is not None:
+            endpoint.asr_started(decode_started)
+            endpoint.finish(hypothesis.text)
+        self.utterances += 1
+        self.last = {
+            "text": hypothesis.text,
+            "early": hypothesis.early,
+            "audio_ms": hypothesis.audio_ms,
+            "confidence": round(hypothesis.confidence, 3),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+        return hypothesis
+
+    def stats(self):
+        return {
+            "utterances": self.utterances,
+            "partials": self.partials,
+            "early_finals": self.early_finals,
+            "last": dict(self.last)
+        }
+
+
+# ====== Recognizer Orchestrator ======
+class RecognitionError(Exception):
+    """An engine failed (network, quota, model error) rather than hearing nothing"""
+
+
+class CircuitBreaker:
+    """Skips an engine after repeated failures.
+
+    After failure_threshold consecutive failures the breaker opens for cooldown
+    seconds. With a probe function a background thread then checks the engine
+    (repeating every cooldown until it passes) and closes the breaker, so no real
+    utterance is spent on testing; without one the next call after the cool-down
+    is let through as a trial.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, name, failure_threshold=3, cooldown=30.0, probe=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.probe = probe
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._lock = threading.Lock()
+        self._probing = False
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.probe is None and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN  # exactly one trial call
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.trips += 1
+                print(f"Recognizer '{self.name}' unavailable, skipping it for {self.cooldown:.0f} s")
+                start_probe = self.probe is not None and not self._probing
+                self._probing = self._probing or start_probe
+            else:
+                start_probe = False
+        if start_probe:
+            threading.Thread(target=self._probe_loop, name=f"probe-{self.name}", daemon=True).start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.cooldown)
+            try:
+                healthy = self.probe()
+            except Exception:
+                healthy = False
+            if healthy:
+                with self._lock:
+                    self.state = self.CLOSED
+                    self.failures = 0
+                    self._probing = False
+                print(f"Recognizer '{self.name}' is back")
+                return
+
+
+class RecognitionEngine(ABC):
+    """Adapter around one recognizer: recognize(audio, cancel) -> (text, confidence).
+
+    Raise RecognitionError for failures that should count against the circuit
+    breaker; return ("", 0.0) when the audio simply contained no words.
+    """
+
+    name = "base"
+
+    def ready(self):
+        return True
+
+    @abstractmethod
+    def recognize(self, audio, cancel=None, decode=None):
+        """decode: Whisper decoding overrides for this call; other engines ignore it"""
+        pass
+
+    def probe(self):
+        """Cheap health check used while the breaker is open; None = no probe"""
+        return None
+
+
+class WhisperEngine(RecognitionEngine):
+    name = "whisper"
+
+    def __init__(self, runtime):
+        self.runtime = runtime
+
+    def ready(self):
+        # Still loading is not a failure; the engine is just skipped for now
+        return self.runtime.available
+
+    def recognize(self, audio, cancel=None, decode=None):
+        try:
+            text, confidence = self.runtime.transcribe_pcm_detailed(
+                audio.get_raw_data(), audio.sample_rate, audio.sample_width, cancel=cancel, **(decode or {}))
+        except Exception as e:
+            raise RecognitionError(str(e))
+        return text.strip(), confidence
+
+
+class GoogleEngine(RecognitionEngine):
+    """Google Web Speech through speech_recognition (needs network)"""
+
+    name = "google"
+    PROBE_HOST = ("www.google.com", 443)
+
+    def __init__(self, recognizer, language="en-US"):
+        self.recognizer = recognizer
+        self.language = language
+
+    def recognize(self, audio, cancel=None, decode=None):
+        try:
+            result = self.recognizer.recognize_google(audio, language=self.language, show_all=True)
+        except sr.RequestError as e:
+            raise RecognitionError(str(e))
+        except sr.UnknownValueError:
+            return "", 0.0
+        if not result or not result.get("alternative"):
+            return "", 0.0
+        best = result["alternative"][0]
+        # Google omits confidence on some results; treat those as fairly sure
+        return best.get("transcript", "").strip(), best.get("confidence", 0.8)
+
+    def probe(self):
+        with socket.create_connection(self.PROBE_HOST, timeout=2):
+            return True
+
+
+# Wake-word listening decodes every ambient utterance, so it runs greedy and
+# without the command vocabulary prompt
+WAKE_WORD_DECODE = {"beam_size": 1, "best_of": 1, "vocabulary": False}
+
+
+class RecognizerOrchestrator:
+    """Runs recognition engines behind circuit breakers.
+
+    mode "sequential" tries engines in order until one hears something; mode
+    "race" starts all of them at once and takes the first result with at least
+    min_confidence, cancelling the rest (Whisper stops at the next segment; an
+    HTTP request in flight is left to finish and its result ignored). If no
+    result is confident enough, the most confident non-empty one wins.
+    """
+
+    MODES = ("sequential", "race")
+
+    def __init__(self, engines, mode="sequential", min_confidence=0.5, failure_threshold=3, cooldown=30.0):
+        if mode not in self.MODES:
+            print(f"Unknown recognizer mode '{mode}', using sequential")
+            mode = "sequential"
+        self.engines = list(engines)
+        self.mode = mode
+        self.min_confidence = min_confidence
+        self.breakers = {
+            engine.name: CircuitBreaker(engine.name, failure_threshold, cooldown,
+                                        engine.probe if type(engine).probe is not RecognitionEngine.probe else None)
+            for engine in self.engines
+        }
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(self.engines)), thread_name_prefix="recognizer")
+        self._counters = {engine.name: {"calls": 0, "wins": 0, "failures": 0, "skipped": 0} for engine in self.engines}
+        self._latencies = {engine.name: [] for engine in self.engines}
+        self._lock = threading.Lock()
+        self.last = {}
+
+    def _usable(self, skip):
+        usable = []
+        for engine in self.engines:
+            if engine.name in skip or not engine.ready():
+                continue
+            if not self.breakers[engine.name].allow():
+                with self._lock:
+                    self._counters[engine.name]["skipped"] += 1
+                continue
+            usable.append(engine)
+        return usable
+
+    def _run(self, engine, audio, cancel, decode=None):
+        start = time.perf_counter()
+        with self._lock:
+            self._counters[engine.name]["calls"] += 1
+        try:
+            text, confidence = engine.recognize(audio, cancel, decode)
+        except RecognitionError as e:
+            self.breakers[engine.name].record_failure()
+            with self._lock:
+                self._counters[engine.name]["failures"] += 1
+            print(f"{engine.name} recognition error: {e}")
+            return None
+        elapsed = time.perf_counter() - start
+        self.breakers[engine.name].record_success()
+        with self._lock:
+            samples = self._latencies[engine.name]
+            samples.append(elapsed)
+            if len(samples) > 200:
+                del samples[0]
+        return text, confidence, elapsed
+
+    def recognize(self, audio, skip=(), decode=None):
+        """Return (text, engine name); ("", None) when no engine heard anything.
+
+        decode overrides Whisper's decoding for this call, e.g. WAKE_WORD_DECODE.
+        """
+        engines = self._usable(skip)
+        if not engines:
+            return "", None
+        if self.mode == "race" and len(engines) > 1:
+            return self._race(engines, audio, decode)
+        for engine in engines:
+            result = self._run(engine, audio, None, decode)
+            if result and result[0]:
+                return self._won(engine, *result)
+        return "", None
+
+    def _race(self, engines, audio, decode=None):
+        cancel = threading.Event()
+        futures = {self._pool.submit(self._run, engine, audio, cancel, decode): engine for engine in engines}
+        pending, fallback = set(futures), None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if not result or not result[0]:
+                        continue
+                    if result[1] >= self.min_confidence:
+                        return self._won(futures[future], *result)
+                    if fallback is None or result[1] > fallback[1][1]:
+                        fallback = (futures[future], result)
+        finally:
+            cancel.set()
+        if fallback is not None:
+            return self._won(fallback[0], *fallback[1])
+        return "", None
+
+    def _won(self, engine, text, confidence, elapsed):
+        with self._lock:
+            self._counters[engine.name]["wins"] += 1
+        self.last = {"engine": engine.name, "confidence": round(confidence, 3),
+                     "latency_ms": round(elapsed * 1000, 1)}
+        return text, engine.name
+
+    def stats(self):
+        with self._lock:
+            engines = {
+                name: dict(counters, breaker=self.breakers[name].state, trips=self.breakers[name].trips,
+                           latency=latency_summary(self._latencies[name]))
+                for name, counters in self._counters.items()
+            }
+        return {"mode": self.mode, "engines": engines, "last": dict(self.last)}
+
+
+# ====== Command Vocabulary ======
+_PHONETIC_RULES = (
+    (r"[^a-z]", ""), (r"^kn|^gn|^wr", lambda m: m.group(0)[1]), (r"ph", "f"), (r"ck", "k"),
+    (r"sch", "sk"), (r"chr", "kr"), (r"tch|ch|sh", "x"), (r"c(?=[eiy])", "s"), (r"[cq]", "k"), (r"x", "ks"),
+    (r"dg", "j"), (r"gh", ""), (r"z", "s"), (r"th", "0"), (r"v", "f"), (r"(?<=.)[aeiouyhw]", ""),
+    (r"(.)\1+", r"\1")
+)
+
+
+def phonetic_key(word):
+    """Rough sound-alike key of one word ("crome" and "chrome" both give "krm")"""
+    key = word.lower()
+    for pattern, replacement in _PHONETIC_RULES:
+        key = re.sub(pattern, replacement, key)
+    return key
+
+
+def _sounds_like(a, b):
+    """0..1 similarity of two normalized phrases, half spelling and half sound"""
+    spelling = difflib.SequenceMatcher(None, a, b).ratio()
+    keys = lambda text: " ".join(phonetic_key(word) for word in text.split())
+    sound = difflib.SequenceMatcher(None, keys(a), keys(b)).ratio()
+    return (spelling + sound) / 2
+
+
+def _word_for_word(a, b, floor=0.5):
+    """_sounds_like() for phrases of the same length whose every word still resembles
+    its counterpart, else 0: "what a" is not a near miss of "what day"."""
+    words_a, words_b = a.split(), b.split()
+    if len(words_a) != len(words_b):
+        return 0.0
+    if any(x != y and _sounds_like(x, y) < floor for x, y in zip(words_a, words_b)):
+        return 0.0
+    return _sounds_like(a, b)
+
+
+class CommandVocabulary:
+    """The phrases Vecna understands, as Whisper decoding hints and a snapping target.
+
+    collect() returns (phrases, prefixes): phrases are whole commands ("take
+    screenshot", "open chrome", custom command names), prefixes are command
+    words that take an argument ("search for", "type"). refresh() recompiles the
+    initial prompt (and optional hotwords) and pushes them to bound Whisper
+    runtimes; call it whenever plugins or custom commands change.
+    """
+
+    def __init__(self, collect, max_prompt_words=100, threshold=0.8, hotwords=False):
+        self.collect = collect
+        self.max_prompt_words = max_prompt_words
+        self.threshold = threshold
+        self.hotwords = hotwords
+        self.phrases = set()
+        self.prefixes = set()
+        self.prompt = ""
+        self.version = 0
+        self.snapped = 0
+        self._runtimes = []
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def bind(self, runtime):
+        """Keep runtime.decode_options in step with the vocabulary"""
+        self._runtimes.append(runtime)
+        runtime.decode_options = self.decode_options()
+
+    def refresh(self):
+        try:
+            phrases, prefixes = self.collect()
+        except Exception as e:
+            print(f"Error collecting command vocabulary: {e}")
+            return
+        phrases = {normalize_text(p) for p in phrases} - {""}
+        prefixes = {normalize_text(p) for p in prefixes} - {""}
+        # Shortest phrases first: they are the most common commands and cover the
+        # words longer ones repeat, so the prompt budget reaches the most vocabulary
+        words, seen = [], set()
+        for phrase in sorted(phrases | prefixes, key=lambda p: (len(p.split()), p)):
+            if len(words) + len(phrase.split()) > self.max_prompt_words:
+                break
+            if phrase not in seen:
+                seen.add(phrase)
+                words += phrase.split()
+        prompt = ", ".join(p for p in sorted(seen, key=lambda p: (len(p.split()), p)))
+        with self._lock:
+            self.phrases, self.prefixes = phrases, prefixes
+            self.prompt = f"Voice commands: {prompt}." if prompt else ""
+            self.version += 1
+        options = self.decode_options()
+        for runtime in self._runtimes:
+            runtime.decode_options = options
+
+    def decode_options(self):
+        if not self.prompt:
+            return {}
+        options = {"initial_prompt": self.prompt}
+        if self.hotwords:
+            # faster-whisper >= 1.0; distinct words, not the full phrases
+            words = dict.fromkeys(word for phrase in sorted(self.phrases | self.prefixes) for word in phrase.split())
+            options["hotwords"] = " ".join(words)
+        return options
+
+    def snap(self, text, record=True):
+        """text mapped onto the closest known command when it is a near miss, else unchanged.
+
+        A whole transcript snaps to a known phrase ("open crome" -> "open chrome");
+        otherwise its leading words may snap to a multi-word command prefix
+        ("serch for cats" -> "search for cats"). Snapping is word for word, so a
+        transcript never gains or loses words ("open word pad" stays as heard).
+        Anything already known is kept. record=False leaves the snapped counter
+        alone (for partial hypotheses).
+        """
+        normalized = normalize_text(text)
+        with self._lock:
+            phrases, prefixes = self.phrases, self.prefixes
+        if not normalized or normalized in phrases:
+            return text
+        words = normalized.split()
+        # After a known prefix only its own phrases are candidates, so "type pasta" stays dictation
+        heard = [prefix for prefix in prefixes if normalized.startswith(prefix + " ")]
+        best, score = None, self.threshold
+        for phrase in phrases:
+            if heard and not any(phrase.startswith(prefix + " ") for prefix in heard):
+                continue
+            similarity = _word_for_word(normalized, phrase)
+            if similarity >= score:
+                best, score = phrase, similarity
+        # Dictation and searches ("type ...", "search for ...") keep their argument as heard
+        if best is None and not heard:
+            for prefix in prefixes:
+                size = len(prefix.split())
+                if size < 2 or len(words) <= size:
+                    continue
+                head = " ".join(words[:size])
+                similarity = _word_for_word(head, prefix)
+                if similarity >= score:
+                    best, score = " ".join([prefix] + words[size:]), similarity
+        if best is None:
+            return text
+        if record:
+            self.snapped += 1
+        return best
+
+    def stats(self):
+        return {"phrases": len(self.phrases), "prefixes": len(self.prefixes),
+                "prompt_words": len(self.prompt.split()), "version": self.version, "snapped": self.snapped}
+
+
+# ====== Adaptive Endpointing ======
+DICTATION_PREFIXES = ("type", "write", "search for", "search youtube", "search windows for", "search google",
+                      "google", "remind me", "note")
+
+
+class SpeakingProfile:
+    """How one user talks: words per second and the pauses they leave inside a sentence"""
+
+    def __init__(self, sample_size=200):
+        self.utterances = 0
+        self.words_per_second = None
+        self.gaps = deque(maxlen=sample_size)  # ms of silence between voiced runs
+
+    def gap_percentile(self, p):
+        if not self.gaps:
+            return None
+        ordered = sorted(self.gaps)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    def to_dict(self):
+        return {"utterances": self.utterances, "words_per_second": self.words_per_second, "gaps": list(self.gaps)}
+
+    @classmethod
+    def from_dict(cls, data, sample_size=200):
+        profile = cls(sample_size)
+        profile.utterances = data.get("utterances", 0)
+        profile.words_per_second = data.get("words_per_second")
+        profile.gaps.extend(data.get("gaps", []))
+        return profile
+
+
+class Endpointer:
+    """Chooses when an utterance is over instead of fixed pause and length limits.
+
+    The pause that ends an utterance follows the partial transcript: short_pause_ms
+    after a complete command (is_complete(text)), at least long_pause_ms after a
+    dictation prefix such as "type" or "search for", otherwise pause_ms - or, once
+    min_utterances utterances have been heard, 1.3x the user's 90th percentile
+    inner pause when that is longer, so slow speakers are not cut off. Silences
+    shorter than min_gap_ms are gaps between words, not pauses, and are ignored.
+    Utterances are capped at max_ms (dictation_max_ms for dictation).
+    begin() returns the session a listen feeds; finish() updates the profile.
+    """
+
+    def __init__(self, pause_ms=800, short_pause_ms=300, long_pause_ms=1600, max_pause_ms=2000,
+                 max_ms=15000, dictation_max_ms=45000, dictation_prefixes=DICTATION_PREFIXES,
+                 min_gap_ms=180, min_utterances=5, sample_size=200, save_interval=300.0):
+        self.pause_ms = pause_ms
+        self.short_pause_ms = short_pause_ms
+        self.long_pause_ms = long_pause_ms
+        self.max_pause_ms = max_pause_ms
+        self.max_ms = max_ms
+        self.dictation_max_ms = dictation_max_ms
+        self.dictation_prefixes = tuple(normalize_text(prefix) for prefix in dictation_prefixes)
+        self.min_gap_ms = min_gap_ms
+        self.min_utterances = min_utterances
+        self.sample_size = sample_size
+        self.save_interval = save_interval
+        self.profiles = {}
+        self.on_update = None  # called with export_profiles() by save()
+        self.endings = {"complete": 0, "dictation": 0, "default": 0, "limit": 0}
+        self._asr_gaps = deque(maxlen=sample_size)
+        self._unsaved = False
+        self._last_save = time.monotonic()
+        self._lock = threading.Lock()
+
+    def profile(self, user="default"):
+        with self._lock:
+            if user not in self.profiles:
+                self.profiles[user] = SpeakingProfile(self.sample_size)
+            return self.profiles[user]
+
+    def base_pause_ms(self, user="default"):
+        """The user's ordinary end-of-utterance pause; never shorter than pause_ms"""
+        profile = self.profile(user)
+        if profile.utterances < self.min_utterances or not profile.gaps:
+            return self.pause_ms
+        return int(min(self.max_pause_ms, max(self.pause_ms, profile.gap_percentile(0.9) * 1.3)))
+
+    def begin(self, user="default", is_complete=None):
+        return EndpointSession(self, user, is_complete)
+
+    def is_dictation(self, text):
+        text = normalize_text(text)
+        return any(text == prefix or text.startswith(prefix + " ") for prefix in self.dictation_prefixes)
+
+    def finish(self, session, text):
+        """Learn from a finished utterance: its inner pauses and, given the text, its speaking rate"""
+        profile = self.profile(session.user)
+        words = len(normalize_text(text).split()) if text else 0
+        with self._lock:
+            self.endings[session.ending or "default"] += 1
+            profile.utterances += 1
+            profile.gaps.extend(session.gaps)
+            if words and session.voiced_ms:
+                rate = words / (session.voiced_ms / 1000.0)
+                previous = profile.words_per_second
+                profile.words_per_second = round(rate if previous is None else previous + (rate - previous) * 0.2, 2)
+            self._unsaved = True
+            due = time.monotonic() - self._last_save >= self.save_interval
+        if due:
+            self.save()
+
+    def save(self):
+        """Hand changed profiles to on_update; finish() calls it every save_interval, callers at shutdown"""
+        with self._lock:
+            if not self._unsaved or self.on_update is None:
+                return
+            self._unsaved = False
+            self._last_save = time.monotonic()
+        self.on_update(self.export_profiles())
+
+    def asr_started(self, session, at=None):
+        """Record the gap between the end of speech and the start of the decode that was used"""
+        if session.speech_end is None:
+            return
+        at = time.perf_counter() if at is None else at
+        with self._lock:
+            self._asr_gaps.append(max(0.0, at - session.speech_end))
+
+    def export_profiles(self):
+        with self._lock:
+            return {user: profile.to_dict() for user, profile in self.profiles.items()}
+
+    def load_profiles(self, data):
+        with self._lock:
+            for user, profile in (data or {}).items():
+                self.profiles[user] = SpeakingProfile.from_dict(profile, self.sample_size)
+
+    def stats(self):
+        with self._lock:
+            users = {user: {"utterances": profile.utterances, "words_per_second": profile.words_per_second,
+                            "gap_p90_ms": profile.gap_percentile(0.9)}
+                     for user, profile in self.profiles.items()}
+            gaps = list(self._asr_gaps)
+            endings = dict(self.endings)
+        for user in users:
+            users[user]["pause_ms"] = self.base_pause_ms(user)
+        return {"users": users, "endings": endings, "speech_end_to_asr": latency_summary(gaps)}
+
+
+class EndpointSession:
+    """Endpointing state of one utterance; AudioCapture.utterance() feeds it every frame"""
+
+    def __init__(self, endpointer, user="default", is_complete=None):
+        self.endpointer = endpointer
+        self.user = user
+        self.is_complete = is_complete
+        self.text = ""
+        self.ending = None
+        self.gaps = []
+        self.voiced_ms = 0
+        self.speech_end = None  # perf_counter time the last voiced frame arrived
+        self.state = "default"  # what the partial transcript says: complete, dictation or default
+        self._silence_ms = 0
+        self._total_ms = 0
+        self._base_pause_ms = endpointer.base_pause_ms(user)
+
+    def update(self, text):
+        """A new partial transcript; classified here once rather than on every frame"""
+        self.text = text or ""
+        self.state = "default"
+        if self.text:
+            if self.endpointer.is_dictation(self.text):
+                self.state = "dictation"
+            elif self.is_complete is not None and self.is_complete(self.text):
+                self.state = "complete"
+
+    def asr_started(self, at=None):
+        self.endpointer.asr_started(self, at)
+
+    def finish(self, text):
+        self.endpointer.finish(self, text)
+
+    def feed(self, voiced, frame_ms):
+        self._total_ms += frame_ms
+        if voiced:
+            if self._silence_ms >= self.endpointer.min_gap_ms and self.voiced_ms:
+                self.gaps.append(self._silence_ms)  # a pause the speaker resumed after
+            self._silence_ms = 0
+            self.voiced_ms += frame_ms
+            self.speech_end = time.perf_counter()
+        else:
+            self._silence_ms += frame_ms
+
+    def pause_ms(self):
+        state = self.state
+        if state == "complete":
+            pause = self.endpointer.short_pause_ms
+        elif state == "dictation":
+            pause = max(self.endpointer.long_pause_ms, self._base_pause_ms)
+        else:
+            pause = self._base_pause_ms
+        if self._silence_ms >= pause:
+            self.ending = state
+        return pause
+
+    def limit_ms(self):
+        limit = self.endpointer.dictation_max_ms if self.state == "dictation" else self.endpointer.max_ms
+        if self._total_ms >= limit:
+            self.ending = "limit"
+        return limit
@@ -0,0 +1,621 @@
+"""
+Vecna Audio - always-open microphone capture
+One thread keeps the input device open and writes 16 kHz mono PCM into a ring
+buffer. Listeners (command recognition, wake word, bridge, barge-in) read
+utterance windows from the buffer instead of reopening the device, so nothing
+the user says between two listens is lost. Ambient noise is calibrated once at
+startup and then tracked continuously from non-speech frames. The replay
+source writes recorded WAV/PCM files into the same ring at real-time or
+accelerated speed, so the whole pipeline can be driven and timed headless.
+"""
+
+import os
+import math
+import time
+import wave
+import threading
+from array import array
+from collections import deque
+
+from vecna_speech import frame_rms, latency_summary
+
+# Optional imports - capture needs PyAudio, buffering and endpointing do not;
+# webrtcvad refines voice detection; the in-memory Whisper path needs NumPy
+# (a faster-whisper dependency anyway)
+try:
+    import pyaudio
+    PYAUDIO_AVAILABLE = True
+except ImportError:
+    PYAUDIO_AVAILABLE = False
+
+try:
+    import webrtcvad
+    WEBRTCVAD_AVAILABLE = True
+except ImportError:
+    WEBRTCVAD_AVAILABLE = False
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2  # 16-bit PCM
+
+
+def resample_pcm16(data, src_rate, dst_rate):
+    """Linear-interpolation resample of mono 16-bit PCM; good enough for speech"""
+    if src_rate == dst_rate or not data:
+        return data
+    samples = array('h')
+    samples.frombytes(data[:len(data) - len(data) % 2])
+    count = int(len(samples) * dst_rate / src_rate)
+    step = src_rate / dst_rate
+    last = len(samples) - 1
+    out = array('h', bytes(2 * count))
+    for i in range(count):
+        pos = i * step
+        j = int(pos)
+        frac = pos - j
+        k = j + 1 if j < last else last
+        out[i] = int(samples[j] + (samples[k] - samples[j]) * frac)
+    return out.tobytes()
+
+
+def pcm_to_float32(data, sample_width=SAMPLE_WIDTH):
+    """Mono PCM bytes (8/16/24/32-bit) to a float32 NumPy array in [-1, 1)"""
+    if sample_width == 1:
+        return (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    if sample_width == 2:
+        return np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.0
+    if sample_width == 3:
+        raw = np.frombuffer(data[:len(data) - len(data) % 3], dtype=np.uint8).reshape(-1, 3)
+        samples = raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) | (raw[:, 2].astype(np.int32) << 16)
+        samples = np.where(samples >= 1 << 23, samples - (1 << 24), samples)
+        return samples.astype(np.float32) / float(1 << 23)
+    if sample_width == 4:
+        return np.frombuffer(data, dtype='<i4').astype(np.float32) / float(1 << 31)
+    raise ValueError(f"Unsupported sample width: {sample_width}")
+
+
+def resample_float32(samples, src_rate, dst_rate=SAMPLE_RATE):
+    """Resample a float32 array in memory (box low-pass, then linear interpolation)"""
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples
+    ratio = src_rate / dst_rate
+    if ratio > 1:
+        # Average over the decimation ratio so high frequencies do not alias into speech
+        width = int(math.ceil(ratio))
+        samples = np.convolve(samples, np.full(width, 1.0 / width, dtype=np.float32), mode='same')
+    count = int(round(len(samples) / ratio))
+    positions = np.arange(count, dtype=np.float64) * ratio
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+class RingBuffer:
+    """Fixed-size byte ring for one writer and any number of readers, without locks.
+
+    The writer first advances `reserved` past the bytes it is about to write,
+    copies them in, and only then advances `written` (each a single int
+    assignment, atomic under the GIL). Readers keep their own absolute positions
+    and copy out of [pos, written); a reader that falls more than `capacity`
+    bytes behind `reserved` has been overrun and skips to the oldest data.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self.written = 0   # total bytes ever written
+        self.reserved = 0  # written plus the bytes of a write in progress
+
+    def write(self, data):
+        data = bytes(data)
+        end = self.written + len(data)
+        # Claim the bytes before overwriting them, so a reader copying them meanwhile sees it was overrun
+        self.reserved = end
+        if len(data) > self.capacity:
+            data = data[-self.capacity:]
+        start = (end - len(data)) % self.capacity
+        first = min(len(data), self.capacity - start)
+        self._buffer[start:start + first] = data[:first]
+        self._buffer[:len(data) - first] = data[first:]
+        self.written = end
+
+    def oldest(self):
+        """Oldest position that no write, finished or in progress, has overwritten"""
+        return max(0, self.reserved - self.capacity)
+
+    def read(self, pos, size):
+        """Copy up to size bytes starting at absolute position pos; returns (data, next pos)"""
+        while True:
+            pos = max(pos, self.oldest())
+            end = min(pos + size, self.written)
+            if end <= pos:
+                return b"", pos
+            start = pos % self.capacity
+            first = min(end - pos, self.capacity - start)
+            data = bytes(self._buffer[start:start + first]) + bytes(self._buffer[:end - pos - first])
+            # If the writer lapped us mid-copy the data is torn; retry from the new oldest
+            if pos >= self.oldest():
+                return data, end
+
+
+class AudioReader:
+    """A cursor into an AudioCapture's ring; each listener owns one"""
+
+    def __init__(self, capture, pos):
+        self.capture = capture
+        self.pos = pos
+
+    def available(self):
+        return self.capture.ring.written - self.pos
+
+    def read_frame(self, timeout=None):
+        """Next frame of PCM, or None on timeout or when capture has stopped"""
+        capture = self.capture
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.available() < capture.frame_bytes:
+            if not capture.running:
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(capture.poll_interval)
+        data, self.pos = capture.ring.read(self.pos, capture.frame_bytes)
+        return data
+
+
+class WebRtcVAD:
+    """webrtcvad speech classifier for 10/20/30 ms frames (optional dependency).
+
+    Frames must also clear the capture's energy threshold, which keeps steady
+    background noise that webrtcvad likes to call speech from opening utterances.
+    """
+
+    def __init__(self, capture, mode=2):
+        if not WEBRTCVAD_AVAILABLE:
+            raise ImportError("webrtcvad is not installed")
+        self.capture = capture
+        self.vad = webrtcvad.Vad(mode)
+
+    def __call__(self, frame):
+        return self.vad.is_speech(frame, self.capture.rate) and self.capture.is_speech(frame)
+
+
+def create_vad(kind, capture):
+    """frame -> bool voice detector: 'webrtc' when installed, else the capture's energy threshold"""
+    if kind == "webrtc":
+        try:
+            return WebRtcVAD(capture)
+        except Exception as e:
+            print(f"Falling back to energy VAD: {e}")
+    return capture.is_speech
+
+
+class AudioCapture:
+    """Ring-buffered PCM source with continuous noise tracking.
+
+    Producers call write() with frames of frame_bytes; subclasses run the
+    producer thread (MicrophoneCapture reads the sound card). The first
+    calibration_ms of audio set the noise floor; afterwards frames below the
+    speech threshold keep nudging it, so no per-listen calibration is needed.
+    """
+
+    def __init__(self, rate=SAMPLE_RATE, frame_ms=30, buffer_seconds=30, calibration_ms=500,
+                 min_threshold=300.0, margin=3.0, adapt=0.02):
+        self.rate = rate
+        self.frame_ms = frame_ms
+        self.frame_samples = rate * frame_ms // 1000
+        self.frame_bytes = self.frame_samples * SAMPLE_WIDTH
+        frames = max(1, buffer_seconds * 1000 // frame_ms)
+        self.ring = RingBuffer(frames * self.frame_bytes)
+        self.calibration_frames = max(1, calibration_ms // frame_ms)
+        self.min_threshold = min_threshold
+        self.margin = margin
+        self.adapt = adapt
+        self.noise_floor = None
+        self.calibrated = threading.Event()
+        self.poll_interval = frame_ms / 3000.0
+        self.running = False
+        self.frames = 0
+        self._calibration = []
+
+    @property
+    def energy_threshold(self):
+        if self.noise_floor is None:
+            return self.min_threshold
+        return max(self.min_threshold, self.noise_floor * self.margin)
+
+    def start(self):
+        self.running = True
+        return self
+
+    def stop(self):
+        self.running = False
+
+    def set_device(self, device_index):
+        """Switch input device (sources without a device ignore this)"""
+
+    def write(self, frame):
+        """Append one frame (called from the producer thread only)"""
+        self._track_noise(frame_rms(frame))
+        self.ring.write(frame)
+        self.frames += 1
+
+    def _track_noise(self, rms):
+        if not self.calibrated.is_set():
+            self._calibration.append(rms)
+            if len(self._calibration) >= self.calibration_frames:
+                # Median, so a word spoken during calibration does not raise the floor
+                self.noise_floor = sorted(self._calibration)[len(self._calibration) // 2]
+                self._calibration = []
+                self.calibrated.set()
+        elif rms < self.energy_threshold:
+            self.noise_floor += (rms - self.noise_floor) * self.adapt
+
+    def is_speech(self, frame):
+        return frame_rms(frame) > self.energy_threshold
+
+    def reader(self, back_ms=0):
+        """A cursor starting back_ms before now (clamped to what the ring still holds)"""
+        back = (back_ms // self.frame_ms) * self.frame_bytes
+        return AudioReader(self, max(self.ring.oldest(), self.ring.written - back))
+
+    def utterance(self, timeout=5.0, phrase_time_limit=10.0, pause_ms=800, pre_roll_ms=300,
+                  min_speech_ms=90, vad=None, endpoint=None):
+        """Yield (frame, voiced) for the next utterance while it is being spoken.
+
+        Speech starts after min_speech_ms of voiced frames and ends after pause_ms
+        of silence or phrase_time_limit seconds. The first yields are the
+        pre_roll_ms before the onset (reaching back before the call if needed, so
+        a command begun while the previous one was still being handled is not
+        clipped). Nothing is yielded if no speech starts within timeout.
+        vad(frame) -> bool defaults to the energy threshold. An endpoint (such as
+        vecna_asr.EndpointSession) is fed every yielded frame via feed(voiced, frame_ms)
+        and replaces pause_ms and phrase_time_limit with its pause_ms() and limit_ms().
+        """
+        vad = vad or self.is_speech
+        reader = self.reader(back_ms=pre_roll_ms)
+        pre_roll = deque(maxlen=max(1, (pre_roll_ms + min_speech_ms) // self.frame_ms))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        limit_frames = None if phrase_time_limit is None else int(phrase_time_limit * 1000 / self.frame_ms)
+        started, voiced_run, silence_ms, count = False, 0, 0, 0
+
+        while True:
+            frame = reader.read_frame(timeout=self.frame_ms / 1000.0 * 4)
+            if frame is None:
+                if not self.running:
+                    return
+                if not started and deadline is not None and time.monotonic() >= deadline:
+                    return
+                continue
+            voiced = vad(frame)
+            if not started:
+                pre_roll.append((frame, voiced))
+                voiced_run = voiced_run + 1 if voiced else 0
+                if voiced_run * self.frame_ms >= min_speech_ms:
+                    started = True
+                    count = len(pre_roll)
+                    for item in pre_roll:
+                        if endpoint is not None:
+                            endpoint.feed(item[1], self.frame_ms)
+                        yield item
+                elif deadline is not None and time.monotonic() >= deadline:
+                    return
+                continue
+            count += 1
+            if endpoint is not None:
+                endpoint.feed(voiced, self.frame_ms)
+                pause_ms = endpoint.pause_ms()
+                limit_frames = endpoint.limit_ms() // self.frame_ms
+            yield frame, voiced
+            silence_ms = 0 if voiced else silence_ms + self.frame_ms
+            if silence_ms >= pause_ms or (limit_frames is not None and count >= limit_frames):
+                return
+
+    def listen(self, timeout=5.0, phrase_time_limit=10.0, pause_ms=800, pre_roll_ms=300,
+               min_speech_ms=90, keep_silence_ms=200, vad=None, endpoint=None):
+        """Return the PCM of the next utterance (see utterance()), or None if none
+        started within timeout; only keep_silence_ms of trailing silence is kept"""
+        frames, silence_ms = [], 0
+        for frame, voiced in self.utterance(timeout, phrase_time_limit, pause_ms, pre_roll_ms,
+                                            min_speech_ms, vad, endpoint):
+            frames.append(frame)
+            silence_ms = 0 if voiced else silence_ms + self.frame_ms
+        if not frames:
+            return None
+        trim = max(0, silence_ms - keep_silence_ms) // self.frame_ms
+        if trim:
+            frames = frames[:-trim]
+        return b"".join(frames)
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "frames": self.frames,
+            "calibrated": self.calibrated.is_set(),
+            "noise_floor": round(self.noise_floor, 1) if self.noise_floor is not None else None,
+            "energy_threshold": round(self.energy_threshold, 1)
+        }
+
+
+class MicrophoneCapture(AudioCapture):
+    """Keeps one PyAudio input stream open on a background thread.
+
+    Opens at 16 kHz; devices that refuse that rate are opened at their default
+    rate and resampled. After max_open_failures failed opens in a row the thread
+    gives up: running goes False and `error` says why, so callers can fall back.
+    """
+
+    def __init__(self, device_index=None, max_open_failures=5, **kwargs):
+        super().__init__(**kwargs)
+        self.device_index = device_index
+        self.max_open_failures = max_open_failures
+        self.errors = 0
+        self.error = None
+        self._thread = None
+        self._reopen = False
+
+    def start(self):
+        if not PYAUDIO_AVAILABLE:
+            raise RuntimeError("PyAudio is required for microphone capture")
+        if self.running:
+            return self
+        self.running = True
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="mic-capture", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+
+    def set_device(self, device_index):
+        """Switch input device; the stream is reopened on the capture thread"""
+        self.device_index = device_index
+        self._reopen = True
+        if self.error is not None:
+            # The old device never opened; give the new one a chance
+            self.start()
+
+    def _open(self, audio):
+        kwargs = {"format": pyaudio.paInt16, "channels": 1, "input": True,
+                  "input_device_index": self.device_index}
+        try:
+            stream = audio.open(rate=self.rate, frames_per_buffer=self.frame_samples, **kwargs)
+            return stream, self.rate
+        except Exception:
+            if self.device_index is None:
+                info = audio.get_default_input_device_info()
+            else:
+                info = audio.get_device_info_by_index(self.device_index)
+            rate = int(info["defaultSampleRate"])
+            chunk = rate * self.frame_ms // 1000
+            return audio.open(rate=rate, frames_per_buffer=chunk, **kwargs), rate
+
+    def _run(self):
+        audio = pyaudio.PyAudio()
+        failures = 0
+        try:
+            while self.running:
+                try:
+                    stream, rate = self._open(audio)
+                except Exception as e:
+                    self.errors += 1
+                    failures += 1
+                    print(f"Microphone unavailable: {e}")
+                    if failures >= self.max_open_failures:
+                        self.error = f"could not open the microphone after {failures} attempts: {e}"
+                        print(f"Microphone capture stopped, {self.error}")
+                        self.running = False
+                        break
+                    time.sleep(1)
+                    continue
+                failures = 0
+                self._reopen = False
+                chunk = rate * self.frame_ms // 1000
+                pending = b""
+                try:
+                    while self.running and not self._reopen:
+                        data = stream.read(chunk, exception_on_overflow=False)
+                        pending += resample_pcm16(data, rate, self.rate)
+                        while len(pending) >= self.frame_bytes:
+                            self.write(pending[:self.frame_bytes])
+                            pending = pending[self.frame_bytes:]
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Microphone capture error: {e}")
+                    time.sleep(0.5)
+                finally:
+                    try:
+                        stream.stop_stream()
+                        stream.close()
+                    except Exception:
+                        pass
+        finally:
+            audio.terminate()
+
+    def stats(self):
+        stats = super().stats()
+        stats["errors"] = self.errors
+        stats["error"] = self.error
+        return stats
+
+
+def pcm16_mono(data, channels):
+    """Average interleaved 16-bit channels down to mono"""
+    if channels == 1:
+        return data
+    samples = array('h')
+    samples.frombytes(data[:len(data) - len(data) % (2 * channels)])
+    mono = array('h', (sum(samples[i:i + channels]) // channels for i in range(0, len(samples), channels)))
+    return mono.tobytes()
+
+
+def expand_playlist(entries):
+    """Audio file paths from files, directories (sorted) and .txt/.m3u playlists"""
+    if isinstance(entries, str):
+        entries = [entries]
+    files = []
+    for entry in entries:
+        if os.path.isdir(entry):
+            files += sorted(os.path.join(entry, name) for name in os.listdir(entry)
+                            if name.lower().endswith(('.wav', '.pcm', '.raw')))
+        elif entry.lower().endswith(('.txt', '.m3u')):
+            base = os.path.dirname(entry)
+            with open(entry, 'r', encoding='utf-8') as f:
+                lines = [line.strip() for line in f]
+            files += expand_playlist([os.path.join(base, line) for line in lines
+                                      if line and not line.startswith('#')])
+        else:
+            files.append(entry)
+    return files
+
+
+class ReplayCapture(AudioCapture):
+    """Plays a playlist of recordings into the ring as if it came from a microphone.
+
+    WAV files must be 16-bit (any rate and channel count); .pcm/.raw files are
+    16-bit mono at the capture rate. Silence of gap_ms separates files and
+    lead_ms of silence before the first one covers calibration. speed 1.0 is
+    real time, 4.0 four times faster (keep the consumers within the ring's
+    buffer_seconds). After the last file silence continues and `finished` is
+    set, unless loop is on.
+
+    Each file's timeline (perf_counter times of its first frame, last voiced
+    frame and last frame) is kept; record_response() - wired to the speech
+    worker's first audio - turns it into end-of-speech-to-response latency.
+    """
+
+    def __init__(self, playlist, speed=1.0, gap_ms=1000, lead_ms=1000, loop=False, **kwargs):
+        super().__init__(**kwargs)
+        self.files = expand_playlist(playlist)
+        self.speed = max(0.1, float(speed))
+        self.gap_ms = gap_ms
+        self.lead_ms = lead_ms
+        self.loop = loop
+        self.finished = threading.Event()
+        self.timeline = []
+        self.errors = 0
+        self._latencies = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self.running:
+            return self
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="replay-capture", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+
+    def load(self, path):
+        """16 kHz mono 16-bit PCM of one playlist entry"""
+        if not path.lower().endswith('.wav'):
+            with open(path, 'rb') as f:
+                return f.read()
+        with wave.open(path, 'rb') as wav:
+            if wav.getsampwidth() != SAMPLE_WIDTH:
+                raise ValueError(f"{path}: only 16-bit WAV files can be replayed")
+            data = pcm16_mono(wav.readframes(wav.getnframes()), wav.getnchannels())
+            return resample_pcm16(data, wav.getframerate(), self.rate)
+
+    def _run(self):
+        interval = self.frame_ms / 1000.0 / self.speed
+        next_at = time.perf_counter()
+        silence = bytes(self.frame_bytes)
+
+        def emit(frame):
+            nonlocal next_at
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_at = time.perf_counter()  # fell behind: don't burst to catch up
+            self.write(frame)
+            next_at += interval
+
+        def pause(ms):
+            for _ in range(ms // self.frame_ms):
+                if not self.running:
+                    return
+                emit(silence)
+
+        pause(self.lead_ms)
+        while self.running:
+            for path in self.files:
+                if not self.running:
+                    return
+                try:
+                    data = self.load(path)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Replay skipped {path}: {e}")
+                    continue
+                data += bytes(-len(data) % self.frame_bytes)
+                mark = {"file": os.path.basename(path), "audio_ms": len(data) * 1000 // (self.rate * SAMPLE_WIDTH),
+                        "start": None, "speech_end": None, "end": None, "response": None}
+                for i in range(0, len(data), self.frame_bytes):
+                    if not self.running:
+                        return
+                    frame = data[i:i + self.frame_bytes]
+                    emit(frame)
+                    now = time.perf_counter()
+                    if mark["start"] is None:
+                        mark["start"] = now
+                    if self.is_speech(frame):
+                        mark["speech_end"] = now
+                mark["end"] = time.perf_counter()
+                with self._lock:
+                    self.timeline.append(mark)
+                pause(self.gap_ms)
+            if not self.loop:
+                break
+        self.finished.set()
+        while self.running:
+            emit(silence)
+
+    def record_response(self, at=None):
+        """Note a response (first audio) at perf_counter time `at`; it answers the
+        latest file that finished playing and has no response yet"""
+        at = time.perf_counter() if at is None else at
+        with self._lock:
+            for mark in reversed(self.timeline):
+                if mark["end"] <= at:
+                    if mark["response"] is None:
+                        mark["response"] = at
+                        self._latencies.append(at - (mark["speech_end"] or mark["end"]))
+                    return
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats["replay"] = {
+                "files": len(self.files),
+                "played": len(self.timeline),
+                "answered": len(self._latencies),
+                "finished": self.finished.is_set(),
+                "speed": self.speed,
+                "errors": self.errors,
+                "response_latency": latency_summary(self._latencies)
+            }
+        return stats
+
+
+AUDIO_SOURCES = ("microphone", "replay")
+
+
+def create_audio_source(kind="microphone", device_index=None, playlist=(), speed=1.0, **kwargs):
+    """The capture behind SpeechRecognizer: the live microphone or a recording replayer"""
+    if kind == "replay":
+        return ReplayCapture(playlist, speed=speed, **kwargs)
+    if kind != "microphone":
+        print(f"Unknown audio source '{kind}', using the microphone")
+    return MicrophoneCapture(device_index=device_index, **kwargs)
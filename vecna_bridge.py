@@ -46,21 +46,20 @@ class VecnaBridge:
             return False
             
         try:
-            # Initialize core components
-            self.memory = Memory()
-            self.speech_engine = SpeechEngine()
-            self.recognizer = SpeechRecognizer()
-            self.system_controller = SystemController()
-            self.intelligence = Intelligence(self.memory)
-            self.command_processor = CommandProcessor(
-                self.speech_engine,
-                self.system_controller,
-                self.memory,
-                self.intelligence
-            )
-            
-            # Create main Vecna instance
+            # Build the assistant once and share its components, so there is a single
+            # Memory (and a single speech/Whisper stack) per process
             self.vecna_instance = VecnaAssistant()
+            self.memory = self.vecna_instance.memory
+            self.speech_engine = self.vecna_instance.speech_engine
+            self.recognizer = self.vecna_instance.recognizer
+            self.system_controller = self.vecna_instance.system
+            self.intelligence = self.vecna_instance.intelligence
+            self.command_processor = self.vecna_instance.command_processor
+            if self.mic_index is not None:
+                self.recognizer.set_device(self.mic_index)
+            
+            # The assistant speaks due reminders; the bridge surfaces them in the GUI
+            self.vecna_instance.reminder_scheduler.add_listener(self._on_reminders_due)
             
             self.is_initialized = True
             self._log("Vecna backend initialized successfully")
@@ -90,9 +89,10 @@ class VecnaBridge:
             
             self._log("Voice recognition started")
             if self.no_wake_word:
-                self._speak("Listening for commands. No wake word required.")
+                self._speak("Listening for commands. No wake word required.", source="status", status=True)
             else:
-                self._speak(f"Hello! I'm Vecna. Say '{Config.WAKE_WORDS[0]}' to get my attention.")
+                self._speak(f"Hello! I'm Vecna. Say '{Config.WAKE_WORDS[0]}' to get my attention.",
+                            source="status", status=True)
             return True
             
         except Exception as e:
@@ -107,7 +107,7 @@ class VecnaBridge:
             
         try:
             self.is_listening = False
-            self._speak("Goodbye! Going offline now.")
+            self._speak("Goodbye! Going offline now.", source="status", status=True)
             
             # Wait for thread to finish
             if self.listening_thread and self.listening_thread.is_alive():
@@ -174,7 +174,15 @@ class VecnaBridge:
             'initialized': self.is_initialized,
             'listening': self.is_listening,
             'wake_words': Config.WAKE_WORDS if VECNA_AVAILABLE else [],
-            'memory_entries': len(self.memory.memories.get('conversations', [])) if self.memory else 0
+            'memory_entries': self.memory.conversation_count() if self.memory else 0,
+            'memory_storage': self.memory.get_storage_stats() if self.memory else {},
+            'speech': self.speech_engine.get_metrics() if self.speech_engine else {},
+            'microphone': self.recognizer.capture.stats() if self.recognizer and self.recognizer.capture else {},
+            'whisper': self.recognizer.whisper.stats() if self.recognizer and self.recognizer.whisper else {},
+            'streaming': self.recognizer.streamer.stats() if self.recognizer and self.recognizer.streamer else {},
+            'recognizers': self.recognizer.orchestrator.stats() if self.recognizer else {},
+            'vocabulary': self.command_processor.vocabulary.stats() if self.command_processor else {},
+            'endpointing': self.recognizer.endpointer.stats() if self.recognizer and self.recognizer.endpointer else {}
         }
     
     def get_conversation_history(self, limit: int = 10) -> list:
@@ -182,8 +190,22 @@ class VecnaBridge:
         if not self.memory:
             return []
         
-        conversations = self.memory.memories.get('conversations', [])
-        return conversations[-limit:] if conversations else []
+        try:
+            return self.memory.get_recent_conversations(limit)
+        except Exception as e:
+            self._log(f"Error getting conversation history: {e}")
+            return []
+    
+    def search_history(self, query: str, since: Optional[Any] = None, limit: int = 20) -> list:
+        """Full-text search over conversation history, newest first"""
+        if not self.memory:
+            return []
+        
+        try:
+            return self.memory.search(query, since=since, limit=limit)
+        except Exception as e:
+            self._log(f"Error searching history: {e}")
+            return []
     
     def add_reminder(self, text: str, time_str: str) -> bool:
         """Add a reminder"""
@@ -197,13 +219,31 @@ class VecnaBridge:
             self._log(f"Error adding reminder: {e}")
             return False
     
+    def add_memory_listener(self, callback) -> bool:
+        """Subscribe callback(event, payload) to memory change notifications,
+        so the control panel can update views without re-reading the store"""
+        if not self.memory:
+            return False
+        self.memory.subscribe(callback)
+        return True
+    
+    def _on_reminders_due(self, reminders: list):
+        """Forward reminders fired by the scheduler to the GUI"""
+        for reminder in reminders:
+            if self.message_callback:
+                try:
+                    self.message_callback("REMINDER", reminder["text"])
+                except Exception:
+                    pass
+            print(f"Reminder: {reminder['text']}")
+    
     def get_pending_reminders(self) -> list:
-        """Get pending reminders"""
+        """Get pending reminders without consuming them; the scheduler announces them when due"""
         if not self.memory:
             return []
         
         try:
-            return self.memory.get_pending_reminders()
+            return self.memory.get_upcoming_reminders()
         except Exception as e:
             self._log(f"Error getting reminders: {e}")
             return []
@@ -220,6 +260,17 @@ class VecnaBridge:
             self._log(f"Error configuring voice: {e}")
             return False
     
+    def stop_speaking(self) -> bool:
+        """Cut off current speech and drop queued speech (control panel stop button)"""
+        if not self.speech_engine:
+            return False
+        try:
+            self.speech_engine.stop()
+            return True
+        except Exception as e:
+            self._log(f"Error stopping speech: {e}")
+            return False
+    
     def _listening_loop(self):
         """Main listening loop"""
         self._log("Listening loop started - say wake word to begin")
@@ -255,25 +306,18 @@ class VecnaBridge:
             return False
         
         try:
-            import speech_recognition as sr
-            
-            mic_kwargs = {}
-            if self.mic_index is not None:
-                mic_kwargs['device_index'] = self.mic_index
-            with sr.Microphone(**mic_kwargs) as source:
-                self.recognizer.recognizer.adjust_for_ambient_noise(source, duration=1)
-                audio = self.recognizer.recognizer.listen(source, phrase_time_limit=3)
-            
-            try:
-                text = str(self.recognizer.recognizer.recognize_google(audio)).lower()
-                for wake_word in Config.WAKE_WORDS:
-                    if wake_word in text:
-                        return True
-                return False
-            except sr.UnknownValueError:
-                return False
-            except sr.RequestError:
+            # Read from the always-open capture; a short timeout keeps stop_listening responsive
+            audio = self.recognizer.capture_audio(timeout=1, phrase_time_limit=3)
+            if audio is None:
                 return False
+            
+            # Goes through the recognizer orchestrator, which skips engines that keep failing,
+            # with a cheap Whisper decode since this runs on every ambient utterance
+            text = self.recognizer.recognize_wake_word(audio).lower()
+            for wake_word in Config.WAKE_WORDS:
+                if wake_word in text:
+                    return True
+            return False
                 
         except Exception as e:
             print(f"Wake word detection error: {e}")
@@ -285,38 +329,39 @@ class VecnaBridge:
             return None
         
         try:
-            import speech_recognition as sr
+            # No fixed limit when the endpointer adapts to what is being said
+            phrase_time_limit = None if self.recognizer.endpointer is not None else 10
+            if self.recognizer.streamer is not None:
+                # Streaming Whisper: a confident partial that is a complete command ends early
+                command = self.recognizer.listen_and_recognize(
+                    timeout=5, phrase_time_limit=phrase_time_limit,
+                    accept=self.command_processor.is_complete_command if self.command_processor else None
+                )
+                return command or None
             
-            mic_kwargs = {}
-            if self.mic_index is not None:
-                mic_kwargs['device_index'] = self.mic_index
-            with sr.Microphone(**mic_kwargs) as source:
-                self.recognizer.recognizer.adjust_for_ambient_noise(source, duration=1)
-                audio = self.recognizer.recognizer.listen(source, timeout=5, phrase_time_limit=10)
+            audio = self.recognizer.capture_audio(timeout=5, phrase_time_limit=phrase_time_limit)
+            if audio is None:
+                return None
             
-            try:
-                command = str(self.recognizer.recognizer.recognize_google(audio))
-                return command
-            except sr.UnknownValueError:
+            command = self.recognizer.recognize(audio)
+            if not command:
                 self._log("Could not understand audio")
                 return None
-            except sr.RequestError as e:
-                self._log(f"Recognition service error: {e}")
-                return None
+            return command
                 
         except Exception as e:
             self._log(f"Command listening error: {e}")
             return None
     
-    def _speak(self, text: str):
-        """Safely speak text"""
+    def _speak(self, text: str, source: str = "response", status: bool = False):
+        """Hand text to the speech engine's output arbiter (never blocks).
+
+        status messages from the same source replace each other while waiting.
+        """
         try:
             engine = self.speech_engine
-            if engine and hasattr(engine, 'speak'):
-                threading.Thread(
-                    target=lambda: engine.speak(text), 
-                    daemon=True
-                ).start()
+            if engine and hasattr(engine, 'announce'):
+                engine.announce(text, source=source, status=status)
         except Exception as e:
             print(f"Speech error: {e}")
     
@@ -340,6 +385,8 @@ class VecnaBridge:
 
     def set_mic_index(self, index: Optional[int]):
         self.mic_index = index if (isinstance(index, int) and index >= 0) else None
+        if self.recognizer:
+            self.recognizer.set_device(self.mic_index)
         self._log(f"Microphone index set to {self.mic_index}")
 
 # Convenience function to create bridge
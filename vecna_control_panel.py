@@ -82,7 +82,7 @@ class FuturisticVecnaControlPanel:
         """Safely speak text if speech engine is available"""
         try:
             if self.vecna_bridge:
-                self.vecna_bridge._speak(text)
+                self.vecna_bridge._speak(text, source="gui")
         except Exception as e:
             # Ensure dependencies are available
             if np is None:
@@ -580,6 +580,7 @@ class FuturisticVecnaControlPanel:
                 'features': [
                     ('Start Listening', self.start_listening),
                     ('Stop Listening', self.stop_listening),
+                    ('Stop Speaking', self.stop_speaking),
                     ('Voice Settings', self.voice_settings),
                     ('Microphone Test', self.test_microphone)
                 ]
@@ -1298,6 +1299,10 @@ class FuturisticVecnaControlPanel:
     def stop_listening(self):
         self.add_conversation_message("SYSTEM", "Voice listening stopped")
     
+    def stop_speaking(self):
+        if self.vecna_bridge and self.vecna_bridge.stop_speaking():
+            self.add_conversation_message("SYSTEM", "Speech stopped")
+    
     def voice_settings(self):
         messagebox.showinfo("Voice Settings", "Voice settings opened")
     
@@ -32,6 +32,7 @@ class EnhancedVecnaAssistant(VecnaAssistant):
         
         # Initialize new components
         self.plugin_manager = PluginManager()
+        self.command_processor.set_plugin_manager(self.plugin_manager)
         self.advanced_controller = AdvancedSystemController()
         self.use_gui = use_gui and GUI_AVAILABLE
         self.gui = None
@@ -251,6 +252,8 @@ class EnhancedVecnaAssistant(VecnaAssistant):
         if self.is_paused and "resume listening" not in command.lower():
             return None
         
+        command = self.command_processor.snap_command(command)
+        
         # Try plugin commands first
         plugin_result = self.plugin_manager.execute_plugin_command(command, {
             'vecna': self,
@@ -37,6 +37,7 @@ class PluginManager:
         self.plugin_dir = plugin_dir
         self.plugins = {}
         self.command_map = {}
+        self._listeners = []
         
         # Create plugins directory if it doesn't exist
         if not os.path.exists(plugin_dir):
@@ -75,6 +76,18 @@ class PluginManager:
                             
                 except Exception as e:
                     print(f"Error loading plugin {filename}: {e}")
+        self._notify()
+    
+    def add_listener(self, callback):
+        """Call callback() whenever plugins are loaded, enabled or disabled"""
+        self._listeners.append(callback)
+    
+    def _notify(self):
+        for callback in list(self._listeners):
+            try:
+                callback()
+            except Exception as e:
+                print(f"Plugin listener error: {e}")
     
     def execute_plugin_command(self, command, context):
         """Execute a command using the appropriate plugin"""
@@ -102,6 +115,7 @@ class PluginManager:
         """Enable a plugin"""
         if plugin_name in self.plugins:
             self.plugins[plugin_name].enabled = True
+            self._notify()
             return True
         return False
     
@@ -109,6 +123,7 @@ class PluginManager:
         """Disable a plugin"""
         if plugin_name in self.plugins:
             self.plugins[plugin_name].enabled = False
+            self._notify()
             return True
         return False
     
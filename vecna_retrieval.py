@@ -0,0 +1,245 @@
+"""
+Vecna Retrieval - relevance-ranked conversation context for the LLM
+Embeds each turn once as it is added and picks the most relevant past
+turns for a query within a token budget, instead of always sending the
+last few turns.
+"""
+
+import math
+import zlib
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from vecna_storage import tokenize
+
+# Optional imports - pure-Python fallbacks are used when missing
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "to", "of", "and", "or", "in",
+    "on", "at", "for", "it", "this", "that", "i", "you", "me", "my", "your", "can",
+    "could", "would", "please", "what", "how", "do", "does", "did"
+}
+
+
+# ====== Embedders ======
+class Embedder(ABC):
+    """Base class for turn embedders: embed(texts) returns one unit vector per text"""
+
+    name = "base"
+    dim = 0
+
+    @abstractmethod
+    def embed(self, texts):
+        pass
+
+
+class HashingEmbedder(Embedder):
+    """Offline hashing-trick TF embedder over unigrams and bigrams.
+
+    Needs no model download or vocabulary, so vectors are stable across runs and
+    a turn can be embedded the moment it is added.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def _features(self, text):
+        words = [w for w in tokenize(text) if w not in STOPWORDS]
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def _embed_one(self, text):
+        counts = {}
+        for feature in self._features(text):
+            h = zlib.crc32(feature.encode('utf-8'))
+            bucket = h % self.dim
+            sign = 1.0 if (h >> 31) & 1 else -1.0
+            counts[bucket] = counts.get(bucket, 0.0) + sign
+        vector = [0.0] * self.dim
+        for bucket, count in counts.items():
+            # Sublinear TF so a repeated word doesn't dominate the turn
+            vector[bucket] = math.copysign(1.0 + math.log(abs(count)), count) if count else 0.0
+        norm = math.sqrt(sum(v * v for v in vector))
+        return [v / norm for v in vector] if norm else vector
+
+    def embed(self, texts):
+        return [self._embed_one(text) for text in texts]
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """Dense embeddings from sentence-transformers (optional dependency)"""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_name="all-MiniLM-L6-v2"):
+        if not SENTENCE_TRANSFORMERS_AVAILABLE:
+            raise ImportError("sentence-transformers is not installed")
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts):
+        vectors = self.model.encode(list(texts), normalize_embeddings=True)
+        return [list(v) for v in vectors]
+
+
+def create_embedder(kind="hashing"):
+    """Build the configured embedder, falling back to hashing when unavailable"""
+    if kind == "sentence-transformers":
+        try:
+            return SentenceTransformerEmbedder()
+        except Exception as e:
+            print(f"Falling back to hashing embedder: {e}")
+    return HashingEmbedder()
+
+
+# ====== Vector Index ======
+class VectorIndex:
+    """Fixed-capacity ring of unit vectors with cosine top-k.
+
+    With NumPy the scores are one matrix-vector product plus argpartition;
+    without it a plain Python loop is used.
+    """
+
+    def __init__(self, dim, capacity=1000):
+        self.dim = dim
+        self.capacity = capacity
+        self.payloads = [None] * capacity
+        self.count = 0  # total vectors ever added; slot = count % capacity
+        if NUMPY_AVAILABLE:
+            self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        else:
+            self.matrix = [None] * capacity
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def add(self, vector, payload):
+        slot = self.count % self.capacity
+        if NUMPY_AVAILABLE:
+            self.matrix[slot] = vector
+        else:
+            self.matrix[slot] = list(vector)
+        self.payloads[slot] = payload
+        self.count += 1
+
+    def latest(self):
+        return self.payloads[(self.count - 1) % self.capacity] if self.count else None
+
+    def top_k(self, vector, k):
+        """Return [(score, payload)] for the k most similar vectors, best first"""
+        size = len(self)
+        if size == 0 or k <= 0:
+            return []
+        k = min(k, size)
+        if NUMPY_AVAILABLE:
+            scores = self.matrix[:size] @ np.asarray(vector, dtype=np.float32)
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [(float(scores[i]), self.payloads[i]) for i in best]
+        scored = [
+            (sum(a * b for a, b in zip(self.matrix[i], vector)), self.payloads[i])
+            for i in range(size)
+        ]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:k]
+
+
+# ====== Context Retriever ======
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) good enough for budgeting"""
+    return max(1, len(text) // 4)
+
+
+class ContextRetriever:
+    """Selects the most relevant past turns for an LLM prompt.
+
+    Turns are embedded incrementally through Memory's conversation_added
+    notifications; queries only embed the query itself.
+    """
+
+    def __init__(self, memory, embedder=None, capacity=1000, min_score=0.1, query_cache_size=64):
+        self.memory = memory
+        self.embedder = embedder or HashingEmbedder()
+        self.index = VectorIndex(self.embedder.dim, capacity)
+        self.min_score = min_score
+        self._lock = threading.Lock()
+        self._query_cache = OrderedDict()
+        self._query_cache_size = query_cache_size
+        self._backfill(capacity)
+        memory.subscribe(self._on_memory_event)
+
+    @staticmethod
+    def _turn_text(turn):
+        return f"{turn.get('user_input', '')} {turn.get('assistant_response', '')}"
+
+    def _backfill(self, limit):
+        try:
+            turns = self.memory.get_recent_conversations(limit)
+        except Exception as e:
+            print(f"Error loading conversations for retrieval: {e}")
+            return
+        if turns:
+            vectors = self.embedder.embed([self._turn_text(t) for t in turns])
+            with self._lock:
+                for turn, vector in zip(turns, vectors):
+                    self.index.add(vector, turn)
+
+    def add_turn(self, turn):
+        vector = self.embedder.embed([self._turn_text(turn)])[0]
+        with self._lock:
+            self.index.add(vector, turn)
+
+    def _on_memory_event(self, event, payload):
+        if event == "conversation_added" and payload:
+            self.add_turn(payload)
+
+    def _embed_query(self, query):
+        with self._lock:
+            vector = self._query_cache.get(query)
+            if vector is not None:
+                self._query_cache.move_to_end(query)
+                return vector
+        # Embed outside the lock so a slow model never blocks turns being indexed
+        vector = self.embedder.embed([query])[0]
+        with self._lock:
+            self._query_cache[query] = vector
+            if len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def select(self, query, k=5, token_budget=400, include_latest=True):
+        """Return up to k relevant turns, oldest first, whose text fits in token_budget.
+
+        include_latest keeps the previous turn as a candidate so follow-ups like
+        "and tomorrow?" still see what they refer to.
+        """
+        vector = self._embed_query(query)
+        with self._lock:
+            candidates = self.index.top_k(vector, k * 2)
+            latest = self.index.latest()
+        chosen, used = [], 0
+        if include_latest and latest is not None:
+            candidates = [(1.0, latest)] + [c for c in candidates if c[1] is not latest]
+        for score, turn in candidates:
+            if score < self.min_score or len(chosen) >= k:
+                break
+            cost = estimate_tokens(self._turn_text(turn))
+            if used + cost > token_budget:
+                continue
+            chosen.append(turn)
+            used += cost
+        chosen.sort(key=lambda turn: (turn.get("id", 0), turn.get("timestamp", "")))
+        return chosen
@@ -0,0 +1,106 @@
+"""
+Vecna Scheduler - fires reminders at their due time
+One thread sleeps on a min-heap of due times and wakes exactly at the next deadline,
+so reminders added mid-session fire without polling or a restart.
+"""
+
+import time
+import heapq
+import threading
+
+from vecna_storage import reminder_due_time
+
+
+class ReminderScheduler:
+    """Min-heap reminder scheduler driven by Memory change notifications"""
+
+    def __init__(self, memory):
+        self.memory = memory
+        self._heap = []  # (due epoch, reminder id)
+        self._cond = threading.Condition()
+        self._listeners = []
+        self._thread = None
+        self._running = False
+        self.fired = 0
+        memory.subscribe(self._on_memory_event)
+
+    def add_listener(self, callback):
+        """callback(reminders) is called from the scheduler thread with a list of due reminders"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def start(self):
+        """Arm the heap with every pending reminder and start the scheduler thread"""
+        if self._running:
+            return
+        try:
+            for reminder in self.memory.get_upcoming_reminders():
+                self.schedule(reminder)
+        except Exception as e:
+            print(f"Error loading reminders: {e}")
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+
+    def schedule(self, reminder):
+        """Add a reminder to the heap, waking the thread if it is now the earliest deadline"""
+        due = reminder.get("due")
+        if due is None:
+            due = reminder_due_time(reminder["time"])
+        with self._cond:
+            heapq.heappush(self._heap, (due, reminder.get("id")))
+            if self._heap[0][0] == due:
+                self._cond.notify()
+
+    def next_due(self):
+        with self._cond:
+            return self._heap[0][0] if self._heap else None
+
+    def _on_memory_event(self, event, payload):
+        if event == "reminder_added":
+            self.schedule(payload)
+        elif event == "external_change" and "reminders" in payload:
+            # Another process added reminders; re-arm from the merged store
+            for reminder in self.memory.get_upcoming_reminders():
+                self.schedule(reminder)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - time.time()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if not self._running:
+                    return
+                now = time.time()
+                while self._heap and self._heap[0][0] <= now:
+                    heapq.heappop(self._heap)
+
+            # Memory marks them completed, so each reminder fires exactly once
+            try:
+                due = self.memory.get_pending_reminders()
+            except Exception as e:
+                print(f"Error reading due reminders: {e}")
+                continue
+            if due:
+                self.fired += len(due)
+                for callback in list(self._listeners):
+                    try:
+                        callback(due)
+                    except Exception as e:
+                        print(f"Reminder listener error: {e}")
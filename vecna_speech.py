@@ -0,0 +1,1172 @@
+"""
+Vecna Speech - text-to-speech output pipeline
+A single long-lived worker thread owns the TTS engine and speaks utterances from a
+priority deque, so reminders and alerts jump ahead of chatter and can cut into a
+long low-priority answer. Frequent phrases are pre-rendered to a disk cache and
+played back directly instead of being synthesized every time. Streamed text (e.g.
+an LLM answer still being generated) is spoken sentence by sentence as it arrives.
+The engine itself sits behind a TTSBackend (pyttsx3, WAV files or a silent timing
+backend), so the pipeline also runs headless.
+"""
+
+import os
+import re
+import math
+import json
+import time
+import wave
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from collections import deque, OrderedDict
+
+from vecna_storage import atomic_write_json
+
+# Optional audio output for cached phrases - PyAudio everywhere, winsound on Windows
+try:
+    import pyaudio
+    PYAUDIO_AVAILABLE = True
+except ImportError:
+    PYAUDIO_AVAILABLE = False
+
+try:
+    import winsound
+    WINSOUND_AVAILABLE = True
+except ImportError:
+    WINSOUND_AVAILABLE = False
+
+# Lower value = more urgent
+PRIORITY_URGENT = 0   # reminders, alerts
+PRIORITY_NORMAL = 1   # command responses
+PRIORITY_CHATTER = 2  # greetings, status messages
+PRIORITIES = (PRIORITY_URGENT, PRIORITY_NORMAL, PRIORITY_CHATTER)
+
+
+def latency_summary(samples):
+    """avg/p50/p99 in milliseconds for a sequence of durations in seconds"""
+    if not samples:
+        return {"count": 0, "avg_ms": 0.0, "p50_ms": 0.0, "p99_ms": 0.0}
+    ordered = sorted(samples)
+    pick = lambda p: ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+    return {
+        "count": len(ordered),
+        "avg_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": round(pick(0.50), 2),
+        "p99_ms": round(pick(0.99), 2)
+    }
+
+
+class Utterance:
+    """One queued piece of speech; wait() blocks until it was spoken or dropped"""
+
+    def __init__(self, text, priority=PRIORITY_NORMAL, source=None):
+        self.text = text
+        self.priority = priority
+        self.source = source
+        self.enqueued_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+        self.first_audio_at = None
+        self.preemptions = 0
+        self.cancelled = False
+        self.stream = None  # SpeechStream this sentence belongs to, if any
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def _finish(self):
+        self.finished_at = time.perf_counter()
+        self._done.set()
+
+
+class SentenceChunker:
+    """Splits incrementally arriving text into speakable sentences.
+
+    Short sentences are merged with the next one (choppy one-word chunks sound
+    worse than a small delay). Run-ons are cut at a comma or space once they
+    pass max_chars, so a missing full stop never holds back the audio.
+    """
+
+    BOUNDARY = re.compile(r'[.!?…]+["\')\]]*\s+|\n+')
+    ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "vs", "etc", "e.g", "i.e", "jr", "sr", "prof", "no"}
+
+    def __init__(self, min_chars=12, max_chars=200):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+
+    def _is_abbreviation(self, text):
+        words = text.rstrip(".!?…\"')]").split()
+        if not words:
+            return False
+        last = words[-1].lower()
+        return last in self.ABBREVIATIONS or (len(last) == 1 and last.isalpha())
+
+    def feed(self, text):
+        """Add text; returns the sentences it completed"""
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in self.BOUNDARY.finditer(self._buffer):
+            candidate = self._buffer[start:match.end()].strip()
+            if len(candidate) < self.min_chars or self._is_abbreviation(self._buffer[start:match.start() + 1]):
+                continue
+            sentences.append(candidate)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        while len(self._buffer) > self.max_chars:
+            cut = max(self._buffer.rfind(", ", 0, self.max_chars), self._buffer.rfind(" ", 0, self.max_chars))
+            if cut <= 0:
+                cut = self.max_chars
+            sentences.append(self._buffer[:cut + 1].strip())
+            self._buffer = self._buffer[cut + 1:]
+        return sentences
+
+    def flush(self):
+        """Return whatever is left once the stream has ended"""
+        rest, self._buffer = self._buffer.strip(), ""
+        return [rest] if rest else []
+
+
+class SpeechStream:
+    """Handle for text spoken while it is still being produced.
+
+    result() returns the full text once the source iterator is exhausted (speech may
+    still be playing); wait() also waits for the last sentence to be spoken.
+    """
+
+    def __init__(self, priority=PRIORITY_NORMAL, source=None):
+        self.priority = priority
+        self.source = source
+        self.started_at = time.perf_counter()
+        self.first_sentence_at = None
+        self.utterances = []
+        self.cancelled = False
+        self._parts = []
+        self._generated = threading.Event()
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+    @property
+    def time_to_first_audio(self):
+        """Seconds from speak() to the first sound, or None if nothing was heard"""
+        if self.utterances and self.utterances[0].first_audio_at is not None:
+            return self.utterances[0].first_audio_at - self.started_at
+        return None
+
+    def result(self, timeout=None):
+        self._generated.wait(timeout)
+        return self.text
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        if not self._generated.wait(timeout):
+            return False
+        for utterance in list(self.utterances):
+            remaining = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            if not utterance.wait(remaining):
+                return False
+        return True
+
+
+class PhraseCache:
+    """Disk-backed LRU of rendered phrases keyed by (text, voice, rate, volume)"""
+
+    def __init__(self, directory, max_entries=200, max_bytes=50 * 1024 * 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> {"text", "bytes"}, least recently used first
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(text, voice=None, rate=None, volume=None):
+        normalized = " ".join(text.split())
+        raw = json.dumps([normalized, voice, rate, volume], ensure_ascii=False)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _load_index(self):
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = []
+        for key, entry in entries:
+            if os.path.exists(self.path(key)):
+                self._entries[key] = entry
+
+    def _save_index(self):
+        try:
+            atomic_write_json(self.index_file, list(self._entries.items()))
+        except OSError as e:
+            print(f"Error saving phrase cache index: {e}")
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def temp_path(self, key):
+        return os.path.join(self.directory, f"{key}.tmp.wav")
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Path of the rendered phrase, or None on a miss"""
+        with self._lock:
+            if key in self._entries and os.path.exists(self.path(key)):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self.path(key)
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key, rendered_path, text):
+        """Adopt a freshly rendered file and evict least recently used phrases over budget"""
+        size = os.path.getsize(rendered_path)
+        if size == 0:
+            os.remove(rendered_path)
+            return False
+        os.replace(rendered_path, self.path(key))
+        with self._lock:
+            self._entries[key] = {"text": text, "bytes": size}
+            self._entries.move_to_end(key)
+            total = sum(entry["bytes"] for entry in self._entries.values())
+            while self._entries and (len(self._entries) > self.max_entries or total > self.max_bytes):
+                old_key, old = self._entries.popitem(last=False)
+                total -= old["bytes"]
+                try:
+                    os.remove(self.path(old_key))
+                except OSError:
+                    pass
+            self._save_index()
+        return True
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._save_index()
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def close(self):
+        with self._lock:
+            self._save_index()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(entry["bytes"] for entry in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+class WavPlayer:
+    """Plays WAV files through PyAudio (or winsound on Windows), stoppable mid-phrase"""
+
+    CHUNK = 1024
+
+    def __init__(self):
+        self._audio = None
+
+    @property
+    def available(self):
+        return PYAUDIO_AVAILABLE or WINSOUND_AVAILABLE
+
+    def play(self, path, should_stop, on_start=None):
+        """Play path until it ends or should_stop() returns True; False if it could not play"""
+        if PYAUDIO_AVAILABLE:
+            return self._play_pyaudio(path, should_stop, on_start)
+        if WINSOUND_AVAILABLE:
+            return self._play_winsound(path, should_stop, on_start)
+        return False
+
+    def _play_pyaudio(self, path, should_stop, on_start):
+        if self._audio is None:
+            self._audio = pyaudio.PyAudio()
+        with wave.open(path, 'rb') as wav:
+            stream = self._audio.open(
+                format=self._audio.get_format_from_width(wav.getsampwidth()),
+                channels=wav.getnchannels(),
+                rate=wav.getframerate(),
+                output=True
+            )
+            try:
+                if on_start:
+                    on_start()
+                data = wav.readframes(self.CHUNK)
+                while data and not should_stop():
+                    stream.write(data)
+                    data = wav.readframes(self.CHUNK)
+            finally:
+                stream.stop_stream()
+                stream.close()
+        return True
+
+    def _play_winsound(self, path, should_stop, on_start):
+        with wave.open(path, 'rb') as wav:
+            duration = wav.getnframes() / float(wav.getframerate())
+        winsound.PlaySound(path, winsound.SND_FILENAME | winsound.SND_ASYNC)
+        if on_start:
+            on_start()
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            if should_stop():
+                winsound.PlaySound(None, winsound.SND_PURGE)
+                break
+            time.sleep(0.02)
+        return True
+
+
+# ====== TTS Backends ======
+def write_silence_wav(path, duration, rate=16000):
+    """Write a mono 16-bit WAV of silence; stands in for audio when no synthesizer is available"""
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b"\x00\x00" * int(duration * rate))
+
+
+def wav_duration(path):
+    with wave.open(path, 'rb') as wav:
+        return wav.getnframes() / float(wav.getframerate())
+
+
+class TTSBackend(ABC):
+    """Interface between the TTS worker and a speech engine.
+
+    Every method is called from the worker thread. play() blocks until the text
+    has been spoken or stop() was called (stop() is called from inside the
+    on_word callback, at a word boundary).
+    """
+
+    name = "base"
+    audible = True  # False for backends that never reach the speakers
+
+    def start(self):
+        """Create the underlying engine; called once on the worker thread"""
+        pass
+
+    @abstractmethod
+    def synthesize(self, text, path):
+        """Render text to a WAV file at path"""
+        pass
+
+    @abstractmethod
+    def play(self, text, on_word=None):
+        """Speak text; on_word(char_offset) is called as each word starts"""
+        pass
+
+    def play_file(self, path, should_stop, on_start=None):
+        """Play a rendered WAV file; returns False if it could not be played"""
+        return False
+
+    def stop(self):
+        """Interrupt play() at the next word boundary"""
+        pass
+
+    def voices(self):
+        """Available voices as [{"id", "name"}]"""
+        return []
+
+    def get_property(self, name):
+        return None
+
+    def set_property(self, name, value):
+        pass
+
+
+class Pyttsx3Backend(TTSBackend):
+    """pyttsx3 (SAPI5 / NSSpeechSynthesizer / eSpeak); cached phrases play through WavPlayer"""
+
+    name = "pyttsx3"
+
+    def __init__(self, engine_factory, player=None):
+        self._engine_factory = engine_factory
+        self.player = player or WavPlayer()
+        self.engine = None
+        self._on_word = None
+
+    def start(self):
+        self.engine = self._engine_factory()
+        self.engine.connect('started-word', self._started_word)
+
+    def _started_word(self, name, location, length):
+        if self._on_word is not None:
+            self._on_word(location)
+
+    def synthesize(self, text, path):
+        self.engine.save_to_file(text, path)
+        self.engine.runAndWait()
+
+    def play(self, text, on_word=None):
+        self._on_word = on_word
+        try:
+            self.engine.say(text)
+            self.engine.runAndWait()
+        finally:
+            self._on_word = None
+
+    def play_file(self, path, should_stop, on_start=None):
+        if not self.player.available:
+            return False
+        return self.player.play(path, should_stop, on_start)
+
+    def stop(self):
+        self.engine.stop()
+
+    def voices(self):
+        return [{"id": v.id, "name": v.name} for v in self.engine.getProperty('voices')]
+
+    def get_property(self, name):
+        return self.engine.getProperty(name)
+
+    def set_property(self, name, value):
+        self.engine.setProperty(name, value)
+
+
+class NullBackend(TTSBackend):
+    """Silent timing backend for headless runs and benchmarks.
+
+    With realtime=True play() takes as long as speaking would at the configured
+    rate (words per minute), firing word callbacks on the way, so latency and
+    barge-in behave as with real audio. With realtime=False it returns at once.
+    """
+
+    name = "null"
+    audible = False
+
+    def __init__(self, realtime=True, rate=180):
+        self.realtime = realtime
+        self.properties = {"rate": rate, "volume": 1.0, "voice": "null"}
+        self.spoken = deque(maxlen=1000)  # (text, seconds) of recent utterances
+        self._stop = threading.Event()
+
+    def _word_time(self):
+        return 60.0 / max(float(self.properties.get("rate") or 180), 1.0)
+
+    def estimate_duration(self, text):
+        return len(text.split()) * self._word_time()
+
+    def synthesize(self, text, path):
+        write_silence_wav(path, self.estimate_duration(text))
+
+    def play(self, text, on_word=None):
+        self._stop.clear()
+        start = time.perf_counter()
+        offset = 0
+        for word in text.split(" "):
+            if on_word is not None:
+                on_word(offset)
+            if self._stop.is_set():
+                break
+            if self.realtime and word:
+                self._stop.wait(self._word_time())
+            offset += len(word) + 1
+        self.spoken.append((text, time.perf_counter() - start))
+
+    def play_file(self, path, should_stop, on_start=None):
+        if on_start:
+            on_start()
+        if self.realtime:
+            end = time.perf_counter() + wav_duration(path)
+            while time.perf_counter() < end and not should_stop():
+                time.sleep(0.01)
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def voices(self):
+        return [{"id": "null", "name": "Null (silent)"}]
+
+    def get_property(self, name):
+        return self.properties.get(name)
+
+    def set_property(self, name, value):
+        self.properties[name] = value
+
+
+class WavFileBackend(NullBackend):
+    """Writes every utterance to a numbered WAV file instead of the speakers.
+
+    Audio is rendered with the given engine_factory (pyttsx3 can render without a
+    sound card on Linux via eSpeak); without one, silence of the estimated length
+    is written. An utterances.jsonl log maps files to text and duration.
+    """
+
+    name = "wav"
+
+    def __init__(self, output_dir="tts_output", engine_factory=None, realtime=False, rate=180):
+        super().__init__(realtime=realtime, rate=rate)
+        self.output_dir = output_dir
+        self._engine_factory = engine_factory
+        self.engine = None
+        self.count = 0
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self._engine_factory is not None:
+            try:
+                self.engine = self._engine_factory()
+                for key in ("rate", "volume", "voice"):
+                    self.properties[key] = self.engine.getProperty(key)
+            except Exception as e:
+                print(f"WAV backend rendering silence, engine unavailable: {e}")
+                self.engine = None
+
+    def synthesize(self, text, path):
+        if self.engine is not None:
+            self.engine.save_to_file(text, path)
+            self.engine.runAndWait()
+        else:
+            super().synthesize(text, path)
+
+    def play(self, text, on_word=None):
+        self.count += 1
+        path = os.path.join(self.output_dir, f"utterance-{self.count:06d}.wav")
+        self.synthesize(text, path)
+        try:
+            duration = wav_duration(path)
+        except (OSError, EOFError, wave.Error):
+            duration = self.estimate_duration(text)
+        with open(os.path.join(self.output_dir, "utterances.jsonl"), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"file": os.path.basename(path), "text": text, "duration": round(duration, 3)}) + "\n")
+        super().play(text, on_word)
+
+    def set_property(self, name, value):
+        super().set_property(name, value)
+        if self.engine is not None:
+            self.engine.setProperty(name, value)
+
+
+TTS_BACKENDS = {
+    Pyttsx3Backend.name: Pyttsx3Backend,
+    WavFileBackend.name: WavFileBackend,
+    NullBackend.name: NullBackend,
+}
+
+
+def create_tts_backend(kind="pyttsx3", engine_factory=None, **options):
+    """Build the backend selected by config.json's text_to_speech.backend.
+
+    engine_factory creates a pyttsx3 engine; the wav backend uses it to render
+    audio. options: output_dir and realtime for wav/null, rate for null.
+    """
+    kind = (kind or "pyttsx3").lower()
+    if kind not in TTS_BACKENDS:
+        print(f"Unknown TTS backend '{kind}', falling back to pyttsx3")
+        kind = "pyttsx3"
+    if kind == "pyttsx3":
+        return Pyttsx3Backend(engine_factory)
+    if kind == "wav":
+        return WavFileBackend(engine_factory=engine_factory, **options)
+    options.pop("output_dir", None)
+    return NullBackend(**options)
+
+
+class TTSWorker:
+    """Long-lived TTS thread with a priority deque and preemption.
+
+    The backend is started on the worker thread (pyttsx3 engines must be used
+    from the thread that created them). When an utterance arrives that is more
+    urgent than the one being spoken, the word callback stops the backend at the
+    next word boundary; the interrupted utterance is re-queued from that word so
+    it resumes after the urgent one.
+
+    With a PhraseCache, cached phrases are played from disk. Pre-warmed phrases and
+    short phrases heard more than once are rendered while the worker is idle.
+    """
+
+    MAX_CACHED_CHARS = 80  # longer texts are one-off answers, not worth rendering
+
+    def __init__(self, backend, preempt=True, sample_size=200, cache=None):
+        self.backend = backend
+        self.backend_ready = False
+        self.preempt = preempt
+        self.cache = cache
+        self.voice_settings = {}  # rate/volume/voice currently applied; part of the cache key
+        self._render_queue = deque()
+        self._streams = set()  # SpeechStreams still being fed
+        self._seen = {}  # text -> times spoken live, to spot repeated phrases
+        self._first_audio = None
+        self.on_first_audio = None  # called with the perf_counter time each utterance became audible
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._cond = threading.Condition()
+        self._settings = {}
+        self._current = None
+        self._stopped_at = None  # char offset where preemption cut the current utterance
+        self._preempt_requested = False
+        self._cancel_requested = None  # perf_counter time of a pending cancel()
+        self._running = False
+        self._thread = None
+        # Metrics
+        self._wait_times = deque(maxlen=sample_size)
+        self._synthesis_times = deque(maxlen=sample_size)
+        self.spoken = 0
+        self.preempted = 0
+        self.cancelled = 0
+        self.errors = 0
+        self._stop_latencies = deque(maxlen=sample_size)
+        self._first_audio_times = {
+            "cached": deque(maxlen=sample_size),
+            "live": deque(maxlen=sample_size),
+            "stream": deque(maxlen=sample_size)
+        }
+        self.max_queue_depth = 0
+
+    # ----- public API -----
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="tts-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+
+    def speak(self, text, priority=PRIORITY_NORMAL, source=None):
+        """Queue text and return its Utterance immediately"""
+        priority = min(max(priority, PRIORITY_URGENT), PRIORITY_CHATTER)
+        return self._enqueue(Utterance(text, priority, source))
+
+    def _enqueue(self, utterance):
+        priority = utterance.priority
+        with self._cond:
+            self._queues[priority].append(utterance)
+            self.max_queue_depth = max(self.max_queue_depth, self._depth())
+            current = self._current
+            if self.preempt and current is not None and priority < current.priority:
+                self._preempt_requested = True
+            self._cond.notify()
+        return utterance
+
+    def speak_stream(self, chunks, priority=PRIORITY_NORMAL, source=None, on_sentence=None):
+        """Speak an iterable of text pieces sentence by sentence as they arrive.
+
+        The iterable is consumed on a feeder thread, so this returns a SpeechStream
+        immediately; the first sentence starts playing while later ones are still
+        being produced.
+        """
+        stream = SpeechStream(priority, source)
+        with self._cond:
+            self._streams.add(stream)
+        threading.Thread(
+            target=self._feed_stream, args=(stream, chunks, on_sentence), name="tts-stream", daemon=True
+        ).start()
+        return stream
+
+    def _feed_stream(self, stream, chunks, on_sentence):
+        chunker = SentenceChunker()
+
+        def emit(sentences):
+            for sentence in sentences:
+                if stream.cancelled:
+                    return
+                if stream.first_sentence_at is None:
+                    stream.first_sentence_at = time.perf_counter()
+                if on_sentence:
+                    on_sentence(sentence)
+                utterance = Utterance(sentence, stream.priority, stream.source)
+                utterance.stream = stream
+                stream.utterances.append(utterance)
+                self._enqueue(utterance)
+
+        try:
+            for piece in chunks:
+                if not piece:
+                    continue
+                # Keep collecting after a cancel so result() still returns the full text
+                stream._parts.append(piece)
+                emit(chunker.feed(piece))
+            emit(chunker.flush())
+        except Exception as e:
+            print(f"Speech stream error: {e}")
+        finally:
+            with self._cond:
+                self._streams.discard(stream)
+            stream._generated.set()
+
+    def prewarm(self, phrases):
+        """Render phrases into the cache in the background so they play without synthesis"""
+        if self.cache is None:
+            return
+        with self._cond:
+            self._render_queue.extend(phrases)
+            self._cond.notify()
+
+    def configure(self, **properties):
+        """Queue engine property changes (rate, volume, voice); applied between utterances"""
+        with self._cond:
+            self._settings.update({k: v for k, v in properties.items() if v is not None})
+            self._cond.notify()
+
+    def cancel(self):
+        """Stop the current utterance at the next word boundary; returns True if one was playing"""
+        with self._cond:
+            if self._current is None:
+                return False
+            self._cancel_requested = time.perf_counter()
+            return True
+
+    def flush(self, keep_urgent=False):
+        """Drop queued utterances (optionally keeping urgent ones); returns how many were dropped.
+        Streams at the dropped priorities stop queueing further sentences."""
+        with self._cond:
+            for stream in self._streams:
+                if not (keep_urgent and stream.priority == PRIORITY_URGENT):
+                    stream.cancelled = True
+            dropped = []
+            for priority, queue in self._queues.items():
+                if keep_urgent and priority == PRIORITY_URGENT:
+                    continue
+                dropped.extend(queue)
+                queue.clear()
+            self.cancelled += len(dropped)
+        for utterance in dropped:
+            utterance.cancelled = True
+            utterance._finish()
+        return len(dropped)
+
+    def queue_depth(self):
+        with self._cond:
+            return self._depth()
+
+    def is_speaking(self):
+        return self._current is not None
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queue_depth": self._depth(),
+                "max_queue_depth": self.max_queue_depth,
+                "speaking": self._current is not None,
+                "spoken": self.spoken,
+                "preempted": self.preempted,
+                "cancelled": self.cancelled,
+                "errors": self.errors,
+                "stop_latency": latency_summary(self._stop_latencies),
+                "first_audio_cached": latency_summary(self._first_audio_times["cached"]),
+                "first_audio_live": latency_summary(self._first_audio_times["live"]),
+                "first_audio_stream": latency_summary(self._first_audio_times["stream"]),
+                "phrase_cache": self.cache.stats() if self.cache is not None else {},
+                "wait": latency_summary(self._wait_times),
+                "synthesis": latency_summary(self._synthesis_times)
+            }
+
+    # ----- worker thread -----
+    def _depth(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _next(self):
+        for priority in PRIORITIES:
+            if self._queues[priority]:
+                return self._queues[priority].popleft()
+        return None
+
+    def _on_word(self, location):
+        if self._first_audio is None:
+            self._first_audio = time.perf_counter()
+        if self._cancel_requested is not None:
+            self.backend.stop()
+        elif self._preempt_requested:
+            self._preempt_requested = False
+            self._stopped_at = location
+            self.backend.stop()
+
+    def _start_backend(self):
+        try:
+            self.backend.start()
+            self.backend_ready = True
+        except Exception as e:
+            print(f"TTS engine unavailable: {e}")
+            return
+        for key in ("rate", "volume", "voice"):
+            try:
+                self.voice_settings[key] = self.backend.get_property(key)
+            except Exception:
+                pass
+
+    def voices(self):
+        return self.backend.voices() if self.backend_ready else []
+
+    def _apply_settings(self, settings):
+        for key, value in settings.items():
+            try:
+                self.backend.set_property(key, value)
+                self.voice_settings[key] = value
+            except Exception as e:
+                print(f"TTS setting {key} failed: {e}")
+
+    def _run(self):
+        self._start_backend()
+        while True:
+            with self._cond:
+                while self._running and not self._depth() and not self._settings and not self._render_queue:
+                    self._cond.wait()
+                if not self._running:
+                    break
+                settings, self._settings = self._settings, {}
+                utterance = self._next()
+                render = None
+                if utterance is not None:
+                    self._current = utterance
+                    self._stopped_at = None
+                    self._preempt_requested = False
+                    self._cancel_requested = None
+                elif self._render_queue:
+                    render = self._render_queue.popleft()
+            if settings and self.backend_ready:
+                self._apply_settings(settings)
+            if render is not None:
+                self._render(render)
+            if utterance is None:
+                continue
+
+            if utterance.started_at is None:
+                utterance.started_at = time.perf_counter()
+                self._wait_times.append(utterance.started_at - utterance.enqueued_at)
+            start = time.perf_counter()
+            self._first_audio = None
+            try:
+                source = self._speak(utterance)
+            except Exception as e:
+                source = None
+                self.errors += 1
+                print(f"TTS error: {e}")
+            elapsed = time.perf_counter() - start
+            if source and self._first_audio is not None:
+                self._first_audio_times[source].append(self._first_audio - start)
+                if utterance.first_audio_at is None:
+                    utterance.first_audio_at = self._first_audio
+                    if self.on_first_audio is not None:
+                        self.on_first_audio(self._first_audio)
+                    stream = utterance.stream
+                    if stream is not None and stream.utterances and stream.utterances[0] is utterance:
+                        self._first_audio_times["stream"].append(self._first_audio - stream.started_at)
+
+            with self._cond:
+                self._current = None
+                if self._cancel_requested is not None:
+                    self._stop_latencies.append(time.perf_counter() - self._cancel_requested)
+                    self._cancel_requested = None
+                    self.cancelled += 1
+                    utterance.cancelled = True
+                    utterance._finish()
+                    continue
+                if self._stopped_at is not None:
+                    # Resume from the word we stopped on once the urgent speech is done
+                    utterance.text = utterance.text[self._stopped_at:]
+                    utterance.preemptions += 1
+                    self.preempted += 1
+                    self._queues[utterance.priority].appendleft(utterance)
+                    continue
+            self._synthesis_times.append(elapsed)
+            self.spoken += 1
+            utterance._finish()
+
+        if self.cache is not None:
+            self.cache.close()
+        # Anyone still waiting on queued speech is released at shutdown
+        with self._cond:
+            pending = [u for queue in self._queues.values() for u in queue]
+            for queue in self._queues.values():
+                queue.clear()
+        for utterance in pending:
+            utterance.cancelled = True
+            utterance._finish()
+
+    # ----- rendering and playback -----
+    def _cache_key(self, text):
+        settings = self.voice_settings
+        return PhraseCache.make_key(text, settings.get("voice"), settings.get("rate"), settings.get("volume"))
+
+    def _speak(self, utterance):
+        """Play from the phrase cache when possible, otherwise synthesize live; returns which"""
+        if self.cache is not None and self.backend_ready:
+            key = self._cache_key(utterance.text)
+            path = self.cache.get(key)
+            if path is not None:
+                try:
+                    if self._play_cached(path):
+                        return "cached"
+                except Exception as e:
+                    # Unplayable render (e.g. not a WAV on this platform): speak live instead
+                    print(f"Cached phrase playback failed: {e}")
+                    self.cache.discard(key)
+        if not self.backend_ready:
+            return None
+        self.backend.play(utterance.text, on_word=self._on_word)
+        self._note_live(utterance)
+        return "live"
+
+    def _play_cached(self, path):
+        def should_stop():
+            if self._cancel_requested is not None:
+                return True
+            if self._preempt_requested:
+                # Cached phrases are short: replay the whole phrase after the urgent one
+                self._preempt_requested = False
+                self._stopped_at = 0
+                return True
+            return False
+
+        def on_start():
+            self._first_audio = time.perf_counter()
+
+        return self.backend.play_file(path, should_stop, on_start)
+
+    def _note_live(self, utterance):
+        """Queue short phrases for rendering once they have been spoken live twice"""
+        text = utterance.text
+        if self.cache is None or utterance.preemptions or len(text) > self.MAX_CACHED_CHARS:
+            return
+        if len(self._seen) > 1000:
+            self._seen.clear()
+        self._seen[text] = self._seen.get(text, 0) + 1
+        if self._seen[text] == 2:
+            with self._cond:
+                self._render_queue.append(text)
+
+    def _render(self, text):
+        if not self.backend_ready or self.cache is None:
+            return
+        key = self._cache_key(text)
+        if key in self.cache:
+            return
+        tmp_path = self.cache.temp_path(key)
+        try:
+            self.backend.synthesize(text, tmp_path)
+            if os.path.exists(tmp_path):
+                self.cache.put(key, tmp_path, text)
+        except Exception as e:
+            print(f"Error rendering phrase '{text}': {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+class OutputArbiter:
+    """Single gate between the bridge/GUI and the TTS worker.
+
+    Messages wait in a small bounded queue and are handed to the worker one at a
+    time, only once the worker has nothing else queued, so anything still waiting
+    can be dropped or replaced:
+
+    - an utterance equal to the one just queued or spoken (within dedupe_window
+      seconds) is collapsed into it
+    - a status message replaces any status from the same source still waiting
+    - rate_limits maps a source to (messages, seconds); the excess is dropped
+    - when the queue is full the oldest status (else the oldest message) is dropped
+
+    Urgent messages skip the queue. Streams and SpokenResponses are forwarded
+    straight away since they are already being spoken.
+    """
+
+    def __init__(self, speak, backlog, max_queue=8, dedupe_window=3.0, rate_limits=None, poll_interval=0.05):
+        self._speak = speak
+        self._backlog = backlog
+        self.max_queue = max_queue
+        self.dedupe_window = dedupe_window
+        self.rate_limits = dict(rate_limits or {})
+        self.poll_interval = poll_interval
+        self._queue = deque()  # (text, source, priority, status)
+        self._sent = {}  # source -> recent send times, for rate limiting
+        self._last_text = None
+        self._last_at = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.forwarded = 0
+        self.dropped = {"duplicate": 0, "superseded": 0, "rate_limited": 0, "overflow": 0}
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="output-arbiter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+
+    @staticmethod
+    def _normalize(text):
+        return " ".join(text.lower().split())
+
+    def submit(self, text, source="response", priority=PRIORITY_NORMAL, status=False):
+        """Queue text for speaking; returns False if it was collapsed or dropped"""
+        already_speaking = not isinstance(text, str) or getattr(text, "stream", None) is not None
+        if already_speaking or priority == PRIORITY_URGENT:
+            with self._cond:
+                self._remember(text)
+            self._forward(text, priority)
+            return True
+        if not text.strip():
+            return False
+        key = self._normalize(text)
+        now = time.monotonic()
+        with self._cond:
+            last = self._normalize(self._queue[-1][0]) if self._queue else self._last_text
+            recent = bool(self._queue) or now - self._last_at <= self.dedupe_window
+            if key == last and recent:
+                self.dropped["duplicate"] += 1
+                return False
+            if not self._allow(source, now):
+                self.dropped["rate_limited"] += 1
+                return False
+            if status:
+                kept = deque(item for item in self._queue if not (item[3] and item[1] == source))
+                self.dropped["superseded"] += len(self._queue) - len(kept)
+                self._queue = kept
+            if len(self._queue) >= self.max_queue:
+                victim = next((item for item in self._queue if item[3]), self._queue[0])
+                self._queue.remove(victim)
+                self.dropped["overflow"] += 1
+            self._queue.append((text, source, priority, status))
+            self._cond.notify()
+        return True
+
+    def _allow(self, source, now):
+        limit = self.rate_limits.get(source)
+        if not limit:
+            return True
+        count, period = limit
+        sent = self._sent.setdefault(source, deque())
+        while sent and now - sent[0] > period:
+            sent.popleft()
+        if len(sent) >= count:
+            return False
+        sent.append(now)
+        return True
+
+    def clear(self):
+        """Drop everything still waiting; returns how many messages were dropped"""
+        with self._cond:
+            dropped = len(self._queue)
+            self._queue.clear()
+            return dropped
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self):
+        with self._cond:
+            return {"queue_depth": len(self._queue), "forwarded": self.forwarded, "dropped": dict(self.dropped)}
+
+    def _remember(self, text):
+        self.forwarded += 1
+        if isinstance(text, str):
+            self._last_text = self._normalize(text)
+            self._last_at = time.monotonic()
+
+    def _forward(self, text, priority):
+        try:
+            self._speak(text, priority)
+        except Exception as e:
+            print(f"Speech error: {e}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running:
+                    return
+            # Hold messages back while the worker has speech queued, so they can
+            # still be collapsed or superseded
+            if self._backlog() > 0:
+                time.sleep(self.poll_interval)
+                continue
+            with self._cond:
+                if not self._queue:
+                    continue
+                text, _, priority, _ = self._queue.popleft()
+                self._remember(text)
+            self._forward(text, priority)
+
+
+def frame_rms(frame):
+    """RMS level of a 16-bit little-endian PCM frame"""
+    samples = array('h')
+    samples.frombytes(frame[:len(frame) - len(frame) % 2])
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(x * x for x in samples) / len(samples))
+
+
+class BargeInDetector:
+    """Energy-based voice activity check for talking over playback.
+
+    The floor is learned from frames heard while Vecna speaks, so its own voice
+    leaking from the speakers raises the bar. Sustained energy `margin` times
+    above it for `min_voiced_ms` fires on_barge_in once per utterance.
+    """
+
+    def __init__(self, on_barge_in, min_threshold=300.0, margin=2.5, min_voiced_ms=200, adapt=0.05):
+        self.on_barge_in = on_barge_in
+        self.min_threshold = min_threshold
+        self.margin = margin
+        self.min_voiced_ms = min_voiced_ms
+        self.adapt = adapt
+        self.noise_floor = None
+        self.triggered = 0
+        self._voiced_ms = 0
+        self._fired = False
+
+    @property
+    def threshold(self):
+        return max(self.min_threshold, (self.noise_floor or 0.0) * self.margin)
+
+    def reset(self):
+        """Call when playback starts or stops"""
+        self._voiced_ms = 0
+        self._fired = False
+
+    def feed(self, frame, frame_ms):
+        """Process one PCM frame captured during playback; returns True if barge-in fired"""
+        level = frame_rms(frame)
+        if self.noise_floor is None:
+            self.noise_floor = level
+        if level > self.threshold:
+            self._voiced_ms += frame_ms
+        else:
+            self._voiced_ms = 0
+            self.noise_floor += self.adapt * (level - self.noise_floor)
+        if self._voiced_ms >= self.min_voiced_ms and not self._fired:
+            self._fired = True
+            self.triggered += 1
+            self.on_barge_in()
+            return True
+        return False
@@ -0,0 +1,1644 @@
+"""
+Vecna Storage - persistence layer for the Vecna memory system
+Provides pluggable backends (JSON snapshot + journal, SQLite) behind
+vecna.Memory and keeps per-turn writes O(1).
+"""
+
+import os
+import re
+import sys
+import gzip
+import mmap
+import json
+import time
+import heapq
+import sqlite3
+import datetime
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from itertools import islice
+
+# Optional: better archive compression when zstandard is installed
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Inter-process file locking: fcntl on POSIX, msvcrt on Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+def atomic_write_json(path, data, indent=None):
+    """Write JSON to path via temp file + rename so readers never see a partial file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def atomic_write_jsonl(path, records):
+    """Write one JSON document per line via temp file + rename"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_jsonl_tail(path, count):
+    """Return the last `count` records of a JSONL file without reading the rest of it"""
+    if count <= 0 or not os.path.exists(path) or os.path.getsize(path) == 0:
+        return []
+    lines = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        end = len(mm)
+        while end > 0 and len(lines) < count:
+            start = mm.rfind(b"\n", 0, end - 1) + 1 if mm[end - 1:end] == b"\n" else mm.rfind(b"\n", 0, end) + 1
+            line = mm[start:end].strip()
+            if line:
+                lines.append(line)
+            end = start
+    return [json.loads(line) for line in reversed(lines)]
+
+
+class FileLock:
+    """Advisory inter-process lock on a sidecar file (fcntl/msvcrt).
+
+    Re-entrant within a process, so nested writes only take the OS lock once.
+    Any other process writing the memory files (a second Vecna instance, a
+    script) should hold it around its writes.
+    """
+
+    def __init__(self, path, timeout=10.0):
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fh = None
+
+    def _try_lock(self):
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except OSError:
+                return False
+        if msvcrt is not None:
+            try:
+                self._fh.seek(0)
+                msvcrt.locking(self._fh.fileno(), msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                return False
+        return True  # no OS locking available; in-process lock only
+
+    def _unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+        elif msvcrt is not None:
+            self._fh.seek(0)
+            msvcrt.locking(self._fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                self._fh = open(self.path, 'a+b')
+                deadline = time.monotonic() + self.timeout
+                while not self._try_lock():
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"Timed out waiting for lock on {self.path}")
+                    time.sleep(0.01)
+            except Exception:
+                if self._fh is not None:
+                    self._fh.close()
+                    self._fh = None
+                self._lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                self._unlock()
+            finally:
+                self._fh.close()
+                self._fh = None
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class ConversationJournal:
+    """Append-only JSONL journal (write-ahead log) sitting next to the memory snapshot.
+
+    Every record carries a monotonically increasing ``seq``. The snapshot stores the
+    last seq it contains, so replaying the journal after a crash never duplicates turns.
+    Several processes may share one journal as long as they hold the store's file lock
+    around append(), read_new() and compact(); read_new() picks up their records.
+    """
+
+    def __init__(self, snapshot_file, compact_every=200, fsync=True):
+        self.snapshot_file = snapshot_file
+        self.journal_file = f"{snapshot_file}.journal"
+        self.rotated_file = f"{snapshot_file}.journal.old"
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.seq = 0
+        self.pending = 0  # records appended since the last compaction
+        self._lock = threading.RLock()
+        self._fh = None
+        self._file_id = None  # inode of the journal file as of our last read or append
+        self._offset = 0      # bytes of it we have seen
+        self._compact_lock = threading.Lock()
+
+    # ----- recovery -----
+    def recover(self, snapshot_seq=0):
+        """Return journal records newer than snapshot_seq, repairing a torn tail"""
+        with self._lock:
+            self.close()
+            self.seq = snapshot_seq
+            records = []
+            for path in (self.rotated_file, self.journal_file):
+                for record in self._read_records(path):
+                    if record.get("seq", 0) > self.seq:
+                        records.append(record)
+                        self.seq = record["seq"]
+            self.pending = len(records)
+            self._mark_seen()
+            return records
+
+    def read_new(self):
+        """Records other processes appended since we last read or wrote the journal.
+
+        Returns None when the file was replaced underneath us (another process
+        compacted it), in which case the caller should recover() from the snapshot.
+        """
+        with self._lock:
+            try:
+                st = os.stat(self.journal_file)
+            except OSError:
+                return [] if self._file_id is None else None
+            if self._file_id is not None and (st.st_ino != self._file_id or st.st_size < self._offset):
+                self.close()
+                return None
+            if st.st_size == self._offset:
+                return []
+            records = [r for r in self._read_records(self.journal_file, self._offset) if r.get("seq", 0) > self.seq]
+            if records:
+                self.seq = records[-1]["seq"]
+                self.pending += len(records)
+            self._mark_seen()
+            return records
+
+    def _mark_seen(self):
+        try:
+            st = os.stat(self.journal_file)
+            self._file_id, self._offset = st.st_ino, st.st_size
+        except OSError:
+            self._file_id, self._offset = None, 0
+
+    def _read_records(self, path, offset=0):
+        if not os.path.exists(path):
+            return []
+        records = []
+        good_offset = offset
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    records.append(json.loads(line.decode('utf-8')))
+                    good_offset += len(line)
+                except (ValueError, UnicodeDecodeError):
+                    # A partial line means we crashed mid-append; everything after it is garbage
+                    print(f"Memory journal: discarding torn record in {path}")
+                    break
+        if good_offset < os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(good_offset)
+        return records
+
+    # ----- appends -----
+    def append(self, op, data, apply=None):
+        """Append one record; O(1) regardless of history size.
+
+        apply, if given, mutates the in-memory state under the same lock so a
+        concurrent compaction never sees the record without its state (or vice versa).
+        """
+        with self._lock:
+            self.seq += 1
+            line = json.dumps({"seq": self.seq, "op": op, "data": data}, ensure_ascii=False)
+            if self._fh is None:
+                self._fh = open(self.journal_file, 'a', encoding='utf-8')
+            self._fh.write(line + "\n")
+            self._fh.flush()
+            if self.fsync:
+                os.fsync(self._fh.fileno())
+            st = os.fstat(self._fh.fileno())
+            self._file_id, self._offset = st.st_ino, st.st_size
+            self.pending += 1
+            if apply is not None:
+                apply()
+            return self.seq
+
+    @property
+    def lock(self):
+        """Lock guarding appends and the state mutated by their apply callbacks"""
+        return self._lock
+
+    def needs_compaction(self):
+        return self.pending >= self.compact_every and not self._compact_lock.locked()
+
+    # ----- compaction -----
+    def compact(self, snapshot_fn, write_fn):
+        """Fold the journal into a fresh snapshot.
+
+        snapshot_fn is called under the journal lock and must return a copy of the
+        memory state; write_fn(snapshot, seq) persists it outside the lock, where seq
+        is the last journal record the snapshot contains.
+        """
+        with self._compact_lock:
+            with self._lock:
+                snapshot = snapshot_fn()
+                seq = self.seq
+                if self._fh is not None:
+                    self._fh.close()
+                    self._fh = None
+                if os.path.exists(self.journal_file):
+                    if os.path.exists(self.rotated_file):
+                        # A previous compaction never finished; keep its records in one file
+                        with open(self.journal_file, 'rb') as src, open(self.rotated_file, 'ab') as dst:
+                            dst.write(src.read())
+                        os.remove(self.journal_file)
+                    else:
+                        os.replace(self.journal_file, self.rotated_file)
+                self._file_id, self._offset = None, 0
+                self.pending = 0
+            try:
+                write_fn(snapshot, seq)
+                if os.path.exists(self.rotated_file):
+                    os.remove(self.rotated_file)
+            except Exception as e:
+                print(f"Memory compaction failed: {e}")
+
+    def sync(self):
+        """fsync appended records; used when appends run with fsync disabled"""
+        with self._lock:
+            if self._fh is not None:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+class WriteBehindFlusher:
+    """Coalesces memory mutations into batched background writes.
+
+    Mutations only mark keys dirty; a single flusher thread calls flush_fn(dirty_keys)
+    every `interval` seconds or as soon as `max_pending` mutations are queued.
+    With enabled=False nothing is written until flush() is called (e.g. at shutdown).
+    The same thread calls poll_fn() every `poll_interval` seconds once start() is called.
+    """
+
+    def __init__(self, flush_fn, interval=2.0, max_pending=50, enabled=True, poll_fn=None, poll_interval=0):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_pending = max_pending
+        self.enabled = enabled
+        self.poll_fn = poll_fn if poll_interval and poll_interval > 0 else None
+        self.poll_interval = poll_interval
+        self._dirty = set()
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self.mutations = 0
+        self.flushes = 0
+        self.writes_avoided = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def mark_dirty(self, key):
+        with self._cond:
+            self._dirty.add(key)
+            self._pending += 1
+            self.mutations += 1
+            if not self.enabled or self._stopping:
+                return
+            self._start_thread()
+            if self._pending >= self.max_pending:
+                self._cond.notify()
+
+    def _start_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="memory-flusher", daemon=True)
+            self._thread.start()
+
+    def start(self):
+        """Start the thread now rather than on the first mutation, so polling runs in read-only processes"""
+        with self._cond:
+            if self.poll_fn is not None and not self._stopping:
+                self._start_thread()
+
+    def _run(self):
+        next_poll = time.monotonic() + self.poll_interval
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                if self._pending < self.max_pending:
+                    timeout = self.interval if self.enabled else None
+                    if self.poll_fn is not None:
+                        until_poll = max(next_poll - time.monotonic(), 0)
+                        timeout = until_poll if timeout is None else min(timeout, until_poll)
+                    self._cond.wait(timeout)
+                if self._stopping:
+                    return
+            if self.enabled:
+                self.flush()
+            if self.poll_fn is not None and time.monotonic() >= next_poll:
+                try:
+                    self.poll_fn()
+                except Exception as e:
+                    print(f"Error polling memory: {e}")
+                next_poll = time.monotonic() + self.poll_interval
+
+    def flush(self):
+        """Write everything that is dirty right now; returns True if a write happened"""
+        with self._flush_lock:
+            with self._cond:
+                if not self._dirty:
+                    return False
+                keys, self._dirty = self._dirty, set()
+                batch, self._pending = self._pending, 0
+            started = time.perf_counter()
+            try:
+                self.flush_fn(keys)
+            except Exception as e:
+                print(f"Error flushing memory: {e}")
+                with self._cond:
+                    self._dirty |= keys
+                    self._pending += batch
+                return False
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.writes_avoided += batch - 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+            return True
+
+    def stop(self):
+        """Stop the flusher thread and write whatever is still dirty"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            queue_depth = self._pending
+            dirty = sorted(self._dirty)
+        return {
+            "auto_save": self.enabled,
+            "mutations": self.mutations,
+            "flushes": self.flushes,
+            "writes_avoided": self.writes_avoided,
+            "queue_depth": queue_depth,
+            "dirty": dirty,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0
+        }
+
+
+# ====== Conversation Search ======
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def format_timestamp(value):
+    """Normalise datetime / epoch / ISO string to the 'YYYY-MM-DD HH:MM:SS' form turns are stored in"""
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, datetime.date):
+        return value.strftime("%Y-%m-%d 00:00:00")
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value).strftime("%Y-%m-%d %H:%M:%S")
+    return str(value).replace("T", " ")[:19]
+
+
+class ConversationIndex:
+    """In-memory inverted index over user_input / assistant_response.
+
+    Turns get sequential doc ids, so dropping the oldest turns is a range
+    delete and postings are pruned lazily once they are mostly stale.
+    """
+
+    def __init__(self):
+        self._postings = {}  # term -> set of doc ids
+        self._docs = {}      # doc id -> turn
+        self._first_id = 0
+        self._next_id = 0
+        self._stale = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, entry):
+        doc_id = self._next_id
+        self._next_id += 1
+        self._docs[doc_id] = entry
+        text = f"{entry.get('user_input', '')} {entry.get('assistant_response', '')}"
+        for term in set(tokenize(text)):
+            self._postings.setdefault(term, set()).add(doc_id)
+        return doc_id
+
+    def drop_oldest(self, count):
+        for doc_id in range(self._first_id, min(self._first_id + count, self._next_id)):
+            if self._docs.pop(doc_id, None) is not None:
+                self._stale += 1
+        self._first_id = min(self._first_id + count, self._next_id)
+        if self._stale > max(len(self._docs), 1000):
+            self._rebuild()
+
+    def _rebuild(self):
+        docs = list(self._docs.values())
+        self.__init__()
+        for entry in docs:
+            self.add(entry)
+
+    def search(self, query="", since=None, until=None, limit=20):
+        """Newest-first turns containing every query term within [since, until]"""
+        since, until = format_timestamp(since), format_timestamp(until)
+        terms = set(tokenize(query))
+        if terms:
+            postings = [self._postings.get(term) for term in terms]
+            if not all(postings):
+                return []
+            postings.sort(key=len)
+            candidates = sorted(postings[0].intersection(*postings[1:]), reverse=True)
+        else:
+            candidates = range(self._next_id - 1, self._first_id - 1, -1)
+
+        results = []
+        for doc_id in candidates:
+            entry = self._docs.get(doc_id)
+            if entry is None:
+                continue
+            timestamp = entry.get("timestamp", "")
+            if until and timestamp > until:
+                continue
+            if since and timestamp < since:
+                if not terms:
+                    break  # docs are in time order, nothing older can match
+                continue
+            results.append(entry)
+            if len(results) >= limit:
+                break
+        return results
+
+
+# ====== Conversation Archive ======
+ARCHIVE_CODECS = {
+    "gzip": (".jsonl.gz", gzip.compress, gzip.decompress),
+}
+if ZSTD_AVAILABLE:
+    ARCHIVE_CODECS["zstd"] = (
+        ".jsonl.zst",
+        lambda data: zstandard.ZstdCompressor(level=10).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+    )
+
+
+def _entry_matches(entry, terms, since, until):
+    timestamp = entry.get("timestamp", "")
+    if (since and timestamp < since) or (until and timestamp > until):
+        return False
+    if not terms:
+        return True
+    return terms.issubset(tokenize(f"{entry.get('user_input', '')} {entry.get('assistant_response', '')}"))
+
+
+class ConversationArchive:
+    """Cold tier for turns evicted from the hot window.
+
+    Evicted turns are appended to pending.jsonl (O(1)); every `segment_size` turns the
+    pending file is compressed into an immutable segment. Each segment has a small
+    sidecar index (time range + term set) so searches only decompress segments that
+    can possibly match. Processes sharing the directory serialize appends through its
+    lock file and re-read what the others archived first, so each turn lands once.
+    """
+
+    def __init__(self, directory, segment_size=1000, codec="gzip"):
+        if codec not in ARCHIVE_CODECS:
+            print(f"Archive codec '{codec}' unavailable, using gzip")
+            codec = "gzip"
+        self.directory = directory
+        self.segment_size = segment_size
+        self.codec = codec
+        self.pending_file = os.path.join(directory, "pending.jsonl")
+        self._lock = threading.RLock()
+        self._fh = None
+        os.makedirs(directory, exist_ok=True)
+        self.file_lock = FileLock(os.path.join(directory, "archive.lock"))
+        with self.file_lock:
+            self._load()
+
+    def _load(self):
+        self.segments = self._load_indexes()
+        self.last_id = self.segments[-1]["last_id"] if self.segments else 0
+        self._pending = [e for e in self._read_pending() if e.get("id", 0) > self.last_id]
+        if self._pending:
+            self.last_id = self._pending[-1].get("id", self.last_id)
+        self._pending_stat = self._stat_pending()
+
+    def _stat_pending(self):
+        try:
+            st = os.stat(self.pending_file)
+            return (st.st_ino, st.st_size, st.st_mtime_ns)
+        except OSError:
+            return None
+
+    def _catch_up(self):
+        """Reload if another process appended or rolled a segment; call with file_lock held"""
+        if self._stat_pending() == self._pending_stat:
+            return
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        self._load()
+
+    def _load_indexes(self):
+        segments = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith("segment-") and name.endswith(".idx.json"):
+                try:
+                    with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                        segments.append(json.load(f))
+                except Exception as e:
+                    print(f"Skipping unreadable archive index {name}: {e}")
+        return segments
+
+    def _read_pending(self):
+        if not os.path.exists(self.pending_file):
+            return []
+        entries = []
+        good_offset = 0
+        with open(self.pending_file, 'rb') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line.decode('utf-8')))
+                    good_offset += len(line)
+                except (ValueError, UnicodeDecodeError):
+                    print(f"Memory archive: discarding torn record in {self.pending_file}")
+                    break  # torn tail from a crash
+        # Cut the torn tail off, or turns appended after it would be lost on the next load
+        if good_offset < os.path.getsize(self.pending_file):
+            with open(self.pending_file, 'r+b') as f:
+                f.truncate(good_offset)
+        return entries
+
+    @property
+    def count(self):
+        return sum(seg["count"] for seg in self.segments) + len(self._pending)
+
+    def append(self, entry):
+        """Archive one evicted turn; turns already archived (by id) are ignored"""
+        with self._lock, self.file_lock:
+            self._catch_up()
+            entry_id = entry.get("id", 0)
+            if entry_id and entry_id <= self.last_id:
+                return
+            if self._fh is None:
+                self._fh = open(self.pending_file, 'a', encoding='utf-8')
+            self._fh.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._fh.flush()
+            self._pending.append(entry)
+            self.last_id = max(self.last_id, entry_id)
+            if len(self._pending) >= self.segment_size:
+                self._roll_segment()
+            self._pending_stat = self._stat_pending()
+
+    def _roll_segment(self):
+        number = (self.segments[-1]["segment"] + 1) if self.segments else 1
+        extension, compress, _ = ARCHIVE_CODECS[self.codec]
+        data_name = f"segment-{number:06d}{extension}"
+        payload = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in self._pending)
+        data_path = os.path.join(self.directory, data_name)
+        with open(f"{data_path}.tmp", 'wb') as f:
+            f.write(compress(payload.encode('utf-8')))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{data_path}.tmp", data_path)
+
+        terms = set()
+        for entry in self._pending:
+            terms.update(tokenize(f"{entry.get('user_input', '')} {entry.get('assistant_response', '')}"))
+        index = {
+            "segment": number,
+            "file": data_name,
+            "codec": self.codec,
+            "count": len(self._pending),
+            "first_id": self._pending[0].get("id", 0),
+            "last_id": self.last_id,
+            "since": min(e.get("timestamp", "") for e in self._pending),
+            "until": max(e.get("timestamp", "") for e in self._pending),
+            "terms": sorted(terms)
+        }
+        # The index is written last: a segment without one is ignored and rewritten
+        atomic_write_json(os.path.join(self.directory, f"segment-{number:06d}.idx.json"), index)
+        self.segments.append(index)
+
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        os.remove(self.pending_file)
+        self._pending = []
+
+    def _read_segment(self, segment):
+        _, _, decompress = ARCHIVE_CODECS[segment.get("codec", "gzip")]
+        with open(os.path.join(self.directory, segment["file"]), 'rb') as f:
+            data = decompress(f.read()).decode('utf-8')
+        return [json.loads(line) for line in data.splitlines() if line]
+
+    def _may_match(self, segment, terms, since, until):
+        if (since and segment["until"] < since) or (until and segment["since"] > until):
+            return False
+        if terms:
+            if "_terms" not in segment:
+                segment["_terms"] = frozenset(segment["terms"])
+            return terms.issubset(segment["_terms"])
+        return True
+
+    def search(self, query="", since=None, until=None, limit=20):
+        """Newest-first matches; only segments whose index admits the query are decompressed"""
+        since, until = format_timestamp(since), format_timestamp(until)
+        terms = set(tokenize(query))
+        with self._lock:
+            pending = list(self._pending)
+            segments = list(self.segments)
+        results = []
+        batches = [pending] + [seg for seg in reversed(segments)]
+        for batch in batches:
+            if isinstance(batch, dict):
+                if not self._may_match(batch, terms, since, until):
+                    continue
+                try:
+                    batch = self._read_segment(batch)
+                except Exception as e:
+                    print(f"Error reading archive segment: {e}")
+                    continue
+            for entry in reversed(batch):
+                if _entry_matches(entry, terms, since, until):
+                    results.append(entry)
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def sync(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+# ====== Memory Backends ======
+class MemoryBackend(ABC):
+    """Base class for Memory storage backends"""
+
+    name = "base"
+
+    def __init__(self, max_conversations=100, archive_dir=None, archive_segment_size=1000,
+                 archive_codec="gzip", auto_save=True, flush_interval=2.0, flush_threshold=50,
+                 refresh_interval=0):
+        self.max_conversations = max_conversations
+        self.archive = None
+        if archive_dir:
+            self.archive = ConversationArchive(archive_dir, archive_segment_size, archive_codec)
+        self.flusher = WriteBehindFlusher(
+            self._write_dirty,
+            interval=flush_interval,
+            max_pending=flush_threshold,
+            enabled=auto_save,
+            # The flusher thread also picks up other processes' writes
+            poll_fn=self.refresh,
+            poll_interval=refresh_interval
+        )
+        # callback(keys) when another process changed the store; set by vecna.Memory
+        self.on_external_change = None
+        self._closed = False
+
+    @abstractmethod
+    def add_conversation(self, entry):
+        """Persist one conversation turn and return it with its id assigned"""
+        pass
+
+    @abstractmethod
+    def recent_conversations(self, limit):
+        """Return the newest `limit` turns, oldest first"""
+        pass
+
+    @abstractmethod
+    def conversation_count(self):
+        pass
+
+    @abstractmethod
+    def _search_hot(self, query, since, until, limit):
+        pass
+
+    def search(self, query="", since=None, until=None, limit=20):
+        """Full-text search over turns, newest first, optionally bounded by timestamp.
+
+        The hot window is searched first; archive segments only when it runs short.
+        """
+        results = self._search_hot(query, since, until, limit)
+        if self.archive is not None and len(results) < limit:
+            results += self.archive.search(query, since, until, limit - len(results))
+        return results
+
+    @abstractmethod
+    def set_preference(self, key, value):
+        pass
+
+    @abstractmethod
+    def get_preferences(self):
+        pass
+
+    @abstractmethod
+    def add_reminder(self, reminder):
+        """Persist a reminder and return it with its id assigned"""
+        pass
+
+    @abstractmethod
+    def pop_due_reminders(self, now):
+        """Return reminders due at or before epoch `now` and mark them completed"""
+        pass
+
+    @abstractmethod
+    def upcoming_reminders(self):
+        """Pending reminders ordered by due time, each with its parsed `due` epoch"""
+        pass
+
+    @abstractmethod
+    def set_custom_command(self, name, action):
+        pass
+
+    @abstractmethod
+    def get_custom_commands(self):
+        pass
+
+    @abstractmethod
+    def _write_dirty(self, keys):
+        """Persist the dirty parts of the store in one write"""
+        pass
+
+    def _mark_dirty(self, key):
+        self.flusher.mark_dirty(key)
+
+    def refresh(self):
+        """Pick up changes written by other processes; returns the changed keys"""
+        return set()
+
+    def _external_change(self, keys):
+        if keys and self.on_external_change is not None:
+            try:
+                self.on_external_change(keys)
+            except Exception as e:
+                print(f"Memory change listener error: {e}")
+
+    def flush(self):
+        """Force everything to disk"""
+        self.flusher.flush()
+
+    def _evict(self, entries):
+        """Move turns that fell out of the hot window to the archive"""
+        if self.archive is None:
+            return
+        for entry in entries:
+            self.archive.append(entry)
+        self._mark_dirty("archive")
+
+    def stats(self):
+        stats = self.flusher.stats()
+        if self.archive is not None:
+            stats["archived_turns"] = self.archive.count
+            stats["archive_segments"] = len(self.archive.segments)
+        return stats
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.flusher.stop()
+        if self.archive is not None:
+            self.archive.close()
+
+
+def reminder_due_time(time_str):
+    """Parse a reminder's ISO timestamp once into an epoch float"""
+    return datetime.datetime.fromisoformat(time_str).timestamp()
+
+
+class JsonMemoryBackend(MemoryBackend):
+    """JSON header + conversation file, with an append-only journal for new turns.
+
+    Startup only reads the small header (preferences, reminders, custom commands)
+    and the journal tail, which compaction keeps bounded. The conversation file is
+    paged in on first use, so startup cost does not grow with history. The hot window
+    is a deque bounded by max_conversations; older turns go to the archive.
+
+    Processes sharing the store take file_lock around journal appends and compaction
+    and first catch up on each other's turns, so every compaction writes all of them.
+    """
+
+    name = "json"
+    LAYOUT = 2
+
+    def __init__(self, memory_file, max_conversations=100, compact_every=200, **options):
+        super().__init__(max_conversations, **options)
+        self.memory_file = memory_file
+        self.conversations_file = f"{os.path.splitext(memory_file)[0]}.conversations.jsonl"
+        # With write-behind on, appends skip fsync and the flusher syncs them in batches
+        self.journal = ConversationJournal(
+            memory_file,
+            compact_every=compact_every,
+            fsync=not self.flusher.enabled
+        )
+        self._lock = threading.RLock()
+        # Held around file writes so out-of-process writers never interleave with ours
+        self.file_lock = FileLock(f"{memory_file}.lock")
+        self._touched = {"preferences": set(), "custom_commands": set()}  # changed since last write
+        self._due = []  # min-heap of (due epoch, reminder id) for pending reminders
+        self.index = ConversationIndex()
+        self._conversations = None     # hot window deque, paged in by _ensure_conversations
+        self._conversations_dirty = False
+        self._journal_turns = []       # turns journaled since the last compaction
+        self._legacy_conversations = None
+        with self.file_lock:
+            # A process appending right now must not have its half-written record repaired away
+            self.memories = self._load()
+            self._header_stat = self._stat_header()
+        if self._legacy_conversations is not None:
+            # Pre-split single-file layout: the turns are already in RAM, and the next
+            # compaction writes them out in the new layout
+            self._ensure_conversations()
+            self._conversations_dirty = True
+            self._mark_dirty("snapshot")
+        self.flusher.start()
+
+    def _empty_memory(self):
+        return {
+            "preferences": {},
+            "reminders": [],
+            "custom_commands": {}
+        }
+
+    def _load(self):
+        memories = self._empty_memory()
+        header = {}
+        try:
+            if os.path.exists(self.memory_file):
+                with open(self.memory_file, 'r', encoding='utf-8') as f:
+                    header = json.load(f)
+        except Exception as e:
+            print(f"Error loading memory: {e}")
+        for key in memories:
+            if key in header:
+                memories[key] = header[key]
+        self._legacy_conversations = header.get("conversations")
+        self._stored_count = header.get("conversation_count", 0)
+        self._snapshot_seq = header.get("journal_seq", 0)  # last journal record in the conversation file
+        next_id = header.get("next_conversation_id", 1)
+
+        # Turns journaled after the last snapshot; compaction keeps this short
+        try:
+            for record in self.journal.recover(header.get("journal_seq", 0)):
+                if record.get("op") == "conversation":
+                    self._journal_turns.append(record["data"])
+        except Exception as e:
+            print(f"Error recovering memory journal: {e}")
+
+        # Ids let the archive recognise turns it already holds after a crash
+        known = (self._legacy_conversations or []) + self._journal_turns
+        next_id = max([next_id] + [c.get("id", 0) + 1 for c in known])
+        for entry in known:
+            if "id" not in entry:
+                entry["id"] = next_id
+                next_id += 1
+        self._next_conversation_id = next_id
+
+        next_reminder_id = max((r.get("id", 0) for r in memories["reminders"]), default=0)
+        for reminder in memories["reminders"]:
+            if "id" not in reminder:
+                next_reminder_id += 1
+                reminder["id"] = next_reminder_id
+            if not reminder.get("completed"):
+                try:
+                    heapq.heappush(self._due, (reminder_due_time(reminder["time"]), reminder["id"]))
+                except (KeyError, TypeError, ValueError) as e:
+                    print(f"Skipping reminder with bad time: {e}")
+        self._next_reminder_id = next_reminder_id + 1
+        return memories
+
+    def _stat_header(self):
+        try:
+            st = os.stat(self.memory_file)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _merge_external(self):
+        """Fold in header changes another process wrote since our last write.
+
+        Keys we changed ourselves since then win; everything else is taken from
+        disk, so two writers no longer overwrite each other's preferences,
+        custom commands or reminders. If the other process also compacted the
+        journal, the conversation state is reloaded from what it wrote.
+        """
+        if self._stat_header() == self._header_stat:
+            return set()
+        try:
+            with open(self.memory_file, 'r', encoding='utf-8') as f:
+                header = json.load(f)
+        except Exception as e:
+            print(f"Error reading memory changed on disk: {e}")
+            return set()
+        changed = set()
+        with self._lock:
+            for key in ("preferences", "custom_commands"):
+                merged = dict(self.memories[key])
+                for name, value in header.get(key, {}).items():
+                    if name not in self._touched[key] and merged.get(name) != value:
+                        merged[name] = value
+                        changed.add(key)
+                if key in changed:
+                    # Swapped in whole: readers may be iterating the old dict on another thread
+                    self.memories[key] = merged
+            known = {(r["text"], r["time"]): r for r in self.memories["reminders"]}
+            for reminder in header.get("reminders", []):
+                local = known.get((reminder.get("text"), reminder.get("time")))
+                if local is None:
+                    try:
+                        due = reminder_due_time(reminder["time"])
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    local = dict(reminder, id=self._next_reminder_id)
+                    self._next_reminder_id += 1
+                    self.memories["reminders"].append(local)
+                    if not local.get("completed"):
+                        heapq.heappush(self._due, (due, local["id"]))
+                    changed.add("reminders")
+                elif reminder.get("completed") and not local.get("completed"):
+                    local["completed"] = True
+                    changed.add("reminders")
+        if header.get("journal_seq", 0) != self._snapshot_seq:
+            self._reload_conversations(header)
+            changed.add("conversations")
+        self._header_stat = self._stat_header()
+        return changed
+
+    def _catch_up(self):
+        """Fold in everything other processes wrote since we last looked.
+
+        Call with file_lock held, so nobody writes while we read; returns the changed keys.
+        """
+        with self.journal.lock:
+            changed = self._merge_external()
+            if "conversations" in changed:
+                return changed
+            records = self.journal.read_new()
+            if records is None:
+                # Compacted by a process that died before writing its header
+                self._reload_conversations()
+                changed.add("conversations")
+                return changed
+            for record in records:
+                if record.get("op") == "conversation":
+                    self._apply_turn(record["data"])
+                    self._next_conversation_id = max(self._next_conversation_id, record["data"]["id"] + 1)
+                    changed.add("conversations")
+            return changed
+
+    def _reload_conversations(self, header=None):
+        """Drop the in-memory window and re-read it from the snapshot and journal on disk"""
+        with self.journal.lock:
+            if header is not None:
+                self._snapshot_seq = header.get("journal_seq", 0)
+                self._stored_count = header.get("conversation_count", 0)
+                self._next_conversation_id = max(self._next_conversation_id, header.get("next_conversation_id", 1))
+            records = self.journal.recover(self._snapshot_seq)
+            self._journal_turns = [r["data"] for r in records if r.get("op") == "conversation"]
+            for turn in self._journal_turns:
+                self._next_conversation_id = max(self._next_conversation_id, turn["id"] + 1)
+            self._conversations = None
+            self._conversations_dirty = False
+            self._legacy_conversations = None
+            self.index = ConversationIndex()
+
+    def refresh(self):
+        with self.file_lock:
+            changed = self._catch_up()
+        self._external_change(changed)
+        return changed
+
+    def _read_conversation_file(self):
+        if not os.path.exists(self.conversations_file):
+            return []
+        conversations = []
+        with open(self.conversations_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    conversations.append(json.loads(line))
+        return conversations
+
+    def _ensure_conversations(self):
+        """Page the hot window into RAM on first use"""
+        with self.journal.lock:
+            if self._conversations is not None:
+                return self._conversations
+            if self._legacy_conversations is not None:
+                stored = self._legacy_conversations
+            else:
+                try:
+                    stored = self._read_conversation_file()
+                except Exception as e:
+                    print(f"Error loading conversations: {e}")
+                    stored = []
+            last_stored = stored[-1]["id"] if stored else 0
+            # After a crash mid-compaction the journal can repeat stored turns
+            turns = stored + [t for t in self._journal_turns if t["id"] > last_stored]
+            excess = max(len(turns) - self.max_conversations, 0)
+            self._evict(turns[:excess])
+            self._conversations = deque(turns[excess:], maxlen=self.max_conversations)
+            for entry in self._conversations:
+                self.index.add(entry)
+            if self._journal_turns or excess:
+                self._conversations_dirty = True
+            self._journal_turns = []
+            self._legacy_conversations = None
+            return self._conversations
+
+    def _snapshot(self, with_conversations=True):
+        with self._lock:
+            header = {
+                "layout": self.LAYOUT,
+                "preferences": dict(self.memories["preferences"]),
+                "reminders": [dict(r) for r in self.memories["reminders"]],
+                "custom_commands": dict(self.memories["custom_commands"])
+            }
+        conversations = None
+        if with_conversations and (self._journal_turns or self._conversations_dirty):
+            conversations = list(self._ensure_conversations())
+            self._conversations_dirty = False
+            self._stored_count = len(conversations)
+        header["conversation_count"] = self._stored_count
+        header["next_conversation_id"] = self._next_conversation_id
+        return {"header": header, "conversations": conversations}
+
+    def _write_snapshot(self, snapshot, seq):
+        changed = set()
+        try:
+            with self.file_lock:
+                changed = self._catch_up()
+                header = snapshot["header"]
+                with self._lock:
+                    # Catching up may have moved these if another process compacted
+                    header.update(conversation_count=self._stored_count,
+                                  next_conversation_id=self._next_conversation_id)
+                    if changed:
+                        header.update(
+                            preferences=dict(self.memories["preferences"]),
+                            reminders=[dict(r) for r in self.memories["reminders"]],
+                            custom_commands=dict(self.memories["custom_commands"])
+                        )
+                    for touched in self._touched.values():
+                        touched.clear()
+                # Conversations first: if we crash before the header, the journal replays
+                # turns the file already has and _ensure_conversations skips them by id
+                if snapshot["conversations"] is not None:
+                    atomic_write_jsonl(self.conversations_file, snapshot["conversations"])
+                    self._snapshot_seq = seq
+                atomic_write_json(self.memory_file, dict(header, journal_seq=self._snapshot_seq), indent=4)
+                self._header_stat = self._stat_header()
+        except Exception:
+            if snapshot["conversations"] is not None:
+                self._conversations_dirty = True
+            raise
+        self._external_change(changed)
+
+    def _apply_turn(self, entry):
+        """Add a journaled turn to the window; call with the journal lock held"""
+        conversations = self._conversations
+        if conversations is None:
+            if self._stored_count + len(self._journal_turns) < self.max_conversations:
+                # Not paged in yet: the turn is folded in when the window loads
+                self._journal_turns.append(entry)
+                return
+            # The window is about to overflow, so eviction needs it in RAM
+            conversations = self._ensure_conversations()
+        if len(conversations) == conversations.maxlen:
+            self._evict([conversations[0]])
+            self.index.drop_oldest(1)
+        conversations.append(entry)
+        self.index.add(entry)
+        self._conversations_dirty = True
+
+    def add_conversation(self, entry):
+        with self.file_lock, self.journal.lock:
+            # Other processes' turns first, so ids and seqs stay unique across the store
+            changed = self._catch_up()
+            entry = dict(entry, id=self._next_conversation_id)
+            self._next_conversation_id += 1
+            try:
+                self.journal.append("conversation", entry, apply=lambda: self._apply_turn(entry))
+            except Exception as e:
+                print(f"Error journaling conversation: {e}")
+                self._apply_turn(entry)
+        self._external_change(changed)
+        self._mark_dirty("conversations")
+        if self.journal.needs_compaction():
+            if self.flusher.enabled:
+                self._mark_dirty("snapshot")
+            else:
+                threading.Thread(target=self._compact, daemon=True).start()
+        return entry
+
+    def _compact(self):
+        """Fold the journal into the conversation file, with every process's turns in it"""
+        with self.file_lock:
+            with self.journal.lock:
+                changed = self._catch_up()
+            self.journal.compact(self._snapshot, self._write_snapshot)
+        self._external_change(changed)
+
+    def recent_conversations(self, limit):
+        limit = max(limit, 0)
+        with self.journal.lock:
+            if self._conversations is not None:
+                recent = list(islice(reversed(self._conversations), limit))
+                recent.reverse()
+                return recent
+            # Serve from the journal and the tail of the conversation file without paging it all in
+            recent = self._journal_turns[-limit:] if limit else []
+            missing = limit - len(recent)
+            if missing > 0:
+                first_id = recent[0]["id"] if recent else float("inf")
+                try:
+                    older = read_jsonl_tail(self.conversations_file, missing + len(self._journal_turns))
+                except Exception as e:
+                    print(f"Error reading conversations: {e}")
+                    older = []
+                older = [t for t in older if t.get("id", 0) < first_id]
+                recent = older[-missing:] + recent
+            return recent
+
+    def conversation_count(self):
+        with self.journal.lock:
+            if self._conversations is not None:
+                return len(self._conversations)
+            return min(self._stored_count + len(self._journal_turns), self.max_conversations)
+
+    def _search_hot(self, query, since, until, limit):
+        with self.journal.lock:
+            self._ensure_conversations()
+            return self.index.search(query, since, until, limit)
+
+    def set_preference(self, key, value):
+        with self._lock:
+            # Copy-on-write, so a dict returned by get_preferences() never changes under its reader
+            self.memories["preferences"] = {**self.memories["preferences"], key: value}
+            self._touched["preferences"].add(key)
+        self._mark_dirty("preferences")
+
+    def get_preferences(self):
+        """A snapshot that is replaced, never mutated, when preferences change"""
+        return self.memories["preferences"]
+
+    def add_reminder(self, reminder):
+        due = reminder_due_time(reminder["time"])
+        with self._lock:
+            reminder = dict(reminder, id=self._next_reminder_id)
+            self._next_reminder_id += 1
+            self.memories["reminders"].append(reminder)
+            heapq.heappush(self._due, (due, reminder["id"]))
+        self._mark_dirty("reminders")
+        return reminder
+
+    def pop_due_reminders(self, now):
+        with self._lock:
+            due_ids = set()
+            while self._due and self._due[0][0] <= now:
+                due_ids.add(heapq.heappop(self._due)[1])
+            if not due_ids:
+                return []
+            pending = []
+            for reminder in self.memories["reminders"]:
+                if reminder["id"] in due_ids and not reminder["completed"]:
+                    reminder["completed"] = True
+                    pending.append(reminder)
+        self._mark_dirty("reminders")
+        return pending
+
+    def upcoming_reminders(self):
+        with self._lock:
+            by_id = {r["id"]: r for r in self.memories["reminders"] if not r.get("completed")}
+            return [dict(by_id[rid], due=due) for due, rid in sorted(self._due) if rid in by_id]
+
+    def set_custom_command(self, name, action):
+        with self._lock:
+            self.memories["custom_commands"] = {**self.memories["custom_commands"], name: action}
+            self._touched["custom_commands"].add(name)
+        self._mark_dirty("custom_commands")
+
+    def get_custom_commands(self):
+        """A snapshot that is replaced, never mutated, when commands change"""
+        return self.memories["custom_commands"]
+
+    def _write_dirty(self, keys):
+        # Evicted turns must be durable in the archive before a snapshot drops them
+        if self.archive is not None:
+            self.archive.sync()
+        # New turns are already in the journal and just need syncing
+        self.journal.sync()
+        if "snapshot" in keys:
+            # The journal is long enough to fold into the conversation file
+            self._compact()
+        elif keys - {"conversations", "archive"}:
+            # Preferences, reminders or custom commands: the small header is all that changed
+            self._write_snapshot(self._snapshot(with_conversations=False), self._snapshot_seq)
+
+    def close(self):
+        super().close()
+        self.journal.close()
+
+
+class SQLiteMemoryBackend(MemoryBackend):
+    """SQLite storage with indexes on reminder due time, turn timestamp and command name"""
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            user_input TEXT,
+            assistant_response TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_conversations_timestamp ON conversations(timestamp);
+        CREATE TABLE IF NOT EXISTS preferences (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            time TEXT NOT NULL,
+            due REAL NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(completed, due);
+        CREATE TABLE IF NOT EXISTS custom_commands (
+            name TEXT PRIMARY KEY,
+            action TEXT
+        );
+    """
+
+    # External-content FTS5 table kept in sync with conversations by triggers
+    FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE conversations_fts USING fts5(
+            user_input, assistant_response,
+            content='conversations', content_rowid='id'
+        );
+        CREATE TRIGGER conversations_fts_insert AFTER INSERT ON conversations BEGIN
+            INSERT INTO conversations_fts(rowid, user_input, assistant_response)
+            VALUES (new.id, new.user_input, new.assistant_response);
+        END;
+        CREATE TRIGGER conversations_fts_delete AFTER DELETE ON conversations BEGIN
+            INSERT INTO conversations_fts(conversations_fts, rowid, user_input, assistant_response)
+            VALUES ('delete', old.id, old.user_input, old.assistant_response);
+        END;
+        INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild');
+    """
+
+    def __init__(self, db_file, max_conversations=100, legacy_json=None, **options):
+        super().__init__(max_conversations, **options)
+        self.db_file = db_file
+        self._lock = threading.RLock()
+        # SQLite does its own inter-process locking; wait for other writers instead of failing
+        self.conn = sqlite3.connect(db_file, timeout=10, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self.fts_enabled = self._ensure_fts()
+        # Until its first compaction a JSON store can be nothing but a journal
+        if legacy_json and self._is_empty() and (
+                os.path.exists(legacy_json) or os.path.exists(f"{legacy_json}.journal")):
+            self._import_json(legacy_json)
+        # Small tables are cached so command routing never touches the database
+        self._load_caches()
+        self._min_id = self.conn.execute("SELECT COALESCE(MIN(id), 1) FROM conversations").fetchone()[0]
+        self.flusher.start()
+
+    def _load_caches(self):
+        self._preferences = {
+            row["key"]: json.loads(row["value"])
+            for row in self.conn.execute("SELECT key, value FROM preferences")
+        }
+        self._custom_commands = {
+            row["name"]: row["action"]
+            for row in self.conn.execute("SELECT name, action FROM custom_commands")
+        }
+        # data_version only changes when another connection commits
+        self._data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def refresh(self):
+        with self._lock:
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return set()
+            old = (dict(self._preferences), dict(self._custom_commands))
+            self._load_caches()
+            changed = {"reminders"}
+            if old[0] != self._preferences:
+                changed.add("preferences")
+            if old[1] != self._custom_commands:
+                changed.add("custom_commands")
+        self._external_change(changed)
+        return changed
+
+    def _ensure_fts(self):
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations_fts'"
+        ).fetchone()
+        if exists:
+            return True
+        try:
+            self.conn.executescript(self.FTS_SCHEMA)
+            return True
+        except sqlite3.OperationalError as e:
+            # Some SQLite builds ship without FTS5; fall back to LIKE scans
+            print(f"FTS5 unavailable, history search will be slower: {e}")
+            return False
+
+    def _is_empty(self):
+        for table in ("conversations", "preferences", "reminders", "custom_commands"):
+            if self.conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                return False
+        return True
+
+    def _import_json(self, legacy_json):
+        """One-time migration from the JSON memory file"""
+        # Unbounded window so every turn in the file comes across, not just the newest
+        legacy = JsonMemoryBackend(legacy_json, max_conversations=sys.maxsize, auto_save=False)
+        memories = legacy.memories
+        conversations = list(legacy._ensure_conversations())
+        excess = max(len(conversations) - self.max_conversations, 0)
+        self._evict(conversations[:excess])
+        conversations = conversations[excess:]
+        with self._lock, self.conn:
+            # Keep the JSON ids so a shared archive keeps recognising archived turns
+            self.conn.executemany(
+                "INSERT INTO conversations (id, timestamp, user_input, assistant_response) VALUES (?, ?, ?, ?)",
+                [(c.get("id"), c.get("timestamp", ""), c.get("user_input"), c.get("assistant_response"))
+                 for c in conversations]
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO preferences (key, value) VALUES (?, ?)",
+                [(k, json.dumps(v)) for k, v in memories["preferences"].items()]
+            )
+            for reminder in memories["reminders"]:
+                try:
+                    due = reminder_due_time(reminder["time"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                self.conn.execute(
+                    "INSERT INTO reminders (text, time, due, completed) VALUES (?, ?, ?, ?)",
+                    (reminder["text"], reminder["time"], due, int(bool(reminder.get("completed"))))
+                )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO custom_commands (name, action) VALUES (?, ?)",
+                list(memories["custom_commands"].items())
+            )
+        legacy.journal.close()
+        print(f"Imported memory from {legacy_json} into {self.db_file}")
+
+    def add_conversation(self, entry):
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT INTO conversations (timestamp, user_input, assistant_response) VALUES (?, ?, ?)",
+                (entry["timestamp"], entry["user_input"], entry["assistant_response"])
+            )
+            # Retention: ids are monotonic, so the hot window is an indexed id range
+            cutoff = cur.lastrowid - self.max_conversations
+            if cutoff >= self._min_id:
+                evicted = self.conn.execute(
+                    "SELECT id, timestamp, user_input, assistant_response FROM conversations "
+                    "WHERE id <= ? ORDER BY id",
+                    (cutoff,)
+                ).fetchall()
+                self._evict([dict(row) for row in evicted])
+                self.conn.execute("DELETE FROM conversations WHERE id <= ?", (cutoff,))
+                self._min_id = cutoff + 1
+        self._mark_dirty("conversations")
+        return dict(entry, id=cur.lastrowid)
+
+    def recent_conversations(self, limit):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, timestamp, user_input, assistant_response FROM conversations "
+                "ORDER BY id DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def conversation_count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def _search_hot(self, query, since, until, limit):
+        terms = tokenize(query)
+        clauses, params = [], []
+        if terms and self.fts_enabled:
+            source = "conversations_fts f JOIN conversations c ON c.id = f.rowid"
+            clauses.append("conversations_fts MATCH ?")
+            params.append(" ".join(f'"{term}"' for term in terms))
+        else:
+            source = "conversations c"
+            for term in terms:
+                clauses.append("(c.user_input LIKE ? OR c.assistant_response LIKE ?)")
+                params.extend([f"%{term}%"] * 2)
+        if since is not None:
+            clauses.append("c.timestamp >= ?")
+            params.append(format_timestamp(since))
+        if until is not None:
+            clauses.append("c.timestamp <= ?")
+            params.append(format_timestamp(until))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT c.id, c.timestamp, c.user_input, c.assistant_response FROM {source} {where} "
+                "ORDER BY c.id DESC LIMIT ?",
+                params
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def set_preference(self, key, value):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO preferences (key, value) VALUES (?, ?)",
+                (key, json.dumps(value))
+            )
+            # Copy-on-write, like _load_caches, so readers never see the dict change
+            self._preferences = {**self._preferences, key: value}
+        self._mark_dirty("preferences")
+
+    def get_preferences(self):
+        return self._preferences
+
+    def add_reminder(self, reminder):
+        due = reminder_due_time(reminder["time"])
+        with self._lock:
+            cur = self.conn.execute(
+                "INSERT INTO reminders (text, time, due, completed) VALUES (?, ?, ?, ?)",
+                (reminder["text"], reminder["time"], due, int(bool(reminder.get("completed"))))
+            )
+        self._mark_dirty("reminders")
+        return dict(reminder, id=cur.lastrowid)
+
+    def pop_due_reminders(self, now):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, text, time FROM reminders WHERE completed = 0 AND due <= ? ORDER BY due",
+                (now,)
+            ).fetchall()
+            if rows:
+                self.conn.executemany(
+                    "UPDATE reminders SET completed = 1 WHERE id = ?",
+                    [(row["id"],) for row in rows]
+                )
+        if rows:
+            self._mark_dirty("reminders")
+        return [dict(row, completed=True) for row in rows]
+
+    def upcoming_reminders(self):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, text, time, due FROM reminders WHERE completed = 0 ORDER BY due"
+            ).fetchall()
+        return [dict(row, completed=False) for row in rows]
+
+    def set_custom_command(self, name, action):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO custom_commands (name, action) VALUES (?, ?)",
+                (name, action)
+            )
+            self._custom_commands = {**self._custom_commands, name: action}
+        self._mark_dirty("custom_commands")
+
+    def get_custom_commands(self):
+        return self._custom_commands
+
+    def _write_dirty(self, keys):
+        # Evicted rows must be durable in the archive before their delete commits
+        if self.archive is not None:
+            self.archive.sync()
+        # Everything since the last flush lands in one transaction
+        with self._lock:
+            self.conn.commit()
+
+    def close(self):
+        super().close()
+        with self._lock:
+            self.conn.close()
+
+
+MEMORY_BACKENDS = {
+    JsonMemoryBackend.name: JsonMemoryBackend,
+    SQLiteMemoryBackend.name: SQLiteMemoryBackend,
+}
+
+
+def create_memory_backend(kind, memory_file, db_file=None, max_conversations=100, **options):
+    """Build the backend selected by config.json's memory.backend.
+
+    options accepts archive_segment_size, archive_codec, auto_save, flush_interval,
+    flush_threshold and refresh_interval. Pass archive_dir=None to drop evicted turns instead of archiving.
+    """
+    kind = (kind or "json").lower()
+    if kind not in MEMORY_BACKENDS:
+        print(f"Unknown memory backend '{kind}', falling back to json")
+        kind = "json"
+    options.setdefault("archive_dir", f"{os.path.splitext(memory_file)[0]}_archive")
+    if kind == "sqlite":
+        db_file = db_file or f"{os.path.splitext(memory_file)[0]}.db"
+        return SQLiteMemoryBackend(
+            db_file,
+            max_conversations=max_conversations,
+            legacy_json=memory_file,
+            **options
+        )
+    return JsonMemoryBackend(memory_file, max_conversations=max_conversations, **options)
+
+
+def read_custom_commands(kind, memory_file, db_file=None):
+    """The store's custom commands, read without opening a backend.
+
+    No locks, journal recovery, flusher threads or SQLite import: tools such as
+    the ASR benchmark can look at the live store without changing it. A SQLite
+    store that has not been created yet still has its commands in the JSON file.
+    """
+    if (kind or "json").lower() == "sqlite":
+        db_file = db_file or f"{os.path.splitext(memory_file)[0]}.db"
+        if os.path.exists(db_file):
+            uri = f"file:{os.path.abspath(db_file)}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True)
+            try:
+                return dict(conn.execute("SELECT name, action FROM custom_commands"))
+            finally:
+                conn.close()
+    if not os.path.exists(memory_file):
+        return {}
+    with open(memory_file, 'r', encoding='utf-8') as f:
+        return dict(json.load(f).get("custom_commands", {}))